@@ -0,0 +1,155 @@
+from cnf_cache import load_cache, write_cache
+from feal import *
+import feal_ref
+from testvec import bits_to_bytes, dot
+from collections import Counter
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+'''
+Parallel guess-and-determine known plaintext attack on FEAL_NX
+
+The key space is split by fixing k key bits (the guess bits): each of the 2^k assignments (a cube)
+is one sub-instance, solved as solver assumptions on top of the known plaintext/ciphertext pairs.
+The CNF is built once (FEAL_NX.setup_multi, one shared key schedule for all pairs) and written to a
+cnf_cache.py file that every worker memory maps, so the workers share its pages and keep one warm solver each.
+The first cube that is satisfiable gives a key consistent with every pair, and the remaining work is cancelled.
+Unsatisfiable cubes prove that no key with those guess bits fits the pairs.
+
+By default the guess bits are the key variables that occur in the most clauses (choose_guess_bits).
+'''
+
+'''
+Number of occurrences of each of variables in the clauses and XOR constraints of cnf (a ClauseView)
+'''
+def occurrence_counts(cnf, variables):
+  counts = Counter(map(abs, cnf.buffer()))
+  if cnf.xors is not None:
+    counts.update(map(abs, cnf.xors.buffer()))
+  return {v : counts[v] for v in variables}
+
+'''
+The k variables of key_vars with the most occurrences in cnf (ties in key_vars order)
+'''
+def choose_guess_bits(cnf, key_vars, k):
+  counts = occurrence_counts(cnf, key_vars)
+  return sorted(key_vars, key = lambda v: -counts[v])[:k]
+
+'''
+Every assignment of guess_vars, as lists of literals
+'''
+def cubes(guess_vars):
+  k = len(guess_vars)
+  return [dot([(i >> (k-1-j)) & 1 for j in range(k)], guess_vars) for i in range(1 << k)]
+
+#
+# Workers: each process maps the CNF file once and keeps one solver with it
+#
+worker = dict()
+
+def init_worker(fname, options, assumptions, key_vars):
+  nfv, res = load_cache(fname, options)
+  s = Solver()
+  add_to_solver(s, res.cnf)
+  worker["solver"] = s
+  worker["assumptions"] = assumptions
+  worker["key_vars"] = key_vars
+
+'''
+Solve one cube. Returns (cube, seconds, key bits or None)
+'''
+def solve_cube(cube):
+  start = time.time()
+  sat, soln = worker["solver"].solve(worker["assumptions"] + cube)
+  key_bits = [1 if soln[v] else 0 for v in worker["key_vars"]] if sat else None
+  return cube, time.time() - start, key_bits
+
+def run_cubes(todo, num_workers, initargs):
+  if num_workers == 1:
+    init_worker(*initargs)
+    for cube in todo:
+      yield solve_cube(cube)
+    return
+  # Leaving the with block terminates the pool, which cancels the cubes still running
+  with multiprocessing.Pool(num_workers, initializer = init_worker, initargs = initargs) as pool:
+    for result in pool.imap_unordered(solve_cube, todo):
+      yield result
+
+'''
+Print one progress line (the default progress callback)
+'''
+def print_progress(stats):
+  print("cubes {0}/{1} ({2} unsat), {3:.1f} s, {4:.2f} cubes/s, {5:.3f} s/cube".format(
+        stats["cubes_done"], stats["cubes"], stats["cubes_unsat"], stats["seconds"],
+        stats["cubes_per_s"], stats["solve_s"] / max(1, stats["cubes_done"])))
+
+'''
+Recover a FEAL_NX(N) key from known (plaintext, ciphertext) pairs (8 byte blocks)
+k guess bits (chosen by occurrence count unless guess_vars, a list of key variables 1..128, is given),
+2^k cubes spread over num_workers processes; options are the ClauseStore options.
+progress(stats) is called after every cube (None = quiet)
+Returns stats: key (16 bytes, or None if every cube is unsatisfiable), cube (its guess literals),
+cubes_done, cubes_unsat, cubes, seconds (wall), solve_s (summed over the workers), cubes_per_s
+'''
+def attack(N, pairs, k = 8, guess_vars = None, num_workers = 1, options = {}, progress = None):
+  start = time.time()
+  store = ClauseStore(**options)
+  nfv, res, pair_res = FEAL_NX(N).setup_multi(len(pairs), store)
+  key_vars = res.in_vars[:128]
+  assumptions = pair_assumptions(pairs, pair_res)
+  if guess_vars is None:
+    guess_vars = choose_guess_bits(store.view(), key_vars, k)
+  todo = cubes(guess_vars)
+
+  stats = dict(key = None, cube = None, cubes_done = 0, cubes_unsat = 0, cubes = len(todo),
+               seconds = 0.0, solve_s = 0.0, cubes_per_s = 0.0)
+  cache_dir = tempfile.mkdtemp()
+  try:
+    fname = os.path.join(cache_dir, "attack.bin")
+    write_cache(fname, nfv, res, store)
+    initargs = (fname, store.options(), assumptions, key_vars)
+    for cube, seconds, key_bits in run_cubes(todo, num_workers, initargs):
+      stats["cubes_done"] += 1
+      stats["solve_s"] += seconds
+      stats["seconds"] = time.time() - start
+      stats["cubes_per_s"] = stats["cubes_done"] / stats["seconds"]
+      if key_bits is None:
+        stats["cubes_unsat"] += 1
+      else:
+        stats["key"] = bits_to_bytes(key_bits)
+        stats["cube"] = cube
+      if progress is not None:
+        progress(stats)
+      if key_bits is not None:
+        break
+  finally:
+    shutil.rmtree(cache_dir)
+  if stats["key"] is not None:
+    assert(feal_ref.encrypt(N, stats["key"], [pt for pt, ct in pairs]) == [ct for pt, ct in pairs])
+  return stats
+
+if __name__ == "__main__":
+  if len(sys.argv) != 5:
+    print("Usage: python3 attack.py <N> <num_pairs> <k> <num_workers>")
+    print("Attacks FEAL_NX(N) under a random key with num_pairs random known plaintexts, guessing k key bits")
+    print("num_workers : Number of worker processes, 0 = one per CPU")
+    print("e.g. python3 attack.py 2 2 4 0")
+    exit()
+
+  N = int(sys.argv[1])
+  num_pairs = int(sys.argv[2])
+  k = int(sys.argv[3])
+  num_workers = int(sys.argv[4])
+  key = os.urandom(16)
+  pairs = feal_ref.random_pairs(N, key, num_pairs)
+  print("FEAL_NX({0}), key {1}, {2} known plaintexts, {3} guess bits".format(N, key.hex().upper(), num_pairs, k))
+  stats = attack(N, pairs, k, num_workers = num_workers if num_workers > 0 else os.cpu_count(), progress = print_progress)
+  if stats["key"] is None:
+    print("No key fits the pairs")
+  else:
+    print("Found key {0}{1}".format(stats["key"].hex().upper(),
+                                     "" if stats["key"] == key else " (another key consistent with the pairs)"))
@@ -0,0 +1,167 @@
+from feal import *
+from testvec import dot
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+'''
+FEAL_NX benchmark: CNF size, build time and memory, simulation and key recovery solve times
+for every encoding over a list of N
+
+Results are written as JSON (a dict "N=<N> <encoding>" -> figures) and can be compared against a stored
+baseline (bench_feal_baseline.json holds one for the default sweep): a figure that is worse than the baseline
+by more than its threshold (relative tolerance, absolute slack) is a regression, and the run fails.
+By default only the CNF sizes are checked (SIZE_THRESHOLDS): they are deterministic, so any growth fails.
+Times and memory depend on the machine (the stored baseline comes from a single CPU one), so checking them
+against RESOURCE_THRESHOLDS, which only allow for noise on the same machine, is opt-in.
+Key recovery (solve for a key from one known plaintext pair) is only timed up to ATTACK_MAX_N rounds,
+since it gets out of reach quickly (FEAL_NX(4) already takes minutes).
+'''
+
+#
+# Encodings to compare, as ClauseStore options
+#
+ENCODINGS = [(adder, dict(adder = adder)) for adder in ADDER_ENCODINGS] + \
+            [(adder + "+xor+alias", dict(adder = adder, xor = True, alias = True)) for adder in ADDER_ENCODINGS] + \
+            [("tseitin+strash", dict(strash = True))]
+
+ATTACK_MAX_N = 2
+
+# metric -> (relative tolerance, absolute slack)
+SIZE_THRESHOLDS = {"vars" : (0, 0),
+                   "clauses" : (0, 0),
+                   "xors" : (0, 0),
+                   "literals" : (0, 0)}
+RESOURCE_THRESHOLDS = {"peak_bytes" : (0.5, 0),
+                       "build_s" : (2.0, 0),
+                       "sim_s" : (2.0, 0),
+                       "kpa_s" : (2.0, 0)}
+
+def random_bits(n):
+  return [random.randint(0, 1) for i in range(n)]
+
+def build(N, options):
+  store = ClauseStore(**options)
+  nfv, res = FEAL_NX(N).setup(store)
+  if store.xor:
+    store.chain_xors(res.in_vars + res.out_vars)
+  return nfv, res, store
+
+'''
+Build FEAL_NX(N) with the given ClauseStore options (timed, then once more under tracemalloc for the peak memory),
+then time
+* num_vectors simulations (random key and plaintext, solve for the ciphertext)
+* num_attacks known plaintext attacks (plaintext and ciphertext given, solve for a key), None if num_attacks = 0
+'''
+def bench_encoding(N, options, num_vectors, num_attacks):
+  start = time.time()
+  nfv, res, store = build(N, options)
+  build_time = time.time() - start
+  tracemalloc.start()
+  build(N, options)
+  peak_bytes = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  s = Solver()
+  add_to_solver(s, store.view())
+
+  pairs = []
+  start = time.time()
+  for i in range(max(num_vectors, num_attacks)):
+    plaintext = random_bits(64)
+    sat, soln = s.solve(dot(random_bits(128), res.in_vars[:128]) + dot(plaintext, res.in_vars[128:]))
+    assert(sat)
+    pairs.append((plaintext, [1 if lit_value(soln, x) else 0 for x in res.out_vars]))
+  sim_time = (time.time() - start) / max(1, len(pairs))
+
+  start = time.time()
+  for plaintext, ciphertext in pairs[:num_attacks]:
+    sat, soln = s.solve(dot(plaintext, res.in_vars[128:]) + dot(ciphertext, res.out_vars))
+    assert(sat)
+  kpa_time = (time.time() - start) / num_attacks if num_attacks > 0 else None
+
+  return {"vars" : nfv - 1,
+          "clauses" : len(store),
+          "xors" : store.num_xors(),
+          "literals" : store.num_literals() + store.xors.num_literals(),
+          "peak_bytes" : peak_bytes,
+          "build_s" : build_time,
+          "sim_s" : sim_time,
+          "kpa_s" : kpa_time}
+
+def format_figure(x):
+  if x is None:
+    return "-"
+  return x if isinstance(x, int) else "%.4f" % x
+
+'''
+Every encoding on every N in Ns. Returns dict "N=<N> <encoding>" -> figures
+'''
+def sweep(Ns, num_vectors, num_attacks, encodings = ENCODINGS, attack_max_N = ATTACK_MAX_N, verbose = True):
+  random.seed(0)
+  cols = ["vars", "clauses", "xors", "literals", "peak_bytes", "build_s", "sim_s", "kpa_s"]
+  results = dict()
+  for N in Ns:
+    attacks = num_attacks if N <= attack_max_N else 0
+    if verbose:
+      print("FEAL_NX({0}), {1} simulations, {2} known plaintext attacks per encoding".format(N, num_vectors, attacks))
+      print("{0:<22}".format("encoding") + "".join("{0:>11}".format(c) for c in cols))
+    for name, options in encodings:
+      row = bench_encoding(N, options, num_vectors, attacks)
+      results["N={0} {1}".format(N, name)] = row
+      if verbose:
+        print("{0:<22}".format(name) + "".join("{0:>11}".format(format_figure(row[c])) for c in cols))
+  return results
+
+'''
+Regressions of results against baseline (both as returned by sweep), as readable strings
+Only the metrics in thresholds are checked, e.g. dict(SIZE_THRESHOLDS, **RESOURCE_THRESHOLDS) for all of them.
+Entries or figures missing on either side are skipped.
+'''
+def compare(results, baseline, thresholds = SIZE_THRESHOLDS):
+  regressions = []
+  for key, row in results.items():
+    if key not in baseline:
+      continue
+    for metric, (rel, slack) in thresholds.items():
+      new = row.get(metric)
+      old = baseline[key].get(metric)
+      if new is None or old is None:
+        continue
+      if new > old * (1 + rel) + slack:
+        regressions.append("{0} {1}: {2} -> {3} (limit {4})".format(key, metric, format_figure(old),
+                                                                    format_figure(new), format_figure(old * (1 + rel) + slack)))
+  return regressions
+
+def write_results(fname, results):
+  with open(fname, 'w') as f:
+    json.dump(results, f, indent = 1, sort_keys = True)
+
+def load_results(fname):
+  with open(fname) as f:
+    return json.load(f)
+
+if __name__ == "__main__":
+  if len(sys.argv) < 4 or len(sys.argv) > 7:
+    print("Usage: python3 bench_feal.py <N[,N...]> <num_vectors> <num_attacks> [<results.json> [<baseline.json> [<check_resources>]]]")
+    print("num_attacks     : known plaintext attacks per encoding, for N <= {0} only".format(ATTACK_MAX_N))
+    print("results         : write the figures to this file")
+    print("baseline        : compare the CNF sizes against this file, exit code 1 on a regression")
+    print("check_resources : 1 = also compare times and peak memory (only meaningful on the baseline's machine)")
+    print("e.g. python3 bench_feal.py 32 200 0 or python3 bench_feal.py 2,4,8,16,32 5 3 out.json bench_feal_baseline.json")
+    exit()
+
+  Ns = [int(N) for N in sys.argv[1].split(",")]
+  results = sweep(Ns, int(sys.argv[2]), int(sys.argv[3]))
+  if len(sys.argv) > 4:
+    write_results(sys.argv[4], results)
+  if len(sys.argv) > 5:
+    check_resources = len(sys.argv) > 6 and sys.argv[6] == "1"
+    thresholds = dict(SIZE_THRESHOLDS, **RESOURCE_THRESHOLDS) if check_resources else SIZE_THRESHOLDS
+    regressions = compare(results, load_results(sys.argv[5]), thresholds)
+    for line in regressions:
+      print("REGRESSION " + line)
+    if len(regressions) > 0:
+      sys.exit(1)
+    print("No regressions against " + sys.argv[5])
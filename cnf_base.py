@@ -1,7 +1,363 @@
+from array import array
+from operator import itemgetter
+
+from dimacs import CallbackSink, as_sink
+from minimise import TABLE_CACHE_DIR, compile_table_cached, truth_table
+import netlist as gates
 from util import *
 
 '''
-All functions return [next_free_var, in_vars, out_vars, cnf]
+Flat table of clauses
+
+lits holds the clauses back to back in DIMACS order (each clause is terminated by 0),
+offsets[i] is the position in lits where clause i starts.
+Clause indices keep counting when the buffer is taken away (flushed) by the store.
+lits and offsets may also be read-only buffers of the same types (e.g. memory mapped by cnf_cache.py),
+which are copied into arrays on the first add.
+'''
+class ClauseTable:
+  def __init__(self, lits = None, offsets = None):
+    self.lits = array('i') if lits is None else lits
+    self.offsets = array('q') if offsets is None else offsets
+    self.flushed = 0
+    self.flushed_lits = 0
+
+  def __len__(self):
+    return self.flushed + len(self.offsets)
+
+  def num_literals(self):
+    return self.flushed_lits + len(self.lits) - len(self.offsets)
+
+  def writable(self):
+    if not isinstance(self.lits, array):
+      self.lits = array('i', bytes(self.lits))
+      self.offsets = array('q', bytes(self.offsets))
+
+  def add(self, clauses):
+    self.writable()
+    lits = self.lits
+    offsets = self.offsets
+    for clause in clauses:
+      offsets.append(len(lits))
+      lits.extend(clause)
+      lits.append(0)
+
+  # Append clauses already in flat form: zero terminated lits, offsets relative to lits[0]
+  def add_flat(self, lits, offsets):
+    self.writable()
+    self.offsets.extend(map(len(self.lits).__add__, offsets))
+    self.lits.extend(lits)
+
+  def clause(self, i):
+    i -= self.flushed
+    if i < 0:
+      raise ValueError("clause was already flushed to the sink")
+    lo = self.offsets[i]
+    hi = self.offsets[i+1] - 1 if i+1 < len(self.offsets) else len(self.lits) - 1
+    return self.lits[lo:hi].tolist()
+
+  def lit_range(self, start, end):
+    start -= self.flushed
+    end -= self.flushed
+    if start < 0:
+      raise ValueError("clauses were already flushed to the sink")
+    lo = self.offsets[start] if start < len(self.offsets) else len(self.lits)
+    hi = self.offsets[end] if end < len(self.offsets) else len(self.lits)
+    return lo, hi
+
+  # Hand over the buffered literals and start a new buffer
+  def take(self):
+    lits = self.lits
+    self.flushed += len(self.offsets)
+    self.flushed_lits += len(lits) - len(self.offsets)
+    self.lits = array('i')
+    self.offsets = array('q')
+    return lits
+
+'''
+Flat clause store shared by every building block
+
+Building blocks append to the store in place and hand it down to the blocks they call,
+so a clause is written exactly once no matter how deep the call tree is.
+Ordinary clauses live in store.clauses, XOR constraints in store.xors (both ClauseTables).
+An XOR constraint is stored as the list of literals whose XOR is True,
+as in the "x" lines of CryptoMiniSat's extended DIMACS format.
+
+If a sink is given (see dimacs.py), the buffers are handed to it in chunks of about flush_size literals
+and then dropped, so memory stays constant however large the CNF gets.
+Clause indices (len(store), ClauseView bounds) keep counting across flushes,
+but clauses that were already flushed can no longer be read back.
+Call close() at the end to flush the rest and let the sink write its header.
+
+Encoding options (read by the building blocks that receive the store):
+* alias: bit_eq returns its input literal instead of a new variable, so rotations are plain
+         permutations of the input literals with no variables or clauses
+* xor:   bit_xor (and so word_xor and the adder sum bits) emits one XOR constraint instead of four clauses
+* adder: encoding of half_adder/full_adder (and so modular_addition), 'tseitin', 'direct' or 'ripple',
+         or 'table' for modular_addition built from adder_slice bit wide minimised truth tables (boolean_function)
+
+With netlist = True, store.netlist (see netlist.py) also records the gate that defines each new variable,
+whatever the encoding, so the circuit can be evaluated without a solver.
+
+With strash = True (structural hashing), the store remembers every gate it has defined by its opcode and operands
+(see strash_key), and the bit level building blocks return the existing literal for a gate that was already built
+instead of a new variable, so repeated subexpressions anywhere in the circuit are encoded once.
+
+store.template(key, build, num_inputs) gives the Template (see below) of a building block for this store's options,
+compiled on first use and shared by every later call with the same key.
+'''
+ADDER_ENCODINGS = ['tseitin', 'direct', 'ripple', 'table']
+
+class ClauseStore:
+  def __init__(self, sink = None, flush_size = 1 << 16, alias = False, xor = False, adder = 'tseitin', adder_slice = 4,
+               netlist = False, strash = False):
+    assert(adder in ADDER_ENCODINGS)
+    self.netlist = gates.Netlist() if netlist else None
+    self.alias = alias
+    self.xor = xor
+    self.adder = adder
+    self.adder_slice = adder_slice
+    self.strash = strash
+    self.hashed = dict()
+    self.clauses = ClauseTable()
+    self.xors = ClauseTable()
+    self.sink = None if sink is None else as_sink(sink)
+    if xor and isinstance(self.sink, CallbackSink) and self.sink.xor_callback is None:
+      raise ValueError("xor = True needs a sink for the XOR constraints: pass CallbackSink(callback, xor_callback)")
+    self.flush_size = flush_size
+    self.max_var = 0
+    self.templates = dict()
+
+  # Encoding options, as keyword arguments for ClauseStore
+  def options(self):
+    return dict(alias = self.alias, xor = self.xor, adder = self.adder, adder_slice = self.adder_slice,
+                strash = self.strash)
+
+  @property
+  def lits(self):
+    return self.clauses.lits
+
+  def __len__(self):
+    return len(self.clauses)
+
+  def num_literals(self):
+    return self.clauses.num_literals()
+
+  def num_xors(self):
+    return len(self.xors)
+
+  # Record out = op(ins) in the netlist, if there is one (ops are the constants in netlist.py),
+  # and for structural hashing
+  # param is the value for CONST and the truth table column (netlist.table_column) for TABLE
+  def gate(self, op, out, ins, param = 0):
+    if self.netlist is not None:
+      self.netlist.add(op, out, ins, self.netlist.table_id(param) if op == gates.TABLE else param)
+    if self.strash:
+      key, flip = strash_key(op, ins, param)
+      self.hashed[key] = -out if flip else out
+
+  # With strash, the literal of an earlier gate op(ins), otherwise None
+  def lookup(self, op, ins, param = 0):
+    if not self.strash:
+      return None
+    key, flip = strash_key(op, ins, param)
+    x = self.hashed.get(key)
+    if x is None:
+      return None
+    return -x if flip else x
+
+  def add_clause(self, clause):
+    self.add_clauses([clause])
+
+  def add_clauses(self, clauses):
+    self.clauses.add(clauses)
+    if self.sink is not None and len(self.clauses.lits) >= self.flush_size:
+      self.flush()
+
+  # lits = literals whose XOR is True
+  def add_xor(self, lits):
+    self.xors.add([lits])
+    if self.sink is not None and len(self.xors.lits) >= self.flush_size:
+      self.flush()
+
+  # Append flat clauses and XORs (see ClauseTable.add_flat)
+  def add_flat(self, lits, offsets, xor_lits, xor_offsets):
+    self.clauses.add_flat(lits, offsets)
+    self.xors.add_flat(xor_lits, xor_offsets)
+    if self.sink is not None and max(len(self.clauses.lits), len(self.xors.lits)) >= self.flush_size:
+      self.flush()
+
+  def template(self, key, build, num_inputs):
+    if key not in self.templates:
+      self.templates[key] = Template(build, num_inputs, self)
+    return self.templates[key]
+
+  def clause(self, i):
+    return self.clauses.clause(i)
+
+  def flush(self):
+    if self.sink is None:
+      return
+    for table, write in [(self.clauses, self.sink.write_clauses), (self.xors, self.sink.write_xors)]:
+      if len(table.offsets) == 0:
+        continue
+      self.max_var = max(self.max_var, max(table.lits), -min(table.lits))
+      write(table.take())
+
+  # num_vars defaults to the largest variable seen
+  def close(self, num_vars = None):
+    if self.sink is None:
+      return
+    self.flush()
+    self.sink.close(self.max_var if num_vars is None else num_vars, len(self) + self.num_xors())
+
+  # Current position, to be passed to view() later
+  def mark(self):
+    return (len(self.clauses), len(self.xors))
+
+  # View over everything added since mark start
+  def view(self, start = (0, 0)):
+    return ClauseView(self.clauses, start[0], len(self.clauses),
+                      ClauseView(self.xors, start[1], len(self.xors)))
+
+  '''
+  Merge XOR constraints through the variables they share:
+  a variable that occurs in exactly two XORs, in no ordinary clause and not in keep
+  is eliminated by adding the two XORs, which gives one longer XOR.
+  Repeats until no such variable is left (or merging would exceed max_len literals).
+  Eliminated variables are left unconstrained, so keep must hold every variable that is read off a solution.
+  Rewrites store.xors, so earlier views of XOR constraints are no longer valid.
+  '''
+  def chain_xors(self, keep, max_len = None):
+    assert(self.sink is None)
+    in_clauses = set(map(abs, self.clauses.lits))
+    keep = set(abs(x) for x in keep if not is_const(x))
+    xors = []
+    occ = dict()
+    for clause in ClauseView(self.xors, 0, len(self.xors)):
+      vs = set()
+      rhs = True
+      for x in clause:
+        vs ^= {abs(x)}
+        rhs ^= x < 0
+      for v in vs:
+        occ.setdefault(v, set()).add(len(xors))
+      xors.append((vs, rhs))
+
+    def eliminable(v):
+      return len(occ[v]) == 2 and v not in in_clauses and v not in keep
+
+    work = [v for v in occ if eliminable(v)]
+    while len(work) > 0:
+      v = work.pop()
+      if not eliminable(v):
+        continue
+      i, j = occ[v]
+      merged = xors[i][0] ^ xors[j][0]
+      if max_len is not None and len(merged) > max_len:
+        continue
+      touched = xors[i][0] | xors[j][0]
+      for u in touched:
+        occ[u].discard(i)
+        occ[u].discard(j)
+      for u in merged:
+        occ[u].add(i)
+      xors[i] = (merged, xors[i][1] != xors[j][1])
+      xors[j] = None
+      work += [u for u in touched if eliminable(u)]
+
+    self.xors = ClauseTable()
+    for x in xors:
+      if x is None:
+        continue
+      vs, rhs = x
+      lits = sorted(vs)
+      if len(lits) == 0:
+        if rhs:
+          self.add_clause([])
+        continue
+      if not rhs:
+        lits[0] = -lits[0]
+      self.xors.add([lits])
+
+'''
+Structural hashing key of gate op(ins) (ops and params as in ClauseStore.gate)
+Returns (key, flip): gates with the same key have the same output, negated if flip differs.
+Operands of commutative gates are sorted, OR(a, b) is hashed as -AND(-a, -b), negations move out of XORs,
+MAJ is self-dual (MAJ(-a, -b, -c) = -MAJ(a, b, c)) and CONST True and False share one variable.
+'''
+def strash_key(op, ins, param = 0):
+  if op == gates.OR:
+    return (gates.AND, tuple(sorted(-x for x in ins))), True
+  if op == gates.AND:
+    return (gates.AND, tuple(sorted(ins))), False
+  if op == gates.XOR or op == gates.XOR3:
+    return (op, tuple(sorted(abs(x) for x in ins))), sum(x < 0 for x in ins) % 2 == 1
+  if op == gates.MAJ:
+    flip = sum(x < 0 for x in ins) >= 2
+    return (op, tuple(sorted(-x if flip else x for x in ins))), flip
+  if op == gates.CONST:
+    return (op,), not param
+  return (op, param, tuple(ins)), False
+
+'''
+Read-only window [start, end) into a ClauseTable
+
+Behaves like the list of clause lists it replaces (len, iteration, indexing, +),
+so it can be handed to Solver.add_clauses as is.
+buffer() returns the zero terminated flat form, which Solver.add_clauses takes without any copying into Python lists.
+Views from ClauseStore.view() carry the XOR constraints of the same window in .xors
+'''
+class ClauseView:
+  def __init__(self, table, start, end, xors = None):
+    self.table = table
+    self.start = start
+    self.end = end
+    self.xors = xors
+
+  def __len__(self):
+    return self.end - self.start
+
+  def __iter__(self):
+    for i in range(self.start, self.end):
+      yield self.table.clause(i)
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self.table.clause(self.start + j) for j in range(*i.indices(len(self)))]
+    if i < 0:
+      i += len(self)
+    if i < 0 or i >= len(self):
+      raise IndexError("clause index out of range")
+    return self.table.clause(self.start + i)
+
+  def __add__(self, other):
+    return self.to_list() + list(other)
+
+  def __radd__(self, other):
+    return list(other) + self.to_list()
+
+  def __repr__(self):
+    return "ClauseView({0})".format(self.to_list())
+
+  def num_literals(self):
+    lo, hi = self.table.lit_range(self.start, self.end)
+    return hi - lo - len(self)
+
+  def buffer(self):
+    lo, hi = self.table.lit_range(self.start, self.end)
+    return self.table.lits[lo:hi]
+
+  def to_list(self):
+    return list(self)
+
+def ensure_store(store):
+  return ClauseStore() if store is None else store
+
+'''
+All functions take an optional ClauseStore as their last argument (a fresh one is created if omitted),
+append their clauses to it and return [next_free_var, Result(in_vars, out_vars, cnf)]
+where cnf is a ClauseView over the clauses that call added
 '''
 class Result:
   def __init__(self, in_vars, out_vars, cnf):
@@ -9,32 +365,208 @@ class Result:
     self.out_vars = out_vars
     self.cnf = cnf
 
+  # XOR constraints added by the call (only used with ClauseStore(xor = True))
+  @property
+  def xors(self):
+    return self.cnf.xors
+
+'''
+Load a ClauseView (clauses and XOR constraints) into a pycryptosat Solver
+'''
+def add_to_solver(solver, cnf):
+  solver.add_clauses(cnf.buffer())
+  if cnf.xors is not None:
+    for lits in cnf.xors:
+      solver.add_xor_clause([abs(x) for x in lits], sum(x < 0 for x in lits) % 2 == 0)
+
+'''
+Relocatable CNF of a building block
+
+A building block emits the same clauses every time it is called on distinct input literals,
+only with other variable numbers. A Template runs build(next_free_var, inputs, store) -> (next_free_var, Result)
+once on the symbolic inputs 1..num_inputs (with the options of store), keeps the flat clauses, XORs and netlist,
+and instantiate() copies them into a store for new inputs by relabelling every literal through one lookup table:
+template variable i <= num_inputs becomes inputs[i-1], every later one the next free variable in order.
+So the result is the same as build would give, without running the Python call tree of the block again.
+
+Literals are kept offset by num_vars (the number of template variables), so that a literal x is looked up at
+relabel[x + num_vars] and the clause terminators 0 land on relabel[num_vars] = 0.
+The lookups of a whole table are one operator.itemgetter call (a gather), which is about three times faster
+than mapping over the literals.
+Inputs with constants or repeated variables would let build fold differently, so those calls run build itself,
+as do all calls with store.strash, which has to see every gate to share it.
+'''
+# Function t -> tuple(t[i] for i in indices)
+def gather(indices):
+  if len(indices) < 2:
+    return lambda t: tuple(t[i] for i in indices)
+  return itemgetter(*indices)
+
+class Template:
+  def __init__(self, build, num_inputs, store):
+    scratch = ClauseStore(netlist = store.netlist is not None, **store.options())
+    nfv, res = build(num_inputs+1, list(range(1, num_inputs+1)), scratch)
+    self.build = build
+    self.num_inputs = num_inputs
+    self.num_vars = nfv - 1
+    offset = self.num_vars
+    self.gather_lits = gather([x + offset for x in scratch.clauses.lits])
+    self.offsets = scratch.clauses.offsets
+    self.gather_xor_lits = gather([x + offset for x in scratch.xors.lits])
+    self.xor_offsets = scratch.xors.offsets
+    self.out_vars = res.out_vars
+    self.netlist = scratch.netlist
+
+  def instantiate(self, next_free_var, inputs, store):
+    assert(len(inputs) == self.num_inputs)
+    if store.strash or any(is_const(x) for x in inputs) or len(set(map(abs, inputs))) < len(inputs):
+      return self.build(next_free_var, inputs, store)
+    start = store.mark()
+    pos = list(inputs) + list(range(next_free_var, next_free_var + self.num_vars - self.num_inputs))
+    relabel = [-x for x in reversed(pos)] + [0] + pos
+    store.add_flat(array('i', self.gather_lits(relabel)), self.offsets,
+                   array('i', self.gather_xor_lits(relabel)), self.xor_offsets)
+    if store.netlist is not None:
+      store.netlist.relocate(self.netlist, relabel, self.num_vars)
+    out_vars = [x if is_const(x) else relabel[x + self.num_vars] for x in self.out_vars]
+    return next_free_var + self.num_vars - self.num_inputs, Result(inputs, out_vars, store.view(start))
+
+'''
+Cone of influence slicing
+Copies into store the clauses and XORs of source (a ClauseStore built with netlist = True) that only involve
+variables the literals lits depend on (netlist.cone), and their gates if store records a netlist.
+Every gate's defining clauses are over its output and operands, so the copy still pins each variable of the cone
+to its value for the cone's inputs; what is dropped only constrains variables that lits do not depend on.
+Variables keep their numbers. Returns Result(primary inputs in the cone, lits, cnf)
+
+With polarity = True the literals are taken to be only ever required true (e.g. asserted as unit clauses),
+and the slice is also polarity aware (Plaisted-Greenbaum): of the defining clauses of a gate whose output is
+needed with one polarity only (netlist.polarities), just the half that polarity needs is kept
+(those with -v if v is only needed true, those with v if only needed false).
+The slice is then satisfiable with the inputs of the cone fixed exactly when the circuit makes every literal true,
+but variables needed with one polarity are no longer pinned to their values.
+A clause counts as defining a gate if its largest variable is the gate's output and every other one an operand.
+'''
+def slice_cone(source, lits, store = None, polarity = False):
+  assert(source.netlist is not None)
+  store = ensure_store(store)
+  start = store.mark()
+  netlist = source.netlist
+  if polarity:
+    pol = gates.polarities(netlist, lits)
+    keep = set(pol)
+  else:
+    keep = gates.cone(netlist, lits)
+  one_sided = dict()
+  if polarity:
+    for i, v in enumerate(netlist.outs):
+      if pol.get(v, 0) in (gates.POS, gates.NEG):
+        one_sided[v] = (pol[v], set(map(abs, netlist.gate_operands(i))))
+
+  def needed(clause):
+    if not all(abs(x) in keep for x in clause):
+      return False
+    v = max(map(abs, clause))
+    if v not in one_sided:
+      return True
+    p, operands = one_sided[v]
+    if not all(abs(x) in operands for x in clause if abs(x) != v):
+      return True
+    return (-v in clause) == (p == gates.POS)
+
+  store.add_clauses(clause for clause in source.view() if needed(clause))
+  for xor_lits in source.view().xors:
+    if all(abs(x) in keep for x in xor_lits):
+      store.add_xor(xor_lits)
+  if store.netlist is not None:
+    for i, v in enumerate(netlist.outs):
+      if v in keep:
+        store.netlist.copy_gate(netlist, i)
+  in_vars = sorted(keep - set(netlist.outs))
+  return Result(in_vars, lits, store.view(start))
+
+#
+# CONSTANTS
+#
+'''
+Building blocks accept the constants True/False wherever they accept a literal,
+and fold them away while building instead of spending variables and clauses on them.
+Folding can also turn an output into an existing literal, its negation or a constant,
+so out_vars hold literals in general (use lit_value to read them off a solution).
+'''
+def is_const(x):
+  return x is True or x is False
+
+def neg(x):
+  if is_const(x):
+    return not x
+  return -x
+
+'''
+Value (True/False) of literal or constant x under a solver solution
+'''
+def lit_value(soln, x):
+  if is_const(x):
+    return x
+  if x > 0:
+    return soln[x]
+  return not soln[-x]
+
 #
 # BIT LEVEL
 #
 '''
 x = y
+With store.alias, y is x itself
 '''
-def bit_eq(next_free_var, x):
+def bit_eq(next_free_var, x, store = None):
+  store = ensure_store(store)
+  start = store.mark()
+  if store.alias or is_const(x):
+    return next_free_var, Result([x], [x], store.view(start))
+  hit = store.lookup(gates.EQ, [x])
+  if hit is not None:
+    return next_free_var, Result([x], [hit], store.view(start))
   y = next_free_var
-  cnf = [[x, -y],
-         [-x, y]]
-  return y+1, Result([x], [y], cnf)
+  store.gate(gates.EQ, y, [x])
+  store.add_clauses([[x, -y],
+                     [-x, y]])
+  return y+1, Result([x], [y], store.view(start))
 
 '''
 c = a xor b
+With store.xor, the XOR constraint (a xor b xor -c) = True, otherwise
 -a -b -c
 -a  b c
  a -b c
  a  b -c
 '''
-def bit_xor(next_free_var, x, y):
+def bit_xor(next_free_var, x, y, store = None):
+  store = ensure_store(store)
+  start = store.mark()
+  if is_const(x) or is_const(y) or x == y or x == -y:
+    if is_const(x) and is_const(y):
+      z = x != y
+    elif is_const(x):
+      z = neg(y) if x else y
+    elif is_const(y):
+      z = neg(x) if y else x
+    else:
+      z = x != y
+    return next_free_var, Result([x,y], [z], store.view(start))
+  hit = store.lookup(gates.XOR, [x, y])
+  if hit is not None:
+    return next_free_var, Result([x,y], [hit], store.view(start))
   z = next_free_var
-  cnf = [[-x, -y, -z],
-         [-x,  y,  z],
-         [ x, -y,  z],
-         [ x,  y, -z]]
-  return z+1, Result([x,y], [z], cnf)
+  store.gate(gates.XOR, z, [x, y])
+  if store.xor:
+    store.add_xor([x, y, -z])
+    return z+1, Result([x,y], [z], store.view(start))
+  store.add_clauses([[-x, -y, -z],
+                     [-x,  y,  z],
+                     [ x, -y,  z],
+                     [ x,  y, -z]])
+  return z+1, Result([x,y], [z], store.view(start))
 
 '''
 c = a and b
@@ -43,13 +575,29 @@ c = a and b
  a -b -c
  a  b -c
 '''
-def bit_and(next_free_var, x, y):
+def bit_and(next_free_var, x, y, store = None):
+  store = ensure_store(store)
+  start = store.mark()
+  if is_const(x) or is_const(y) or x == y or x == -y:
+    if x is False or y is False:
+      z = False
+    elif x is True:
+      z = y
+    elif y is True or x == y:
+      z = x
+    else:
+      z = False
+    return next_free_var, Result([x,y], [z], store.view(start))
+  hit = store.lookup(gates.AND, [x, y])
+  if hit is not None:
+    return next_free_var, Result([x,y], [hit], store.view(start))
   z = next_free_var
-  cnf = [[-x, -y,  z],
-         [-x,  y, -z],
-         [ x, -y, -z],
-         [ x,  y, -z]]
-  return z+1, Result([x,y], [z], cnf)
+  store.gate(gates.AND, z, [x, y])
+  store.add_clauses([[-x, -y,  z],
+                     [-x,  y, -z],
+                     [ x, -y, -z],
+                     [ x,  y, -z]])
+  return z+1, Result([x,y], [z], store.view(start))
 
 '''
 c = a or b
@@ -58,13 +606,112 @@ c = a or b
  a -b  c
  a  b -c
 '''
-def bit_or(next_free_var, x, y):
+def bit_or(next_free_var, x, y, store = None):
+  store = ensure_store(store)
+  start = store.mark()
+  if is_const(x) or is_const(y) or x == y or x == -y:
+    if x is True or y is True:
+      z = True
+    elif x is False:
+      z = y
+    elif y is False or x == y:
+      z = x
+    else:
+      z = True
+    return next_free_var, Result([x,y], [z], store.view(start))
+  hit = store.lookup(gates.OR, [x, y])
+  if hit is not None:
+    return next_free_var, Result([x,y], [hit], store.view(start))
   z = next_free_var
-  cnf = [[-x, -y,  z],
-         [-x,  y,  z],
-         [ x, -y,  z],
-         [ x,  y, -z]]
-  return z+1, Result([x,y], [z], cnf)
+  store.gate(gates.OR, z, [x, y])
+  store.add_clauses([[-x, -y,  z],
+                     [-x,  y,  z],
+                     [ x, -y,  z],
+                     [ x,  y, -z]])
+  return z+1, Result([x,y], [z], store.view(start))
+
+'''
+The operands of a three input gate reordered as [a, b, c] so that a and b fold in a two input gate,
+i.e. one of them is a constant or b = a or b = -a. None if no two operands fold.
+'''
+def fold_pair(x, y, z):
+  ops = [x, y, z]
+  for i, j, k in [(0, 1, 2), (0, 2, 1), (1, 2, 0)]:
+    a, b = ops[i], ops[j]
+    if is_const(a) or is_const(b) or abs(a) == abs(b):
+      return [a, b, ops[k]]
+  return None
+
+'''
+d = a xor b xor c
+With store.xor, the XOR constraint (a xor b xor c xor -d) = True, otherwise
+the 8 clauses forbidding every assignment with the wrong parity
+Constants and repeated operands fold through bit_xor: (a xor b) xor c
+'''
+def bit_xor3(next_free_var, x, y, z, store = None):
+  store = ensure_store(store)
+  start = store.mark()
+  pair = fold_pair(x, y, z)
+  if pair is not None:
+    a, b, c = pair
+    next_free_var, ab_res = bit_xor(next_free_var, a, b, store)
+    next_free_var, res = bit_xor(next_free_var, ab_res.out_vars[0], c, store)
+    return next_free_var, Result([x,y,z], res.out_vars, store.view(start))
+  hit = store.lookup(gates.XOR3, [x, y, z])
+  if hit is not None:
+    return next_free_var, Result([x,y,z], [hit], store.view(start))
+  d = next_free_var
+  store.gate(gates.XOR3, d, [x, y, z])
+  if store.xor:
+    store.add_xor([x, y, z, -d])
+  else:
+    store.add_clauses([[-x, -y, -z,  d],
+                       [-x, -y,  z, -d],
+                       [-x,  y, -z, -d],
+                       [-x,  y,  z,  d],
+                       [ x, -y, -z, -d],
+                       [ x, -y,  z,  d],
+                       [ x,  y, -z,  d],
+                       [ x,  y,  z, -d]])
+  return d+1, Result([x,y,z], [d], store.view(start))
+
+'''
+d = majority(a, b, c) = (a and b) or (a and c) or (b and c)
+-a -b  d
+-a -c  d
+-b -c  d
+ a  b -d
+ a  c -d
+ b  c -d
+Constants and repeated operands fold: majority(True, b, c) = b or c, majority(False, b, c) = b and c,
+majority(a, a, c) = a and majority(a, -a, c) = c
+'''
+def bit_maj(next_free_var, x, y, z, store = None):
+  store = ensure_store(store)
+  start = store.mark()
+  pair = fold_pair(x, y, z)
+  if pair is not None:
+    a, b, c = pair
+    if is_const(b):
+      a, b = b, a
+    if is_const(a):
+      next_free_var, res = (bit_or if a else bit_and)(next_free_var, b, c, store)
+      d = res.out_vars[0]
+    else:
+      d = a if a == b else c
+    return next_free_var, Result([x,y,z], [d], store.view(start))
+  hit = store.lookup(gates.MAJ, [x, y, z])
+  if hit is not None:
+    return next_free_var, Result([x,y,z], [hit], store.view(start))
+  d = next_free_var
+  store.gate(gates.MAJ, d, [x, y, z])
+  store.add_clauses([[-x, -y,  d],
+                     [-x, -z,  d],
+                     [-y, -z,  d],
+                     [ x,  y, -d],
+                     [ x,  z, -d],
+                     [ y,  z, -d]])
+  return d+1, Result([x,y,z], [d], store.view(start))
 
 #
 # WORD LEVEL
@@ -76,16 +723,16 @@ where v7 = v1 xor v4
       v8 = v2 xor v5
       v9 = v3 xor v6
 '''
-def word_xor(next_free_var, x, y):
+def word_xor(next_free_var, x, y, store = None):
   assert(len(x) == len(y))
+  store = ensure_store(store)
+  start = store.mark()
   num_bits = len(x)
   out_vars = []
-  cnf = []
   for i in range(num_bits):
-    next_free_var, res = bit_xor(next_free_var, x[i], y[i])
+    next_free_var, res = bit_xor(next_free_var, x[i], y[i], store)
     out_vars += res.out_vars
-    cnf += res.cnf
-  return next_free_var, Result(x + y, out_vars, cnf)
+  return next_free_var, Result(x + y, out_vars, store.view(start))
 
 '''
 Given bit vector x, create corresponding rotated vector y
@@ -94,15 +741,15 @@ where v4 = v2
       v5 = v3
       v6 = v1
 '''
-def rotate_left_by_k(next_free_var, num_bits, x, k):
+def rotate_left_by_k(next_free_var, num_bits, x, k, store = None):
   assert(len(x) == num_bits)
+  store = ensure_store(store)
+  start = store.mark()
   out_vars = []
-  cnf = []
   for i in range(num_bits):
-    next_free_var, res = bit_eq(next_free_var, x[(i+k) % num_bits])
+    next_free_var, res = bit_eq(next_free_var, x[(i+k) % num_bits], store)
     out_vars += res.out_vars
-    cnf += res.cnf
-  return next_free_var, Result(x, out_vars, cnf)
+  return next_free_var, Result(x, out_vars, store.view(start))
 
 '''
 Given bit vector x, create corresponding rotated vector y
@@ -111,15 +758,15 @@ where v4 = v3
       v5 = v1
       v6 = v2
 '''
-def rotate_right_by_k(next_free_var, num_bits, x, k):
+def rotate_right_by_k(next_free_var, num_bits, x, k, store = None):
   assert(len(x) == num_bits)
+  store = ensure_store(store)
+  start = store.mark()
   out_vars = []
-  cnf = []
   for i in range(num_bits):
-    next_free_var, res = bit_eq(next_free_var, x[(i-k) % num_bits])
+    next_free_var, res = bit_eq(next_free_var, x[(i-k) % num_bits], store)
     out_vars += res.out_vars
-    cnf += res.cnf
-  return next_free_var, Result(x, out_vars, cnf)
+  return next_free_var, Result(x, out_vars, store.view(start))
   
 '''
 Half adder
@@ -127,13 +774,33 @@ x + y = (carry c_out, sum s)
 
 s = x xor y
 c = x and y
+
+With store.adder = 'direct' or 'ripple', c is defined by the three clauses of an and gate,
+and 'ripple' adds the redundant clauses -c -s, c s -x and c s -y
+(unless x or y is a constant or s folds to one, i.e. x = y or x = -y: then bit_and folds c as well)
 '''
-def half_adder(next_free_var, x, y):
-  next_free_var, s_res = bit_xor(next_free_var, x, y)
-  next_free_var, c_res = bit_and(next_free_var, x, y)
+def half_adder(next_free_var, x, y, store = None):
+  store = ensure_store(store)
+  start = store.mark()
+  next_free_var, s_res = bit_xor(next_free_var, x, y, store)
+  s = s_res.out_vars[0]
+  if store.adder == 'tseitin' or is_const(x) or is_const(y) or is_const(s) or store.lookup(gates.AND, [x, y]) is not None:
+    next_free_var, c_res = bit_and(next_free_var, x, y, store)
+    c = c_res.out_vars[0]
+  else:
+    c = next_free_var
+    next_free_var += 1
+    store.gate(gates.AND, c, [x, y])
+    store.add_clauses([[-c,  x],
+                       [-c,  y],
+                       [ c, -x, -y]])
+    if store.adder == 'ripple':
+      store.add_clauses([[-c, -s],
+                         [ c,  s, -x],
+                         [ c,  s, -y]])
   return next_free_var, Result([x, y],
-                               c_res.out_vars + s_res.out_vars,
-                               c_res.cnf + s_res.cnf)
+                               [c, s],
+                               store.view(start))
 
 '''
 Full adder
@@ -142,64 +809,212 @@ if not ignore_cout: x + y + c_in = (carry c_out, sum s)
 
 s = x xor y xor c_in
 c = (x and y) or (c_in and (x xor y))
+
+If one input is a constant k, the carry is folded to (a and b) for k = False or (a or b) for k = True
+If two inputs a, b are the same variable, neither output needs a gate, with any encoding:
+s = c (b = a) or -c (b = -a), and the carry is a (b = a) or c (b = -a), c being the third input
+
+store.adder selects the encoding:
+* 'tseitin': five gates as above (x xor y, s, x and y, c_in and (x xor y), c)
+* 'direct':  only s = bit_xor3(x, y, c_in) and c = bit_maj(x, y, c_in)
+* 'ripple':  'direct' plus the redundant clauses c and s => x, y, c_in and (not c) and (not s) => not x, y, c_in,
+             which let unit propagation fill in the inputs from the outputs
 '''
-def full_adder(next_free_var, x, y, c_in, ignore_cout):
-  next_free_var, x_xor_y_res = bit_xor(next_free_var, x, y)
+def full_adder(next_free_var, x, y, c_in, ignore_cout, store = None):
+  store = ensure_store(store)
+  start = store.mark()
+  in_vars = [x, y, c_in]
+  if is_const(x):
+    x, c_in = c_in, x
+  elif is_const(y):
+    y, c_in = c_in, y
+  if is_const(c_in):
+    next_free_var, x_xor_y_res = bit_xor(next_free_var, x, y, store)
+    s = neg(x_xor_y_res.out_vars[0]) if c_in else x_xor_y_res.out_vars[0]
+    if ignore_cout:
+      return next_free_var, Result(in_vars, [s], store.view(start))
+    carry = bit_or if c_in else bit_and
+    next_free_var, c_res = carry(next_free_var, x, y, store)
+    return next_free_var, Result(in_vars, c_res.out_vars + [s], store.view(start))
+  if abs(c_in) == abs(x):
+    y, c_in = c_in, y
+  elif abs(c_in) == abs(y):
+    x, c_in = c_in, x
+  if abs(x) == abs(y):
+    s = c_in if x == y else neg(c_in)
+    if ignore_cout:
+      return next_free_var, Result(in_vars, [s], store.view(start))
+    return next_free_var, Result(in_vars, [x if x == y else c_in, s], store.view(start))
+  if store.adder != 'tseitin':
+    next_free_var, s_res = bit_xor3(next_free_var, x, y, c_in, store)
+    s = s_res.out_vars[0]
+    if ignore_cout:
+      return next_free_var, Result(in_vars, [s], store.view(start))
+    next_free_var, c_res = bit_maj(next_free_var, x, y, c_in, store)
+    c = c_res.out_vars[0]
+    # (A carry shared through structural hashing already has them)
+    if store.adder == 'ripple' and len(c_res.cnf) > 0:
+      store.add_clauses([[-c, -s,  x],
+                         [-c, -s,  y],
+                         [-c, -s,  c_in],
+                         [ c,  s, -x],
+                         [ c,  s, -y],
+                         [ c,  s, -c_in]])
+    return next_free_var, Result(in_vars, [c, s], store.view(start))
+  next_free_var, x_xor_y_res = bit_xor(next_free_var, x, y, store)
   x_xor_y = x_xor_y_res.out_vars[0]
-  next_free_var, s_res = bit_xor(next_free_var, x_xor_y, c_in)
+  next_free_var, s_res = bit_xor(next_free_var, x_xor_y, c_in, store)
   if ignore_cout:
-    return next_free_var, Result([x, y, c_in],
+    return next_free_var, Result(in_vars,
                                  s_res.out_vars,
-                                 x_xor_y_res.cnf + s_res.cnf)
+                                 store.view(start))
   else:
-    next_free_var, x_and_y_res = bit_and(next_free_var, x, y)
+    next_free_var, x_and_y_res = bit_and(next_free_var, x, y, store)
     x_and_y = x_and_y_res.out_vars[0]
-    next_free_var, c_right_res = bit_and(next_free_var, c_in, x_xor_y)
+    next_free_var, c_right_res = bit_and(next_free_var, c_in, x_xor_y, store)
     c_right = c_right_res.out_vars[0]
-    next_free_var, c_res = bit_or(next_free_var, x_and_y, c_right)
-    return next_free_var, Result([x, y, c_in],
+    next_free_var, c_res = bit_or(next_free_var, x_and_y, c_right, store)
+    return next_free_var, Result(in_vars,
                                  c_res.out_vars + s_res.out_vars,
-                                 x_xor_y_res.cnf + x_and_y_res.cnf + c_right_res.cnf + c_res.cnf + s_res.cnf)
+                                 store.view(start))
 
 '''
 Given x and y, return (x + y) ignoring the overflow bit
+With store.adder = 'table', the sum is built from store.adder_slice bit wide slices,
+each a boolean_function of (x slice, y slice, carry in) giving (carry out, sum slice)
 '''
-def modular_addition(next_free_var, num_bits, x, y):
+def modular_addition(next_free_var, num_bits, x, y, store = None):
   assert(len(x) == num_bits)
   assert(len(y) == num_bits)
+  store = ensure_store(store)
+  start = store.mark()
+  if store.adder == 'table':
+    c = False
+    out_vars = []
+    hi = num_bits
+    while hi > 0:
+      lo = max(0, hi - store.adder_slice)
+      width = hi - lo
+      carry_out = lo > 0
+      next_free_var, res = boolean_function(next_free_var, x[lo:hi] + y[lo:hi] + [c],
+                                            adder_slice_table(width, carry_out), width + carry_out, store)
+      if carry_out:
+        c = res.out_vars[0]
+      out_vars = res.out_vars[carry_out:] + out_vars
+      hi = lo
+    return next_free_var, Result(x + y, out_vars, store.view(start))
   c = None
   out_vars = []
-  cnf = []
   for i in range(num_bits-1, 0, -1):
     a = x[i]
     b = y[i]
     if c == None:
-      next_free_var, res = half_adder(next_free_var, a, b)
+      next_free_var, res = half_adder(next_free_var, a, b, store)
     else:
-      next_free_var, res = full_adder(next_free_var, a, b, c, ignore_cout = False)
+      next_free_var, res = full_adder(next_free_var, a, b, c, ignore_cout = False, store = store)
     c = res.out_vars[0]
     s = res.out_vars[1]
     out_vars.append(s)
-    cnf += res.cnf
-  next_free_var, res = full_adder(next_free_var, x[0], y[0], c, ignore_cout = True)
+  # c is None for 1 bit words (no carry in)
+  next_free_var, res = full_adder(next_free_var, x[0], y[0], False if c is None else c, ignore_cout = True, store = store)
   s = res.out_vars[0]
   out_vars.append(s)
-  cnf += res.cnf
   out_vars.reverse()
-  return next_free_var, Result(x + y, out_vars, cnf)
+  return next_free_var, Result(x + y, out_vars, store.view(start))
+
+adder_slice_tables = dict()
+
+'''
+Truth table of a width bit adder slice: input (a, b, carry in), output (carry out, sum) or just the sum
+'''
+def adder_slice_table(width, carry_out):
+  if (width, carry_out) not in adder_slice_tables:
+    mask = (1 << width) - 1
+    table = []
+    for v in range(1 << (2*width + 1)):
+      total = (v >> (width + 1)) + ((v >> 1) & mask) + (v & 1)
+      table.append(total if carry_out else total & mask)
+    adder_slice_tables[(width, carry_out)] = table
+  return adder_slice_tables[(width, carry_out)]
 
 '''
 Given bit vector, create variables and assign their bit values accordingly
 '''
-def create_constant_vec(next_free_var, vec):
+def create_constant_vec(next_free_var, vec, store = None):
+  store = ensure_store(store)
+  start = store.mark()
   out_vars = []
-  cnf = []
   for i in range(len(vec)):
+    hit = store.lookup(gates.CONST, [], vec[i])
+    if hit is not None:
+      out_vars.append(hit)
+      continue
     out_vars.append(next_free_var)
+    store.gate(gates.CONST, next_free_var, [], vec[i])
     if vec[i] == 0:
-      cnf.append([-next_free_var])
+      store.add_clause([-next_free_var])
     else:
-      cnf.append([next_free_var])
+      store.add_clause([next_free_var])
     next_free_var += 1
-  return next_free_var, Result([], out_vars, cnf)    
+  return next_free_var, Result([], out_vars, store.view(start))    
+
+'''
+Given bit vector, return it as constants (True/False) that the building blocks fold away
+'''
+def constant_vec(vec):
+  return [vec[i] == 1 for i in range(len(vec))]
 
+#
+# TRUTH TABLES
+#
+'''
+Given input literals x and a Boolean function fn with num_outputs output bits, return y = fn(x)
+x[0] and y[0] are the most significant bits.
+fn is a truth table (fn[v] = output value for input value v) or a callable from input value to output value,
+for up to roughly 16 inputs.
+
+Each output bit gets its own minimised CNF over the inputs it actually depends on (see minimise.py),
+outputs that are constant or equal to an input literal need no variable at all.
+Constant inputs are substituted into the table before compiling.
+Compiled tables are cached in memory and on disk under cache_dir (None disables the disk cache),
+keyed by the hash of the truth table.
+'''
+def boolean_function(next_free_var, x, fn, num_outputs, store = None, cache_dir = TABLE_CACHE_DIR):
+  store = ensure_store(store)
+  start = store.mark()
+  n = len(x)
+  table = truth_table(fn, n)
+  free = [i for i in range(n) if not is_const(x[i])]
+  if len(free) < n:
+    fixed = 0
+    for i in range(n):
+      if x[i] is True:
+        fixed |= 1 << (n-1-i)
+    sub_table = []
+    for v in range(1 << len(free)):
+      value = fixed
+      for k in range(len(free)):
+        if (v >> (len(free)-1-k)) & 1:
+          value |= 1 << (n-1-free[k])
+      sub_table.append(table[value])
+    table = sub_table
+  lits = [x[i] for i in free]
+  out_vars = []
+  for j, o in enumerate(compile_table_cached(table, len(lits), num_outputs, cache_dir)):
+    if is_const(o):
+      out_vars.append(o)
+    elif isinstance(o, tuple):
+      out_vars.append(lits[o[1]] if o[2] else neg(lits[o[1]]))
+    else:
+      column = gates.table_column(table, num_outputs, j) if store.netlist is not None or store.strash else 0
+      hit = store.lookup(gates.TABLE, lits, column)
+      if hit is not None:
+        out_vars.append(hit)
+        continue
+      y = next_free_var
+      next_free_var += 1
+      store.gate(gates.TABLE, y, lits, column)
+      local = [None] + lits + [y] * num_outputs
+      store.add_clauses([[local[v] if v > 0 else neg(local[-v]) for v in clause] for clause in o])
+      out_vars.append(y)
+  return next_free_var, Result(x, out_vars, store.view(start))
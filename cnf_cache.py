@@ -0,0 +1,129 @@
+import hashlib
+import inspect
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from cnf_base import *
+import minimise
+
+'''
+On-disk cache of compiled cipher CNFs
+
+cached_setup(cipher, **options) returns the same (next_free_var, Result) as cipher.setup(ClauseStore(**options)),
+but the first call writes the clauses to a cache file and later calls (from any process) memory map it instead of
+running the generator again. The file is mapped read-only, so worker processes loading the same CNF share its pages.
+
+The cache key is the cipher class, its constructor attributes (e.g. N), the ClauseStore encoding options,
+the byte order and a hash of the source of the cipher's module and every module of this directory it imports,
+directly or through others (cnf_base.py, minimise.py, netlist.py, feal_ref.py, testvec.py, ...),
+so editing any of them invalidates the old files.
+
+File layout (native byte order):
+  MAGIC, header length (uint64), JSON header padded to 8 bytes,
+  clause lits (int32), clause offsets (int64), xor lits (int32), xor offsets (int64), each padded to 8 bytes
+The header holds next_free_var, in_vars, out_vars and the length of each section.
+Only the Result is cached: attributes the cipher sets during setup (e.g. FEAL_NX.state) are not restored.
+'''
+
+MAGIC = b"CNFCACHE"
+CNF_CACHE_DIR = os.path.join(minimise.TABLE_CACHE_DIR, "cnf")
+
+def source_hash(modules):
+  h = hashlib.sha256()
+  for module in modules:
+    with open(inspect.getsourcefile(module), 'rb') as f:
+      h.update(f.read())
+  return h.hexdigest()
+
+'''
+The module of cipher and every module from the same directory as cnf_base.py that it reaches through its globals
+(imported modules, and the modules of imported functions and classes), sorted by name
+'''
+def source_modules(cipher):
+  repo_dir = os.path.dirname(os.path.abspath(inspect.getsourcefile(sys.modules["cnf_base"])))
+  def in_repo(module):
+    fname = getattr(module, "__file__", None)
+    return fname is not None and os.path.dirname(os.path.abspath(fname)) == repo_dir
+  found = dict()
+  work = [sys.modules[type(cipher).__module__]]
+  while len(work) > 0:
+    module = work.pop()
+    if module.__name__ in found or not in_repo(module):
+      continue
+    found[module.__name__] = module
+    for value in list(vars(module).values()):
+      work.append(value if inspect.ismodule(value) else sys.modules.get(getattr(value, "__module__", None) or ""))
+    work = [m for m in work if m is not None]
+  return [found[name] for name in sorted(found)]
+
+def cache_key(cipher, options):
+  modules = source_modules(cipher)
+  params = {"cipher" : type(cipher).__name__,
+            "attributes" : vars(cipher),
+            "options" : options,
+            "byteorder" : sys.byteorder,
+            "source" : source_hash(modules)}
+  return hashlib.sha256(json.dumps(params, sort_keys = True, default = repr).encode()).hexdigest()
+
+def padding(n):
+  return b"\0" * (-n % 8)
+
+def write_cache(fname, next_free_var, res, store):
+  sections = [store.clauses.lits, store.clauses.offsets, store.xors.lits, store.xors.offsets]
+  header = json.dumps({"next_free_var" : next_free_var,
+                       "in_vars" : res.in_vars,
+                       "out_vars" : res.out_vars,
+                       "lengths" : [len(a) for a in sections]}).encode()
+  header += b" " * (-len(header) % 8)
+  cache_dir = os.path.dirname(fname)
+  os.makedirs(cache_dir, exist_ok = True)
+  fd, tmp = tempfile.mkstemp(dir = cache_dir)
+  with os.fdopen(fd, 'wb') as f:
+    f.write(MAGIC)
+    f.write(struct.pack("<Q", len(header)))
+    f.write(header)
+    for a in sections:
+      f.write(a)
+      f.write(padding(len(a) * a.itemsize))
+  os.replace(tmp, fname)
+
+'''
+Memory map a cache file
+Returns next_free_var, Result with res.cnf a view over a ClauseStore(**options) backed by the mapping
+'''
+def load_cache(fname, options):
+  with open(fname, 'rb') as f:
+    buf = memoryview(mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ))
+  assert(buf[:len(MAGIC)] == MAGIC)
+  pos = len(MAGIC) + 8
+  header_len = struct.unpack("<Q", buf[len(MAGIC):pos])[0]
+  header = json.loads(bytes(buf[pos:pos+header_len]))
+  pos += header_len
+  sections = []
+  for length, fmt in zip(header["lengths"], ['i', 'q', 'i', 'q']):
+    size = length * struct.calcsize(fmt)
+    sections.append(buf[pos:pos+size].cast(fmt))
+    pos += size + len(padding(size))
+  store = ClauseStore(**options)
+  store.clauses = ClauseTable(sections[0], sections[1])
+  store.xors = ClauseTable(sections[2], sections[3])
+  return header["next_free_var"], Result(header["in_vars"], header["out_vars"], store.view())
+
+'''
+cipher.setup(ClauseStore(**options)) through the cache in cache_dir
+cipher must not have been set up yet (its attributes are part of the key)
+Only clauses are cached, so netlist = True is not supported
+'''
+def cached_setup(cipher, cache_dir = CNF_CACHE_DIR, **options):
+  assert(not options.get("netlist", False))
+  options = ClauseStore(**options).options()
+  fname = os.path.join(cache_dir, "cnf-" + cache_key(cipher, options) + ".bin")
+  if not os.path.exists(fname):
+    store = ClauseStore(**options)
+    next_free_var, res = cipher.setup(store)
+    write_cache(fname, next_free_var, res, store)
+  return load_cache(fname, options)
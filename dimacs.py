@@ -0,0 +1,178 @@
+import gzip
+import lzma
+import shutil
+import tempfile
+
+'''
+Clause sinks for ClauseStore
+
+A sink receives the flat, zero terminated literal buffer of a ClauseStore in chunks through
+write_clauses(lits) and is told the final variable and clause counts through close(num_vars, num_clauses).
+'''
+
+COMPRESSORS = {None : None,
+               'gzip' : gzip,
+               'xz' : lzma}
+COMPRESS_OPTIONS = {'gzip' : {'compresslevel' : 6},
+                    'xz' : {'preset' : 6}}
+
+def compression_from_name(fname):
+  if fname.endswith(".gz"):
+    return 'gzip'
+  if fname.endswith(".xz"):
+    return 'xz'
+  return None
+
+'''
+Render a flat zero terminated literal buffer as DIMACS clause lines
+'''
+def dimacs_lines(lits):
+  if len(lits) == 0:
+    return ""
+  text = " ".join(map(str, lits)) + "\n"
+  return text.replace(" 0 ", " 0\n")
+
+'''
+Render a flat zero terminated buffer of XOR constraints as "x" lines (CryptoMiniSat's DIMACS extension)
+'''
+def xor_lines(lits):
+  lines = dimacs_lines(lits)
+  if len(lines) == 0:
+    return ""
+  return "x" + lines[:-1].replace("\n", "\nx") + "\n"
+
+'''
+Write clauses as DIMACS CNF to a path or a file object
+(text mode when uncompressed, binary mode when compressed)
+
+The "p cnf" header is only known once the last clause has been written:
+* Plain seekable outputs get a fixed width placeholder header that is patched in place by close()
+* Compressed or non-seekable outputs spool the (compressed) body to a temporary file,
+  and close() writes the header followed by the spooled body.
+  gzip and xz both allow concatenated streams, so the result is a single valid compressed file.
+compression = None, 'gzip' or 'xz' (guessed from the file name if a path ending in .gz/.xz is given)
+'''
+class DimacsSink:
+  HEADER_WIDTH = 64
+
+  def __init__(self, f, compression = None):
+    if isinstance(f, str):
+      if compression is None:
+        compression = compression_from_name(f)
+      self.fout = open(f, 'wb' if compression else 'w')
+      self.owns_file = True
+    else:
+      self.fout = f
+      self.owns_file = False
+    assert(compression in COMPRESSORS)
+    self.compression = compression
+    self.closed = False
+    self.header_pos = None
+    if compression is not None:
+      self.spool = tempfile.TemporaryFile()
+      self.body = COMPRESSORS[compression].open(self.spool, 'wt', **COMPRESS_OPTIONS[compression])
+    elif hasattr(self.fout, "seekable") and self.fout.seekable():
+      self.header_pos = self.fout.tell()
+      self.fout.write(" " * (self.HEADER_WIDTH - 1) + "\n")
+      self.spool = None
+      self.body = self.fout
+    else:
+      self.spool = tempfile.TemporaryFile('w+')
+      self.body = self.spool
+
+  def write_clauses(self, lits):
+    self.body.write(dimacs_lines(lits))
+
+  def write_xors(self, lits):
+    self.body.write(xor_lines(lits))
+
+  def close(self, num_vars, num_clauses):
+    if self.closed:
+      return
+    self.closed = True
+    header = "p cnf {0} {1}".format(num_vars, num_clauses)
+    if self.header_pos is not None:
+      assert(len(header) < self.HEADER_WIDTH)
+      end = self.fout.tell()
+      self.fout.seek(self.header_pos)
+      self.fout.write(header.ljust(self.HEADER_WIDTH - 1))
+      self.fout.seek(end)
+    elif self.compression is None:
+      self.fout.write(header + "\n")
+      self.spool.seek(0)
+      shutil.copyfileobj(self.spool, self.fout)
+      self.spool.close()
+    else:
+      self.body.close()
+      self.fout.write(COMPRESSORS[self.compression].compress((header + "\n").encode(), **COMPRESS_OPTIONS[self.compression]))
+      self.spool.seek(0)
+      shutil.copyfileobj(self.spool, self.fout)
+      self.spool.close()
+    self.fout.flush()
+    if self.owns_file:
+      self.fout.close()
+
+'''
+Hand every flushed chunk to a callable, e.g. Solver.add_clauses or the send() of a generator
+Chunks of XOR constraints go to xor_callback
+'''
+class CallbackSink:
+  def __init__(self, callback, xor_callback = None):
+    self.callback = callback
+    self.xor_callback = xor_callback
+
+  def write_clauses(self, lits):
+    self.callback(lits)
+
+  def write_xors(self, lits):
+    assert(self.xor_callback is not None)
+    self.xor_callback(lits)
+
+  def close(self, num_vars, num_clauses):
+    pass
+
+def as_sink(sink):
+  if hasattr(sink, "write_clauses"):
+    return sink
+  if hasattr(sink, "write"):
+    return DimacsSink(sink)
+  assert(callable(sink))
+  return CallbackSink(sink)
+
+'''
+Read a (possibly gzip/xz compressed) DIMACS CNF file
+Returns [num_vars, clauses, xors] where xors holds the "x" lines
+'''
+def read_dimacs(fname):
+  opener = COMPRESSORS[compression_from_name(fname)]
+  fin = open(fname, 'r') if opener is None else opener.open(fname, 'rt')
+  with fin:
+    return parse_dimacs(fin)
+
+'''
+Parse DIMACS CNF from an iterable of lines (an open text file, sys.stdin, ...), as read_dimacs
+'''
+def parse_dimacs(fin):
+  num_vars = None
+  clauses = []
+  xors = []
+  clause = []
+  target = clauses
+  for line in fin:
+    if line.startswith("c"):
+      continue
+    if line.startswith("p"):
+      num_vars = int(line.split()[2])
+      continue
+    if line.startswith("x"):
+      target = xors
+      line = line[1:]
+    for tok in line.split():
+      lit = int(tok)
+      if lit == 0:
+        target.append(clause)
+        clause = []
+        target = clauses
+      else:
+        clause.append(lit)
+  return num_vars, clauses, xors
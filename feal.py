@@ -1,50 +1,121 @@
 from cnf_base import *
+import feal_ref
+from testvec import dot, unpack_bits
 
 class FEAL_NX:
   # N = number of rounds (must be even)
   # key length = 128
-  def __init__(self, N):
+  # key = None: the key is 128 variables (in_vars = [key vars, plaintext vars])
+  # key = 16 bytes: known key mode, the round keys are computed by feal_ref and enter the CNF as constants,
+  #   so the key schedule costs nothing and the data path folds around them (in_vars = [plaintext vars])
+  def __init__(self, N, key = None):
     assert(N % 2 == 0)
+    assert(key is None or len(key) == 16)
     self.N = N
-    self.init_keys = [i for i in range(1, 128+1)]
-    self.plaintext = [128+i for i in range(1, 64+1)]
+    self.key = None if key is None else bytes(key)
+    self.init_keys = [i for i in range(1, 128+1)] if key is None else []
+    self.plaintext = [len(self.init_keys)+i for i in range(1, 64+1)]
   
-  def setup(self):
-    cnf = []
-    nfv = 128+64+1
+  def setup(self, store = None):
+    nfv, res, pairs = self.setup_multi(1, store)
+    return nfv, res
+
+  '''
+  Only the part of the cipher that some of its bits depend on, for attacks that constrain just those
+  targets(cipher) gives the literals after the whole cipher is built, e.g.
+  lambda c: c.ciphertext[:8] (a ciphertext byte), lambda c: c.state[r] (the state after round r),
+  lambda c: c.B[i] (a key schedule word) or lambda c: c.keys[i] (a round key)
+  The cipher is built into a scratch store with a netlist and sliced to the cone of influence of the targets
+  (see slice_cone), so variable numbers are the same as in setup().
+  With polarity = True the targets must be literals that are only required true (e.g. the ciphertext bits
+  as dot(ciphertext, c.ciphertext)), and gates needed with one polarity keep half their clauses.
+  Returns next_free_var, Result(in_vars as in setup(), target literals, cnf)
+  '''
+  def setup_cone(self, targets, store = None, polarity = False):
+    store = ensure_store(store)
+    scratch = ClauseStore(netlist = True, **store.options())
+    nfv, res = self.setup(scratch)
+    cone_res = slice_cone(scratch, targets(self), store, polarity)
+    return nfv, Result(res.in_vars, cone_res.out_vars, cone_res.cnf)
+
+  '''
+  num_pairs encryptions under the same key, for known plaintext attacks with several (PT, CT) pairs
+  The key schedule is encoded once and every pair reuses its round key variables.
+  Variables: key 1..128 (unless the key is known), then 64 plaintext variables per pair.
+  Returns next_free_var, Result([key vars, plaintext vars of every pair], [ciphertext vars of every pair], cnf),
+  and one Result([key vars, plaintext vars], ciphertext vars, the pair's own clauses) per pair
+  '''
+  def setup_multi(self, num_pairs, store = None):
+    assert(num_pairs >= 1)
+    store = ensure_store(store)
+    start = store.mark()
+    num_key_vars = len(self.init_keys)
+    self.plaintexts = [[num_key_vars+64*p+i for i in range(1, 64+1)] for p in range(num_pairs)]
+    nfv = num_key_vars+64*num_pairs+1
 
     # Key schedule
-    nfv, key_schedule_res = self.key_schedule(nfv)
-    cnf += key_schedule_res.cnf
+    nfv, key_schedule_res = self.key_schedule(nfv, store)
+
+    nfv, pairs = self.encrypt_pairs(nfv, store)
+    return nfv, Result(self.init_keys + sum(self.plaintexts, []), sum(self.ciphertexts, []), store.view(start)), pairs
+
+  '''
+  Encode pre-processing, the N rounds and post-processing for every plaintext in self.plaintexts,
+  on the round keys of the key schedule built so far
+  Returns next_free_var and one Result([key vars, plaintext vars], ciphertext vars, cnf) per pair
+  '''
+  def encrypt_pairs(self, nfv, store):
+    pairs = []
+    for plaintext in self.plaintexts:
+      pair_start = store.mark()
+      self.plaintext = plaintext
+
+      # Pre-processing
+      nfv, pre_state = self.preprocess(nfv, store)
 
-    # Pre-processing
-    nfv, pre_state = self.preprocess(nfv)
-    cnf += pre_state.cnf
+      # Perform rounds
+      self.state = [pre_state.out_vars]
+      for r in range(1, self.N+1):
+        nfv, res = self.one_round(nfv, r, store)
 
-    # Perform rounds
-    self.state = [pre_state.out_vars]
-    for r in range(1, self.N+1):
-      nfv, res = self.one_round(nfv, r)
-      cnf += res.cnf
+      # Post-processing
+      nfv, post_state = self.postprocess(nfv, store)
+      self.ciphertext = post_state.out_vars
+      pairs.append(Result(self.init_keys + plaintext, self.ciphertext, store.view(pair_start)))
 
-    # Post-processing
-    nfv, post_state = self.postprocess(nfv)
-    self.ciphertext = post_state.out_vars
-    cnf += post_state.cnf
+    self.ciphertexts = [pair.out_vars for pair in pairs]
+    return nfv, pairs
 
-    return nfv, Result(self.init_keys + self.plaintext, self.ciphertext, cnf)
+  '''
+  Grow a set up instance (setup or setup_multi, same store) from N to N + rounds rounds, for reduced round sweeps
+  Only the key schedule carries over: its steps do not depend on N, so just the missing ones are added.
+  Pre-processing whitens the plaintext with the round keys K_N..K_{N+3}, so every round state depends on N
+  and the rounds are encoded again for the new N, on the same key and plaintext variables.
+  The encodings for the smaller N stay in the store; they are functions of key and plaintext,
+  so they do not change the solutions for the new ciphertext variables.
+  Returns the same as setup_multi, with cnf = only the clauses added now (e.g. to add to a solver holding the old ones)
+  '''
+  def extend(self, nfv, rounds, store):
+    assert(rounds > 0 and rounds % 2 == 0)
+    start = store.mark()
+    self.N += rounds
+    nfv, steps_res = self.key_schedule_steps(nfv, rounds//2, store)
+    nfv, pairs = self.encrypt_pairs(nfv, store)
+    return nfv, Result(self.init_keys + sum(self.plaintexts, []), sum(self.ciphertexts, []), store.view(start)), pairs
     
-  def s0(self, nfv, x1, x2):
-    nfv, add_res = modular_addition(nfv, 8, x1, x2)
-    nfv, rot_res = rotate_left_by_k(nfv, 8, add_res.out_vars, 2)
-    return nfv, Result(x1 + x2, rot_res.out_vars, add_res.cnf + rot_res.cnf)
+  def s0(self, nfv, x1, x2, store):
+    start = store.mark()
+    nfv, add_res = modular_addition(nfv, 8, x1, x2, store)
+    nfv, rot_res = rotate_left_by_k(nfv, 8, add_res.out_vars, 2, store)
+    return nfv, Result(x1 + x2, rot_res.out_vars, store.view(start))
   
-  def s1(self, nfv, x1, x2):
-    nfv, one_res = create_constant_vec(nfv, [0,0,0,0,0,0,0,1])
-    nfv, add_res = modular_addition(nfv, 8, x1, x2)
-    nfv, add2_res = modular_addition(nfv, 8, add_res.out_vars, one_res.out_vars)
-    nfv, rot_res = rotate_left_by_k(nfv, 8, add2_res.out_vars, 2)
-    return nfv, Result(x1 + x2, rot_res.out_vars, one_res.cnf + add_res.cnf + add2_res.cnf + rot_res.cnf)
+  def s1(self, nfv, x1, x2, store):
+    start = store.mark()
+    one = constant_vec([0,0,0,0,0,0,0,1])
+    nfv, add_res = modular_addition(nfv, 8, x1, x2, store)
+    nfv, add2_res = modular_addition(nfv, 8, add_res.out_vars, one, store)
+    nfv, rot_res = rotate_left_by_k(nfv, 8, add2_res.out_vars, 2, store)
+    return nfv, Result(x1 + x2, rot_res.out_vars, store.view(start))
   
   '''
   a = (a0, a1, a2, a3), b = (b0, b1), f = (f0, f1, f2, f3)
@@ -57,26 +128,27 @@ class FEAL_NX:
   res7 : f0 = s0(a0, f1)
   res8 : f3 = s1(a3, f2)
   '''
-  def f(self, nfv, alpha, beta):
+  def f(self, nfv, alpha, beta, store):
     assert(len(alpha) == 4*8)
     assert(len(beta) == 2*8)
+    start = store.mark()
     a0 = alpha[0*8:1*8]
     a1 = alpha[1*8:2*8]
     a2 = alpha[2*8:3*8]
     a3 = alpha[3*8:4*8]
     b0 = beta[0*8:1*8]
     b1 = beta[1*8:2*8]
-    nfv, res1 = word_xor(nfv, a1, b0)
-    nfv, res2 = word_xor(nfv, a2, b1)
-    nfv, res3 = word_xor(nfv, res1.out_vars, a0)
-    nfv, res4 = word_xor(nfv, res2.out_vars, a3)
-    nfv, res5 = self.s1(nfv, res3.out_vars, res4.out_vars)
-    nfv, res6 = self.s0(nfv, res4.out_vars, res5.out_vars)
-    nfv, res7 = self.s0(nfv, a0, res5.out_vars)
-    nfv, res8 = self.s1(nfv, a3, res6.out_vars)
+    nfv, res1 = word_xor(nfv, a1, b0, store)
+    nfv, res2 = word_xor(nfv, a2, b1, store)
+    nfv, res3 = word_xor(nfv, res1.out_vars, a0, store)
+    nfv, res4 = word_xor(nfv, res2.out_vars, a3, store)
+    nfv, res5 = self.s1(nfv, res3.out_vars, res4.out_vars, store)
+    nfv, res6 = self.s0(nfv, res4.out_vars, res5.out_vars, store)
+    nfv, res7 = self.s0(nfv, a0, res5.out_vars, store)
+    nfv, res8 = self.s1(nfv, a3, res6.out_vars, store)
     return nfv, Result(alpha + beta,
                        res7.out_vars + res5.out_vars + res6.out_vars + res8.out_vars,
-                       res1.cnf + res2.cnf + res3.cnf + res4.cnf + res5.cnf + res6.cnf + res7.cnf + res8.cnf)
+                       store.view(start))
   
   '''
   a = (a0, a1, a2, a3), b = (b0, b1, b2, b3), fk = (fk0, fk1, fk2, fk3)
@@ -87,9 +159,10 @@ class FEAL_NX:
   res5 : fk0 = s0(a0, (fk1 xor b2))
   res6 : fk3 = s1(a3, (fk2 xor b3))
   '''
-  def fk(self, nfv, alpha, beta):
+  def fk(self, nfv, alpha, beta, store):
     assert(len(alpha) == 4*8)
     assert(len(beta) == 4*8)
+    start = store.mark()
     a0 = alpha[0*8:1*8]
     a1 = alpha[1*8:2*8]
     a2 = alpha[2*8:3*8]
@@ -98,24 +171,28 @@ class FEAL_NX:
     b1 = beta[1*8:2*8]
     b2 = beta[2*8:3*8]
     b3 = beta[3*8:4*8]
-    nfv, res1 = word_xor(nfv, a1, a0)
-    nfv, res2 = word_xor(nfv, a2, a3)
-    nfv, res3_right = word_xor(nfv, res2.out_vars, b0)
-    nfv, res3 = self.s1(nfv, res1.out_vars, res3_right.out_vars)
-    nfv, res4_right = word_xor(nfv, res3.out_vars, b1)
-    nfv, res4 = self.s0(nfv, res2.out_vars, res4_right.out_vars)
-    nfv, res5_right = word_xor(nfv, res3.out_vars, b2)
-    nfv, res5 = self.s0(nfv, a0, res5_right.out_vars)
-    nfv, res6_right = word_xor(nfv, res4.out_vars, b3)
-    nfv, res6 = self.s1(nfv, a3, res6_right.out_vars)
+    nfv, res1 = word_xor(nfv, a1, a0, store)
+    nfv, res2 = word_xor(nfv, a2, a3, store)
+    nfv, res3_right = word_xor(nfv, res2.out_vars, b0, store)
+    nfv, res3 = self.s1(nfv, res1.out_vars, res3_right.out_vars, store)
+    nfv, res4_right = word_xor(nfv, res3.out_vars, b1, store)
+    nfv, res4 = self.s0(nfv, res2.out_vars, res4_right.out_vars, store)
+    nfv, res5_right = word_xor(nfv, res3.out_vars, b2, store)
+    nfv, res5 = self.s0(nfv, a0, res5_right.out_vars, store)
+    nfv, res6_right = word_xor(nfv, res4.out_vars, b3, store)
+    nfv, res6 = self.s1(nfv, a3, res6_right.out_vars, store)
     return nfv, Result(alpha + beta,
                        res5.out_vars + res3.out_vars + res4.out_vars + res6.out_vars,
-                       res1.cnf + res2.cnf + res3_right.cnf + res3.cnf + res4_right.cnf + res4.cnf + res5_right.cnf + res5.cnf + res6_right.cnf + res6.cnf)
+                       store.view(start))
   
-  def key_schedule(self, nfv):
+  def key_schedule(self, nfv, store):
     assert(self.N % 2 == 0)
+    start = store.mark()
+    if self.key is not None:
+      self.keys = []
+      nfv, steps_res = self.key_schedule_steps(nfv, (self.N//2)+4, store)
+      return nfv, Result([], [], store.view(start))
     assert(len(self.init_keys) == 128)
-    cnf = []
     
     # init_keys = (K_l, K_r) = ((A_0, B_0), (K_r1, K_r2))
     K_l = self.init_keys[0:64]
@@ -124,36 +201,45 @@ class FEAL_NX:
     K_r2 = K_r[32:64]
     
     # Process right key K_r
-    # Q[r] = Q_r
-    nfv, Kr1_xor_Kr2_res = word_xor(nfv, K_r1, K_r2)
-    cnf += Kr1_xor_Kr2_res.cnf
-    Kr1_xor_Kr2 = Kr1_xor_Kr2_res.out_vars
-    Q = [None]
-    for r in range(1, self.N + 1):
-      if r % 3 == 1:
-        Q.append(Kr1_xor_Kr2)
-      elif r % 3 == 2:
-        Q.append(K_r1)
-      elif r % 3 == 0:
-        Q.append(K_r2)
+    # Q[r] = Q_r cycles through K_r1 xor K_r2, K_r1, K_r2 (added by key_schedule_steps)
+    nfv, Kr1_xor_Kr2_res = word_xor(nfv, K_r1, K_r2, store)
+    self.Q_cycle = [Kr1_xor_Kr2_res.out_vars, K_r1, K_r2]
+    self.Q = [None]
   
     # Process left key K_l
     # (A_0, B_0) = K_l
     # A[i] = A_i, B[i] = B_i, D[i] = D_i
-    A = [K_l[0:32]]
-    B = [K_l[32:64]]
-    nfv, d_init = create_constant_vec(nfv, [0]*32)
-    cnf += d_init.cnf
-    D = [d_init.out_vars]
+    self.A = [K_l[0:32]]
+    self.B = [K_l[32:64]]
+    self.D = [constant_vec([0]*32)]
     
     # Compute K_i
     self.keys = []
-    for r in range(1, (self.N//2)+4 + 1):
+    nfv, steps_res = self.key_schedule_steps(nfv, (self.N//2)+4, store)
+    return nfv, Result([], [], store.view(start))
+
+  '''
+  Run num_steps more steps of the key schedule, each appending B_r and two round keys to self.keys
+  '''
+  def key_schedule_steps(self, nfv, num_steps, store):
+    start = store.mark()
+    if self.key is not None:
+      # Known key: round keys as constants, no clauses
+      num_steps += len(self.keys) // 2
+      one = feal_ref.Lanes(1)
+      round_keys = feal_ref.key_schedule(one, 2*(num_steps-4), list(self.key))
+      self.keys = [[b == 1 for b in unpack_bits(bytes(k))] for k in round_keys]
+      return nfv, Result([], [], store.view(start))
+    Q = self.Q
+    A = self.A
+    B = self.B
+    D = self.D
+    for r in range(len(Q), len(Q) + num_steps):
+      Q.append(self.Q_cycle[(r-1) % 3])
       D.append(A[r-1])
       A.append(B[r-1])
-      nfv, Br_r = word_xor(nfv, B[r-1], D[r-1])
-      nfv, Br_r2 = word_xor(nfv, Br_r.out_vars, Q[r])
-      nfv, Br_res = self.fk(nfv, A[r-1], Br_r2.out_vars)
+      template = store.template("FEAL_NX.key_step", self.key_step, 4*32)
+      nfv, Br_res = template.instantiate(nfv, A[r-1] + B[r-1] + D[r-1] + Q[r], store)
       B.append(Br_res.out_vars)
       Br0 = Br_res.out_vars[0:8]
       Br1 = Br_res.out_vars[8:16]
@@ -161,49 +247,71 @@ class FEAL_NX:
       Br3 = Br_res.out_vars[24:32]
       self.keys.append(Br0 + Br1)
       self.keys.append(Br2 + Br3)
-      cnf += Br_r.cnf
-      cnf += Br_r2.cnf
-      cnf += Br_res.cnf
-
-    self.Q = Q
-    self.A = A
-    self.B = B
-    self.D = D
-    return nfv, Result([], [], cnf)
+    return nfv, Result([], [], store.view(start))
+
+  '''
+  B_r = fk(A_{r-1}, B_{r-1} xor D_{r-1} xor Q_r), over x = A_{r-1} + B_{r-1} + D_{r-1} + Q_r
+  '''
+  def key_step(self, nfv, x, store):
+    start = store.mark()
+    nfv, Br_r = word_xor(nfv, x[32:64], x[64:96], store)
+    nfv, Br_r2 = word_xor(nfv, Br_r.out_vars, x[96:128], store)
+    nfv, Br_res = self.fk(nfv, x[0:32], Br_r2.out_vars, store)
+    return nfv, Result(x, Br_res.out_vars, store.view(start))
     
-  def preprocess(self, nfv):
+  def preprocess(self, nfv, store):
     assert(self.N % 2 == 0)
     assert(len(self.plaintext) == 64)
     assert(len(self.keys) == self.N + 8)
-    nfv, res = word_xor(nfv, self.plaintext, self.keys[self.N] + self.keys[self.N+1] + self.keys[self.N+2] + self.keys[self.N+3])
-    nfv, zeroes = create_constant_vec(nfv, [0]*32)
+    start = store.mark()
+    nfv, res = word_xor(nfv, self.plaintext, self.keys[self.N] + self.keys[self.N+1] + self.keys[self.N+2] + self.keys[self.N+3], store)
+    zeroes = constant_vec([0]*32)
     lhs = res.out_vars
-    rhs = zeroes.out_vars + res.out_vars[0:32]
-    nfv, res2 = word_xor(nfv, lhs, rhs)
-    return nfv, Result([], res2.out_vars, res.cnf + zeroes.cnf + res2.cnf)
+    rhs = zeroes + res.out_vars[0:32]
+    nfv, res2 = word_xor(nfv, lhs, rhs, store)
+    return nfv, Result([], res2.out_vars, store.view(start))
   
-  def one_round(self, nfv, r):
+  def one_round(self, nfv, r, store):
+    start = store.mark()
     prev = self.state[r-1]
-    prev_l = prev[0:32]
     prev_r = prev[32:64]
     round_key = self.keys[r-1]
     cur_l = prev_r
-    nfv, rr = self.f(nfv, prev_r, round_key)
-    nfv, r = word_xor(nfv, prev_l, rr.out_vars)
-    cur_r = r.out_vars
+    template = store.template("FEAL_NX.round_function", self.round_function, 64+16)
+    nfv, rr = template.instantiate(nfv, prev + round_key, store)
+    cur_r = rr.out_vars
     self.state.append(cur_l + cur_r)
-    return nfv, Result([], [], rr.cnf + r.cnf)
+    return nfv, Result([], [], store.view(start))
+
+  '''
+  R_r = L_{r-1} xor f(R_{r-1}, K_{r-1}), over x = L_{r-1} + R_{r-1} + K_{r-1}
+  '''
+  def round_function(self, nfv, x, store):
+    start = store.mark()
+    nfv, rr = self.f(nfv, x[32:64], x[64:80], store)
+    nfv, r = word_xor(nfv, x[0:32], rr.out_vars, store)
+    return nfv, Result(x, r.out_vars, store.view(start))
 
-  def postprocess(self, nfv):
+  def postprocess(self, nfv, store):
     assert(len(self.keys) == self.N + 8)
+    start = store.mark()
     l_n = self.state[-1][:32]
     r_n = self.state[-1][32:]
-    nfv, zeroes = create_constant_vec(nfv, [0]*32)
+    zeroes = constant_vec([0]*32)
     lhs = r_n + l_n
-    rhs = zeroes.out_vars + r_n
-    nfv, res = word_xor(nfv, lhs, rhs)
+    rhs = zeroes + r_n
+    nfv, res = word_xor(nfv, lhs, rhs, store)
     lhs2 = res.out_vars
     rhs2 = self.keys[self.N+4] + self.keys[self.N+5] + self.keys[self.N+6] + self.keys[self.N+7]
-    nfv, res2 = word_xor(nfv, lhs2, rhs2)
-    return nfv, Result([], res2.out_vars, zeroes.cnf + res.cnf + res2.cnf)
+    nfv, res2 = word_xor(nfv, lhs2, rhs2, store)
+    return nfv, Result([], res2.out_vars, store.view(start))
 
+'''
+Solver assumptions for known (plaintext, ciphertext) pairs (8 byte blocks), one per pair Result of setup_multi
+'''
+def pair_assumptions(pairs, pair_res):
+  assert(len(pairs) == len(pair_res))
+  assumptions = []
+  for (pt, ct), r in zip(pairs, pair_res):
+    assumptions += dot(unpack_bits(pt), r.in_vars[-64:]) + dot(unpack_bits(ct), r.out_vars)
+  return assumptions
@@ -0,0 +1,196 @@
+import random
+import sys
+
+from testvec import group_by_key
+
+'''
+Reference (solver-free) FEAL-NX, encrypting whole batches of blocks at once
+
+A batch of B blocks is bit-sliced by byte: byte j of every block is packed into one Python int
+with block i in bits 8i..8i+7 (a "lane"). The S-box additions are done on all lanes at once with
+SWAR masks, so each step of the cipher is a handful of big int operations however large B is.
+Packing and unpacking are byte slicing (data[j::width]) and int.from_bytes/to_bytes, all in C.
+
+Same byte order and structure as FEAL_NX in feal.py:
+keys are 16 bytes, plaintexts and ciphertexts 8 bytes, a word is a list of 4 byte lanes.
+'''
+
+class Lanes:
+  def __init__(self, num_blocks):
+    self.num_blocks = num_blocks
+    self.ones = int.from_bytes(b"\x01" * num_blocks, "little")
+    self.low7 = 0x7f * self.ones
+    self.high1 = 0x80 * self.ones
+    self.rot_hi = 0xfc * self.ones
+    self.rot_lo = 0x03 * self.ones
+
+  # Constant byte b in every lane
+  def const(self, b):
+    return b * self.ones
+
+  # Bytes b_0 .. b_{B-1} -> lane int
+  def pack(self, column):
+    return int.from_bytes(column, "little")
+
+  def unpack(self, x):
+    return x.to_bytes(self.num_blocks, "little")
+
+  # Lanewise (x + y) mod 256
+  def add(self, x, y):
+    return ((x & self.low7) + (y & self.low7)) ^ ((x ^ y) & self.high1)
+
+  # Lanewise rotate left by 2
+  def rot2(self, x):
+    return ((x << 2) & self.rot_hi) | ((x >> 6) & self.rot_lo)
+
+  def s0(self, x, y):
+    return self.rot2(self.add(x, y))
+
+  def s1(self, x, y):
+    return self.rot2(self.add(self.add(x, y), self.ones))
+
+'''
+f(alpha, beta): alpha = 4 byte lanes, beta = 2 byte lanes (see FEAL_NX.f)
+'''
+def f(lanes, alpha, beta):
+  a0, a1, a2, a3 = alpha
+  b0, b1 = beta
+  f1 = a1 ^ b0 ^ a0
+  f2 = a2 ^ b1 ^ a3
+  f1 = lanes.s1(f1, f2)
+  f2 = lanes.s0(f2, f1)
+  f0 = lanes.s0(a0, f1)
+  f3 = lanes.s1(a3, f2)
+  return [f0, f1, f2, f3]
+
+'''
+fk(alpha, beta): alpha, beta = 4 byte lanes (see FEAL_NX.fk)
+'''
+def fk(lanes, alpha, beta):
+  a0, a1, a2, a3 = alpha
+  b0, b1, b2, b3 = beta
+  fk1 = a1 ^ a0
+  fk2 = a2 ^ a3
+  fk1 = lanes.s1(fk1, fk2 ^ b0)
+  fk2 = lanes.s0(fk2, fk1 ^ b1)
+  fk0 = lanes.s0(a0, fk1 ^ b2)
+  fk3 = lanes.s1(a3, fk2 ^ b3)
+  return [fk0, fk1, fk2, fk3]
+
+def word_xor(x, y):
+  return [a ^ b for a, b in zip(x, y)]
+
+'''
+Round keys K_0 .. K_{N+7} (each 2 byte lanes) from the 16 byte lanes of the key
+'''
+def key_schedule(lanes, N, key):
+  K_l = key[0:8]
+  K_r1 = key[8:12]
+  K_r2 = key[12:16]
+  Q = [None]
+  for r in range(1, N//2+4 + 1):
+    Q.append([word_xor(K_r1, K_r2), K_r1, K_r2][r % 3 - 1])
+  A = K_l[0:4]
+  B = K_l[4:8]
+  D = [0] * 4
+  keys = []
+  for r in range(1, N//2+4 + 1):
+    A, B, D = B, fk(lanes, A, word_xor(word_xor(B, D), Q[r])), A
+    keys.append(B[0:2])
+    keys.append(B[2:4])
+  return keys
+
+'''
+Encrypt the plaintext lanes (8 bytes) under the round keys
+'''
+def encrypt_lanes(lanes, N, keys, plaintext):
+  assert(len(keys) == N + 8)
+  state = word_xor(plaintext, keys[N] + keys[N+1] + keys[N+2] + keys[N+3])
+  L = state[0:4]
+  R = word_xor(state[4:8], L)
+  for r in range(1, N+1):
+    L, R = R, word_xor(L, f(lanes, R, keys[r-1]))
+  out = R + word_xor(L, R)
+  return word_xor(out, keys[N+4] + keys[N+5] + keys[N+6] + keys[N+7])
+
+def pack_blocks(lanes, data, width):
+  assert(len(data) == width * lanes.num_blocks)
+  return [lanes.pack(data[j::width]) for j in range(width)]
+
+def unpack_blocks(lanes, columns):
+  width = len(columns)
+  data = bytearray(width * lanes.num_blocks)
+  for j in range(width):
+    data[j::width] = lanes.unpack(columns[j])
+  return bytes(data)
+
+'''
+FEAL_NX(N) encryption of a batch given as one buffer of 8 byte plaintexts back to back
+key: one 16 byte key for every block, or 16 bytes per block back to back
+Returns the ciphertexts back to back
+'''
+def encrypt_buffer(N, key, data):
+  assert(N % 2 == 0)
+  assert(len(data) % 8 == 0)
+  lanes = Lanes(len(data) // 8)
+  if len(key) == 16:
+    # Same key everywhere: run the key schedule on one lane and broadcast the round keys
+    one = Lanes(1)
+    keys = [[lanes.const(b) for b in k] for k in key_schedule(one, N, list(key))]
+  else:
+    keys = key_schedule(lanes, N, pack_blocks(lanes, key, 16))
+  return unpack_blocks(lanes, encrypt_lanes(lanes, N, keys, pack_blocks(lanes, data, 8)))
+
+'''
+Same as encrypt_buffer, on a list of 8 byte plaintexts (and a 16 byte key or a list of them)
+Returns the list of 8 byte ciphertexts
+'''
+def encrypt(N, key, plaintexts):
+  if not isinstance(key, (bytes, bytearray)):
+    key = b"".join(key)
+  data = encrypt_buffer(N, key, b"".join(plaintexts))
+  return [data[i:i+8] for i in range(0, len(data), 8)]
+
+'''
+num_pairs random (plaintext, ciphertext) pairs under key, for known plaintext attack experiments
+'''
+def random_pairs(N, key, num_pairs, rng = random):
+  plaintexts = [rng.getrandbits(64).to_bytes(8, "big") for i in range(num_pairs)]
+  return list(zip(plaintexts, encrypt(N, key, plaintexts)))
+
+'''
+Write a .tv file (see testvec.py) for the given keys, encrypting plaintexts under each key
+'''
+def write_test_vectors(fname, N, keys, plaintexts, newline = "\r\n"):
+  with open(fname, 'w', newline = "") as fout:
+    for key in keys:
+      fout.write("KEY = {0}{1}".format(key.hex().upper(), newline))
+      for pt, ct in zip(plaintexts, encrypt(N, key, plaintexts)):
+        fout.write("PT: {0},  CT: {1}{2}".format(pt.hex().upper(), ct.hex().upper(), newline))
+      fout.write(newline)
+
+'''
+Check every vector of a .tv file against the reference implementation
+Returns the list of mismatches (key, plaintext, expected ciphertext, computed ciphertext)
+'''
+def check_test_vectors(fname, N):
+  mismatches = []
+  for key, vecs in group_by_key(fname):
+    computed = encrypt(N, key, [pt for pt, ct in vecs])
+    for (pt, ct), c in zip(vecs, computed):
+      if c != ct:
+        mismatches.append((key, pt, ct, c))
+  return mismatches
+
+if __name__ == "__main__":
+  if len(sys.argv) != 5:
+    print("Usage: python3 feal_ref.py <N> <num_keys> <vectors_per_key> <output .tv file>")
+    print("Writes random keys and plaintexts encrypted with FEAL_NX(N)")
+    exit()
+
+  N = int(sys.argv[1])
+  num_keys = int(sys.argv[2])
+  num_vectors = int(sys.argv[3])
+  keys = [random.getrandbits(128).to_bytes(16, "big") for i in range(num_keys)]
+  plaintexts = [random.getrandbits(64).to_bytes(8, "big") for i in range(num_vectors)]
+  write_test_vectors(sys.argv[4], N, keys, plaintexts)
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import tempfile
+
+'''
+Two-level minimisation of Boolean functions into CNF
+
+A function over n inputs with m outputs is given as a truth table:
+table[x] = output value for input x, where bit (n-1-i) of x is input i and bit (m-1-j) of table[x] is output j
+(i.e. the first input/output is the most significant bit, as everywhere else in this repo).
+
+Each output bit j is turned into the CNF of the relation (out_j == f_j(inputs)) restricted to the inputs it depends on.
+The clauses are the prime implicates found by expanding every forbidden point into a maximal cube of forbidden points
+(Espresso style EXPAND), followed by an irredundant cover (each point forbidden by at least one kept clause).
+
+Literals in the compiled CNF use local variable numbers: input i is i+1 and output j is n+j+1.
+'''
+
+TABLE_CACHE_DIR = os.environ.get("CIPHER_ENCODINGS_CACHE",
+                                 os.path.join(os.path.expanduser("~"), ".cache", "cipher_encodings"))
+
+# Hash of this file, part of every cache key: tables compiled by another version of the minimiser are not reused
+with open(os.path.abspath(__file__), 'rb') as f:
+  SOURCE_HASH = hashlib.sha256(f.read()).hexdigest()
+
+def truth_table(fn, num_inputs):
+  if callable(fn):
+    return [fn(x) for x in range(1 << num_inputs)]
+  assert(len(fn) == 1 << num_inputs)
+  return list(fn)
+
+'''
+Inputs (as indices into the input list) that output bit j of table depends on
+'''
+def support(table, num_inputs, bit):
+  sup = []
+  for i in range(num_inputs):
+    flip = 1 << (num_inputs-1-i)
+    for x in range(1 << num_inputs):
+      if x & flip == 0 and (table[x] >> bit) & 1 != (table[x | flip] >> bit) & 1:
+        sup.append(i)
+        break
+  return sup
+
+'''
+Cover the set of forbidden points (ints over num_vars bits, flags in forbidden) by maximal cubes
+Returns a list of cubes (mask of fixed bits, value of fixed bits)
+'''
+def prime_cover(forbidden, num_vars):
+  full = (1 << num_vars) - 1
+  covered = bytearray(len(forbidden))
+  cubes = []
+
+  def points(mask, value):
+    free = full & ~mask
+    sub = free
+    while True:
+      yield value | sub
+      if sub == 0:
+        break
+      sub = (sub - 1) & free
+
+  for p in range(len(forbidden)):
+    if not forbidden[p] or covered[p]:
+      continue
+    mask = full
+    value = p
+    for b in range(num_vars):
+      bit = 1 << b
+      flipped = value ^ bit
+      if all(forbidden[q] for q in points(mask, flipped & mask)):
+        mask &= ~bit
+        value &= mask
+    cubes.append((mask, value))
+    for q in points(mask, value):
+      covered[q] = 1
+
+  # Irredundant cover: drop cubes whose points are all forbidden by other cubes, smallest cubes first
+  count = [0] * len(forbidden)
+  for mask, value in cubes:
+    for q in points(mask, value):
+      count[q] += 1
+  kept = []
+  for mask, value in sorted(cubes, key = lambda c: -bin(c[0]).count("1")):
+    if all(count[q] >= 2 for q in points(mask, value)):
+      for q in points(mask, value):
+        count[q] -= 1
+    else:
+      kept.append((mask, value))
+  return kept
+
+'''
+Minimised CNF of (out == bit `bit` of table) over the inputs in sup (local numbering as above)
+'''
+def minimise_output(table, num_inputs, num_outputs, j, sup):
+  bit = num_outputs-1-j
+  k = len(sup)
+  num_vars = k + 1
+  forbidden = bytearray(1 << num_vars)
+  for x in range(1 << num_inputs):
+    sub = 0
+    fixed = True
+    for i in range(num_inputs):
+      b = (x >> (num_inputs-1-i)) & 1
+      if i in sup:
+        sub = (sub << 1) | b
+      elif b != 0:
+        fixed = False
+    if fixed:
+      out = (table[x] >> bit) & 1
+      forbidden[(sub << 1) | (1 - out)] = 1
+  clauses = []
+  local = [i+1 for i in sup] + [num_inputs+j+1]
+  for mask, value in prime_cover(forbidden, num_vars):
+    clause = []
+    for pos in range(num_vars):
+      b = 1 << (num_vars-1-pos)
+      if mask & b:
+        clause.append(-local[pos] if value & b else local[pos])
+    clauses.append(clause)
+  return clauses
+
+'''
+Compile a truth table into per output bit CNF
+Returns a list with one entry per output: True/False for constant outputs, ('lit', i, sign) for
+outputs equal to input i (negated if sign is False), otherwise the list of clauses
+'''
+def compile_table(table, num_inputs, num_outputs):
+  outputs = []
+  for j in range(num_outputs):
+    bit = num_outputs-1-j
+    sup = support(table, num_inputs, bit)
+    if len(sup) == 0:
+      outputs.append((table[0] >> bit) & 1 == 1)
+    elif len(sup) == 1:
+      i = sup[0]
+      x = 1 << (num_inputs-1-i)
+      outputs.append(('lit', i, (table[x] >> bit) & 1 == 1))
+    else:
+      outputs.append(minimise_output(table, num_inputs, num_outputs, j, sup))
+  return outputs
+
+def table_hash(table, num_inputs, num_outputs):
+  h = hashlib.sha256("{0}\n{1} {2}\n".format(SOURCE_HASH, num_inputs, num_outputs).encode())
+  h.update(",".join(map(str, table)).encode())
+  return h.hexdigest()
+
+compiled_tables = dict()
+
+'''
+compile_table with an in-memory and an on-disk cache keyed by the hash of the truth table and of minimise.py
+cache_dir = None disables the on-disk cache
+'''
+def compile_table_cached(table, num_inputs, num_outputs, cache_dir = TABLE_CACHE_DIR):
+  memo_key = (tuple(table), num_inputs, num_outputs)
+  if memo_key in compiled_tables:
+    return compiled_tables[memo_key]
+  key = table_hash(table, num_inputs, num_outputs)
+  fname = None if cache_dir is None else os.path.join(cache_dir, "table-" + key + ".json")
+  outputs = None
+  if fname is not None and os.path.exists(fname):
+    with open(fname, 'r') as fin:
+      outputs = [tuple(o) if isinstance(o, list) and len(o) > 0 and o[0] == 'lit' else o for o in json.load(fin)]
+  if outputs is None:
+    outputs = compile_table(table, num_inputs, num_outputs)
+    if fname is not None:
+      os.makedirs(cache_dir, exist_ok = True)
+      fd, tmp = tempfile.mkstemp(dir = cache_dir)
+      with os.fdopen(fd, 'w') as fout:
+        json.dump(outputs, fout)
+      os.replace(tmp, fname)
+  compiled_tables[memo_key] = outputs
+  return outputs
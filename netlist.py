@@ -0,0 +1,283 @@
+from array import array
+
+'''
+Gate netlist recorded by the building blocks (ClauseStore(netlist = True))
+
+Every variable a building block defines is the output of one gate over earlier literals,
+so the gates come out in topological order. Gates are kept flat, like the clauses in ClauseTable:
+  ops[i]       opcode of gate i (EQ, XOR, ...)
+  outs[i]      output variable of gate i
+  starts[i]    position in operands where the operand literals of gate i start
+  params[i]    TABLE: index into tables, CONST: the value, otherwise 0
+Operands are literals (negative = negated input), never constants, since the building blocks fold those away.
+
+A TABLE gate (one output bit of boolean_function) with k operands has tables[param] = an int with
+bit v set iff the output is 1 for operand value v (first operand = most significant bit).
+
+Variables that appear as operands but are no gate's output are the primary inputs.
+'''
+
+EQ = 0
+XOR = 1
+AND = 2
+OR = 3
+XOR3 = 4
+MAJ = 5
+TABLE = 6
+CONST = 7
+
+OP_NAMES = ["EQ", "XOR", "AND", "OR", "XOR3", "MAJ", "TABLE", "CONST"]
+
+class Netlist:
+  def __init__(self):
+    self.ops = array('b')
+    self.outs = array('i')
+    self.starts = array('q')
+    self.operands = array('i')
+    self.params = array('q')
+    self.tables = []
+    self.table_ids = dict()
+
+  def __len__(self):
+    return len(self.ops)
+
+  def add(self, op, out, ins, param = 0):
+    self.ops.append(op)
+    self.outs.append(out)
+    self.starts.append(len(self.operands))
+    self.operands.extend(ins)
+    self.params.append(param)
+
+  # Index of truth table column t (int, see above), shared by every gate using it
+  def table_id(self, t):
+    if t not in self.table_ids:
+      self.table_ids[t] = len(self.tables)
+      self.tables.append(t)
+    return self.table_ids[t]
+
+  # Append the gates of netlist other with every literal x renamed to relabel[x + offset] (see cnf_base.Template)
+  def relocate(self, other, relabel, offset):
+    base = len(self.operands)
+    lookup = relabel.__getitem__
+    self.ops.extend(other.ops)
+    self.outs.extend(map(lookup, map(offset.__add__, other.outs)))
+    self.starts.extend(map(base.__add__, other.starts))
+    self.operands.extend(map(lookup, map(offset.__add__, other.operands)))
+    ids = [self.table_id(t) for t in other.tables]
+    self.params.extend(ids[p] if op == TABLE else p for op, p in zip(other.ops, other.params))
+
+  # Append gate i of netlist other as it is
+  def copy_gate(self, other, i):
+    op = other.ops[i]
+    param = other.params[i]
+    self.add(op, other.outs[i], other.gate_operands(i), self.table_id(other.tables[param]) if op == TABLE else param)
+
+  def gate_operands(self, i):
+    end = self.starts[i+1] if i+1 < len(self.starts) else len(self.operands)
+    return self.operands[self.starts[i]:end]
+
+  # (op name, output, operand literals, param) of gate i
+  def gate(self, i):
+    return OP_NAMES[self.ops[i]], self.outs[i], self.gate_operands(i).tolist(), self.params[i]
+
+  def max_var(self):
+    return max(max(self.outs, default = 0), max(map(abs, self.operands), default = 0))
+
+  def inputs(self):
+    return sorted(set(map(abs, self.operands)) - set(self.outs))
+
+'''
+Cone of influence of the literals lits (constants are skipped):
+the set of variables they depend on through the gates, themselves and the primary inputs included
+'''
+def cone(netlist, lits):
+  gate_of = {v : i for i, v in enumerate(netlist.outs)}
+  seen = set()
+  work = [abs(x) for x in lits if x is not True and x is not False]
+  while len(work) > 0:
+    v = work.pop()
+    if v in seen:
+      continue
+    seen.add(v)
+    if v in gate_of:
+      work.extend(map(abs, netlist.gate_operands(gate_of[v])))
+  return seen
+
+'''
+Polarities the variables are needed with, for literals lits that are only ever required to be true
+(Plaisted-Greenbaum). Returns a dict variable -> POS | NEG over the cone of lits:
+POS if some requirement may need the variable true, NEG if false.
+AND, OR, MAJ and EQ are monotone, so their operands inherit the output's polarities (swapped for negated operands);
+operands of XOR, XOR3 and TABLE gates are needed with both.
+'''
+POS = 1
+NEG = 2
+
+def polarities(netlist, lits):
+  pol = dict()
+  for x in lits:
+    if x is not True and x is not False:
+      pol[abs(x)] = pol.get(abs(x), 0) | (POS if x > 0 else NEG)
+  swap = [0, NEG, POS, POS | NEG]
+  for i in range(len(netlist)-1, -1, -1):
+    p = pol.get(netlist.outs[i], 0)
+    if p == 0:
+      continue
+    monotone = netlist.ops[i] in (EQ, AND, OR, MAJ)
+    for x in netlist.gate_operands(i):
+      q = (p if x > 0 else swap[p]) if monotone else POS | NEG
+      pol[abs(x)] = pol.get(abs(x), 0) | q
+  return pol
+
+'''
+Value of output bit j (of num_outputs) of table, as the TABLE column int over the table's inputs
+'''
+def table_column(table, num_outputs, j):
+  bit = num_outputs-1-j
+  t = 0
+  for v in range(len(table)):
+    t |= ((table[v] >> bit) & 1) << v
+  return t
+
+#
+# Bit-parallel evaluation
+#
+# A word is a Python int holding one bit per lane (assignment): lane i is bit i.
+# With num_lanes lanes, mask = (1 << num_lanes) - 1 and the negation of word w is w ^ mask.
+#
+'''
+Word of TABLE column t over operand words ws (ws[0] = most significant operand), by Shannon expansion
+Sub-tables that repeat (common in arithmetic, e.g. the carry of the low bits) are only expanded once.
+'''
+def table_word(t, ws, mask):
+  memo = dict()
+
+  def expand(t, k):
+    if t == 0:
+      return 0
+    if t == (1 << (1 << k)) - 1:
+      return mask
+    if (t, k) in memo:
+      return memo[(t, k)]
+    half = 1 << (k-1)
+    f0 = expand(t & ((1 << half) - 1), k-1)
+    f1 = expand(t >> half, k-1)
+    x = ws[len(ws)-k]
+    w = f0 if f0 == f1 else (x & f1) | (f0 & ~x)
+    memo[(t, k)] = w
+    return w
+
+  return expand(t, len(ws))
+
+'''
+Word of the output of gate i given its operand words ws
+'''
+def gate_word(netlist, i, ws, mask):
+  op = netlist.ops[i]
+  if op == XOR:
+    return ws[0] ^ ws[1]
+  if op == AND:
+    return ws[0] & ws[1]
+  if op == OR:
+    return ws[0] | ws[1]
+  if op == EQ:
+    return ws[0]
+  if op == XOR3:
+    return ws[0] ^ ws[1] ^ ws[2]
+  if op == MAJ:
+    return (ws[0] & ws[1]) | (ws[0] & ws[2]) | (ws[1] & ws[2])
+  if op == TABLE:
+    return table_word(netlist.tables[netlist.params[i]], ws, mask)
+  assert(op == CONST)
+  return mask if netlist.params[i] else 0
+
+'''
+Propagate num_lanes assignments through the netlist at once
+inputs maps every primary input variable to its word
+Returns values, a list indexed by variable (None for variables the netlist does not define)
+'''
+def evaluate(netlist, inputs, num_lanes):
+  mask = (1 << num_lanes) - 1
+  values = [None] * (max(netlist.max_var(), max(inputs, default = 0)) + 1)
+  for v, w in inputs.items():
+    values[v] = w
+  operands = netlist.operands
+  starts = netlist.starts
+  outs = netlist.outs
+  n = len(netlist)
+  for i in range(n):
+    end = starts[i+1] if i+1 < n else len(operands)
+    ws = [values[x] if x > 0 else values[-x] ^ mask for x in operands[starts[i]:end]]
+    values[outs[i]] = gate_word(netlist, i, ws, mask)
+  return values
+
+# Word of literal or constant x
+def lit_word(values, x, mask):
+  if x is True:
+    return mask
+  if x is False:
+    return 0
+  if x > 0:
+    return values[x]
+  return values[-x] ^ mask
+
+'''
+Lanes (as a word) in which the values satisfy every clause and XOR constraint of a ClauseView
+'''
+def satisfied_lanes(values, cnf, num_lanes):
+  mask = (1 << num_lanes) - 1
+  ok = mask
+  for clause in cnf:
+    w = 0
+    for x in clause:
+      w |= lit_word(values, x, mask)
+    ok &= w
+  if cnf.xors is not None:
+    for lits in cnf.xors:
+      w = 0
+      for x in lits:
+        w ^= lit_word(values, x, mask)
+      ok &= w
+  return ok
+
+'''
+Bits -> words: rows is a list of num_lanes bit rows (sequences of 0/1, e.g. testvec.BitMatrix rows)
+Returns one word per column
+'''
+def rows_to_words(rows):
+  words = []
+  for j in range(len(rows[0]) if len(rows) > 0 else 0):
+    w = 0
+    for i in range(len(rows)):
+      if rows[i][j]:
+        w |= 1 << i
+    words.append(w)
+  return words
+
+'''
+Words -> bits: lane i of every word, as one list of bits per lane
+'''
+def words_to_rows(words, num_lanes):
+  columns = [format(w, "0{0}b".format(num_lanes))[::-1] for w in words]
+  return [[1 if c[i] == "1" else 0 for c in columns] for i in range(num_lanes)]
+
+'''
+Witness for a partial assignment (dict variable -> True/False) of the primary inputs:
+every variable whose value the assignment determines, as a list of literals
+Gates with an unassigned operand are left unassigned, so this never needs a solver.
+'''
+def witness(netlist, assignment):
+  values = {v : 1 if b else 0 for v, b in assignment.items()}
+  for i in range(len(netlist)):
+    ins = netlist.gate_operands(i)
+    if all(abs(x) in values for x in ins):
+      ws = [values[x] if x > 0 else values[-x] ^ 1 for x in ins]
+      if netlist.ops[i] == TABLE:
+        # One lane: look the value up instead of expanding the table
+        v = 0
+        for b in ws:
+          v = 2*v + b
+        values[netlist.outs[i]] = (netlist.tables[netlist.params[i]] >> v) & 1
+      else:
+        values[netlist.outs[i]] = gate_word(netlist, i, ws, 1)
+  return [v if values[v] else -v for v in sorted(values)]
@@ -0,0 +1,153 @@
+from feal import *
+import feal_ref
+from testvec import bits_to_bytes
+from collections import Counter
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+'''
+Solver portfolio for one FEAL_NX known plaintext attack instance
+
+The instance is FEAL_NX(N) with known (plaintext, ciphertext) pairs (8 byte blocks) as assumptions.
+Every configuration builds its own encoding of it and runs its own solver, each in a separate process,
+and the first one to answer (SAT with a key, or UNSAT) wins: the others are killed.
+A configuration that raises is recorded with status "error" and the race goes on without it.
+Each run gets time_limit seconds (the solver's own limit, and a wall clock limit on the whole race).
+
+A configuration is a dict with
+  name            label for the results and the log
+  options         ClauseStore encoding options (default {})
+  threads         pycryptosat threads (default 1)
+  solver_options  cryptominisat options as strings, e.g. {"seed" : "3", "polar" : "rnd"} (default {})
+
+With a log file name, every race appends one JSON line: the instance, the winner and every result,
+so win_counts can tell which configurations to make the defaults.
+'''
+
+DEFAULT_CONFIGS = [
+  dict(name = "tseitin"),
+  dict(name = "tseitin seed 1", solver_options = {"seed" : "1"}),
+  dict(name = "tseitin polar rnd", solver_options = {"polar" : "rnd"}),
+  dict(name = "tseitin 2 threads", threads = 2),
+  dict(name = "direct", options = dict(adder = 'direct')),
+  dict(name = "ripple+xor", options = dict(adder = 'ripple', xor = True)),
+  dict(name = "xor+alias", options = dict(xor = True, alias = True)),
+  dict(name = "table", options = dict(adder = 'table')),
+]
+
+'''
+Build and solve the instance with one configuration
+Returns dict(name, status = 'sat', 'unsat', 'timeout' or 'error', key (16 bytes or None), build_s, solve_s),
+with error = repr of the exception for 'error'
+'''
+def run_config(job):
+  N, pairs, config, time_limit = job
+  start = time.time()
+  try:
+    return build_and_solve(N, pairs, config, time_limit)
+  except Exception as e:
+    return dict(name = config["name"], status = "error", key = None, build_s = time.time() - start, solve_s = 0.0,
+                error = repr(e))
+
+def build_and_solve(N, pairs, config, time_limit):
+  start = time.time()
+  store = ClauseStore(**config.get("options", {}))
+  nfv, res, pair_res = FEAL_NX(N).setup_multi(len(pairs), store)
+  assumptions = pair_assumptions(pairs, pair_res)
+  limits = dict() if time_limit is None else dict(time_limit = time_limit)
+  s = Solver(threads = config.get("threads", 1), options = config.get("solver_options", {}), **limits)
+  add_to_solver(s, store.view())
+  build_s = time.time() - start
+  start = time.time()
+  sat, soln = s.solve(assumptions)
+  key = None
+  if sat:
+    key = bits_to_bytes([1 if soln[v] else 0 for v in res.in_vars[:128]])
+  status = "timeout" if sat is None else ("sat" if sat else "unsat")
+  return dict(name = config["name"], status = status, key = key, build_s = build_s, solve_s = time.time() - start)
+
+'''
+Race the configurations on FEAL_NX(N) with the given pairs, num_workers at a time (default: all at once)
+Returns dict(winner = name of the first configuration to answer or None, status, key, seconds,
+             results = the result of every run that finished, in finishing order)
+Without a winner, status is 'error' if every run failed, otherwise 'timeout'
+'''
+def portfolio(N, pairs, configs = DEFAULT_CONFIGS, time_limit = None, num_workers = None, log = None):
+  start = time.time()
+  num_workers = len(configs) if num_workers is None else num_workers
+  jobs = [(N, pairs, config, time_limit) for config in configs]
+  race = dict(winner = None, status = "timeout", key = None, seconds = 0.0, results = [])
+  # Leaving the with block terminates the pool, which kills the runs still going
+  with multiprocessing.Pool(num_workers) as pool:
+    results = pool.imap_unordered(run_config, jobs)
+    for i in range(len(jobs)):
+      remaining = None
+      if time_limit is not None:
+        # Runs may wait for a free worker, so the race gets time_limit per round of num_workers runs (+1 s to build)
+        remaining = start + time_limit * -(-len(jobs) // num_workers) + 1 - time.time()
+      try:
+        result = results.next(timeout = None if remaining is None else max(0, remaining))
+      except multiprocessing.TimeoutError:
+        break
+      race["results"].append(result)
+      if result["status"] in ["sat", "unsat"]:
+        race["winner"] = result["name"]
+        race["status"] = result["status"]
+        race["key"] = result["key"]
+        break
+  race["seconds"] = time.time() - start
+  if len(race["results"]) == len(jobs) and all(r["status"] == "error" for r in race["results"]):
+    race["status"] = "error"
+  if race["key"] is not None:
+    assert(feal_ref.encrypt(N, race["key"], [pt for pt, ct in pairs]) == [ct for pt, ct in pairs])
+  if log is not None:
+    write_log(log, N, pairs, configs, time_limit, race)
+  return race
+
+def write_log(fname, N, pairs, configs, time_limit, race):
+  record = dict(time = time.time(), N = N, num_pairs = len(pairs), time_limit = time_limit,
+                configs = [config["name"] for config in configs],
+                winner = race["winner"], status = race["status"], seconds = race["seconds"],
+                results = [dict(r, key = None if r["key"] is None else r["key"].hex()) for r in race["results"]])
+  with open(fname, 'a') as f:
+    f.write(json.dumps(record) + "\n")
+
+'''
+Number of races each configuration won in a log file (optionally only those for FEAL_NX(N))
+'''
+def win_counts(fname, N = None):
+  wins = Counter()
+  with open(fname) as f:
+    for line in f:
+      record = json.loads(line)
+      if record["winner"] is not None and (N is None or record["N"] == N):
+        wins[record["winner"]] += 1
+  return wins
+
+if __name__ == "__main__":
+  if len(sys.argv) < 4 or len(sys.argv) > 5:
+    print("Usage: python3 portfolio.py <N> <num_pairs> <time_limit> [<log.jsonl>]")
+    print("Races the default configurations on FEAL_NX(N) under a random key with num_pairs random known plaintexts")
+    print("time_limit : seconds per run, 0 = none")
+    print("log        : append the results to this file, and print the wins recorded in it")
+    exit()
+
+  N = int(sys.argv[1])
+  num_pairs = int(sys.argv[2])
+  time_limit = float(sys.argv[3]) if float(sys.argv[3]) > 0 else None
+  log = sys.argv[4] if len(sys.argv) > 4 else None
+  pairs = feal_ref.random_pairs(N, os.urandom(16), num_pairs)
+  race = portfolio(N, pairs, time_limit = time_limit, log = log)
+  for result in race["results"]:
+    print("{0:<22} {1:<8} build {2:.3f} s, solve {3:.3f} s{4}".format(result["name"], result["status"],
+                                                                      result["build_s"], result["solve_s"],
+                                                                      ", " + result["error"] if "error" in result else ""))
+  if race["winner"] is None:
+    print("No answer within the time limit ({0:.1f} s)".format(race["seconds"]))
+  else:
+    print("Winner: {0} ({1}, {2:.3f} s)".format(race["winner"], race["status"], race["seconds"]))
+  if log is not None:
+    print("Wins in {0}: {1}".format(log, dict(win_counts(log))))
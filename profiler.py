@@ -0,0 +1,223 @@
+import functools
+import importlib
+import inspect
+import json
+import sys
+import time
+import tracemalloc
+
+from cnf_base import ClauseStore
+
+'''
+Generation profiler: where the variables, clauses and build time of an encoding go
+
+While a Profiler is active (with Profiler() as prof: ...), the building blocks listed in its targets are
+replaced by wrappers that record a call tree: one node per call path (calls on the same path are summed), with
+  calls      number of calls
+  vars       variables the calls numbered (returned next_free_var - the one passed in; calls that take
+             no next_free_var, like FEAL_NX.setup, count from 1)
+  clauses    clauses added to the call's store (XOR constraints not included)
+  xors       XOR constraints added
+  literals   literals of both
+  seconds    wall time
+  bytes      net Python memory still allocated at return (tracemalloc, only with memory = True)
+Every figure is inclusive of the node's children. Nothing is wrapped outside the with block, so
+generation without a profiler runs the plain functions and costs nothing extra.
+
+Templated blocks (FEAL_NX rounds and key schedule steps) show up once as the build of the template,
+into a scratch store of its own, and then as Template.instantiate(<block>) per copy.
+The wrappers cost time themselves, so seconds are most meaningful with the default (word level) targets;
+BIT_TARGETS adds the bit level gates.
+
+prof.to_json() gives the tree as nested dicts and prof.folded(metric) the "frame;frame;... value" lines
+that flamegraph.pl, speedscope and inferno read, with the node's own share (minus its children) of the metric.
+'''
+
+WORD_TARGETS = ["cnf_base.word_xor", "cnf_base.rotate_left_by_k", "cnf_base.rotate_right_by_k",
+                "cnf_base.modular_addition", "cnf_base.create_constant_vec", "cnf_base.boolean_function",
+                "cnf_base.Template.instantiate",
+                "feal.FEAL_NX.setup", "feal.FEAL_NX.setup_multi", "feal.FEAL_NX.extend", "feal.FEAL_NX.encrypt_pairs",
+                "feal.FEAL_NX.key_schedule", "feal.FEAL_NX.key_schedule_steps", "feal.FEAL_NX.key_step",
+                "feal.FEAL_NX.preprocess", "feal.FEAL_NX.one_round", "feal.FEAL_NX.round_function",
+                "feal.FEAL_NX.postprocess", "feal.FEAL_NX.f", "feal.FEAL_NX.fk", "feal.FEAL_NX.s0", "feal.FEAL_NX.s1"]
+
+BIT_TARGETS = ["cnf_base.bit_eq", "cnf_base.bit_xor", "cnf_base.bit_and", "cnf_base.bit_or", "cnf_base.bit_xor3",
+               "cnf_base.bit_maj", "cnf_base.half_adder", "cnf_base.full_adder"]
+
+METRICS = ["calls", "vars", "clauses", "xors", "literals", "seconds", "bytes"]
+
+class Node:
+  def __init__(self, name):
+    self.name = name
+    self.children = dict()
+    for metric in METRICS:
+      setattr(self, metric, 0)
+
+  def child(self, name):
+    if name not in self.children:
+      self.children[name] = Node(name)
+    return self.children[name]
+
+  def to_json(self):
+    return dict(name = self.name, **{metric : getattr(self, metric) for metric in METRICS},
+                children = [c.to_json() for c in self.children.values()])
+
+# Size of the store so far: (clauses, XOR constraints, literals), flushed ones included
+def store_size(store):
+  return len(store.clauses), len(store.xors), store.clauses.num_literals() + store.xors.num_literals()
+
+class Profiler:
+  def __init__(self, targets = WORD_TARGETS, memory = False):
+    self.targets = targets
+    self.memory = memory
+    self.root = Node("root")
+    self.stack = [self.root]
+    self.patched = []
+
+  def __enter__(self):
+    self.started_tracing = self.memory and not tracemalloc.is_tracing()
+    if self.started_tracing:
+      tracemalloc.start()
+    for target in self.targets:
+      module_name, *path = target.split(".")
+      owner = importlib.import_module(module_name)
+      for attr in path[:-1]:
+        owner = getattr(owner, attr)
+      fn = getattr(owner, path[-1])
+      wrapper = self.wrap(".".join(path), fn)
+      if inspect.isclass(owner):
+        self.patched.append((owner, path[-1], fn))
+        setattr(owner, path[-1], wrapper)
+      else:
+        # Functions are also bound by name in every module that star-imported them
+        for module in list(sys.modules.values()):
+          if getattr(module, "__dict__", {}).get(path[-1]) is fn:
+            self.patched.append((module, path[-1], fn))
+            setattr(module, path[-1], wrapper)
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    self.root.seconds += time.perf_counter() - self.start
+    for owner, attr, fn in reversed(self.patched):
+      setattr(owner, attr, fn)
+    self.patched = []
+    if self.started_tracing:
+      tracemalloc.stop()
+    return False
+
+  def wrap(self, name, fn):
+    params = list(inspect.signature(fn).parameters)
+    nfv_pos = next((i for i, p in enumerate(params) if p in ("next_free_var", "nfv")), None)
+    store_pos = params.index("store") if "store" in params else None
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+      label = name
+      if name == "Template.instantiate":
+        label = "Template.instantiate({0})".format(args[0].build.__qualname__)
+      store = kwargs.get("store", args[store_pos] if store_pos is not None and store_pos < len(args) else None)
+      return self.call(label, fn, args, kwargs, args[nfv_pos] if nfv_pos is not None else 1, store)
+    return wrapper
+
+  def call(self, name, fn, args, kwargs, nfv, store):
+    node = self.stack[-1].child(name)
+    self.stack.append(node)
+    before = store_size(store) if isinstance(store, ClauseStore) else None
+    mem = tracemalloc.get_traced_memory()[0] if self.memory else 0
+    start = time.perf_counter()
+    try:
+      ret = fn(*args, **kwargs)
+    finally:
+      node.seconds += time.perf_counter() - start
+      self.stack.pop()
+    if self.memory:
+      node.bytes += tracemalloc.get_traced_memory()[0] - mem
+    node.calls += 1
+    node.vars += ret[0] - nfv
+    if before is not None:
+      after = store_size(store)
+    else:
+      # The call made its own store: its Result covers all of it
+      cnf = ret[1].cnf
+      before = (0, 0, 0)
+      after = (len(cnf), len(cnf.xors), cnf.num_literals() + cnf.xors.num_literals())
+    node.clauses += after[0] - before[0]
+    node.xors += after[1] - before[1]
+    node.literals += after[2] - before[2]
+    return ret
+
+  # The root's figures are the sums over its children (the top level calls), its seconds the time profiled
+  def totals(self):
+    for metric in METRICS:
+      if metric != "seconds":
+        setattr(self.root, metric, sum(getattr(c, metric) for c in self.root.children.values()))
+    return self.root
+
+  def to_json(self):
+    return self.totals().to_json()
+
+  def write_json(self, fname):
+    with open(fname, 'w') as f:
+      json.dump(self.to_json(), f, indent = 1)
+
+  '''
+  Folded stacks of one metric: a line "root;caller;...;callee value" per node, with the node's own share
+  (its figure minus its children's, never below 0). Seconds are written as integer microseconds.
+  '''
+  def folded(self, metric = "seconds"):
+    assert(metric in METRICS)
+    scale = 1e6 if metric == "seconds" else 1
+    lines = []
+
+    def walk(node, stack):
+      stack = stack + [node.name]
+      own = getattr(node, metric) - sum(getattr(c, metric) for c in node.children.values())
+      if round(own * scale) > 0:
+        lines.append("{0} {1}".format(";".join(stack), round(own * scale)))
+      for c in node.children.values():
+        walk(c, stack)
+
+    walk(self.totals(), [])
+    return lines
+
+  def write_folded(self, fname, metric = "seconds"):
+    with open(fname, 'w') as f:
+      for line in self.folded(metric):
+        f.write(line + "\n")
+
+  '''
+  The call tree as an indented table, down to max_depth levels
+  '''
+  def report(self, max_depth = None):
+    lines = ["{0:<60} {1:>8} {2:>10} {3:>10} {4:>8} {5:>11} {6:>9} {7:>10}".format(
+             "", "calls", "vars", "clauses", "xors", "literals", "seconds", "bytes")]
+
+    def walk(node, depth):
+      lines.append("{0:<60} {1:>8} {2:>10} {3:>10} {4:>8} {5:>11} {6:>9.3f} {7:>10}".format(
+                   "  " * depth + node.name, node.calls, node.vars, node.clauses, node.xors, node.literals,
+                   node.seconds, node.bytes))
+      if max_depth is None or depth < max_depth:
+        for c in sorted(node.children.values(), key = lambda c: -c.seconds):
+          walk(c, depth + 1)
+
+    walk(self.totals(), 0)
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+  if len(sys.argv) < 2 or len(sys.argv) > 4:
+    print("Usage: python3 profiler.py <N> [<max_depth> [<out_prefix>]]")
+    print("Profiles FEAL_NX(N).setup() and prints the call tree down to max_depth levels (default 4)")
+    print("out_prefix : also write <out_prefix>.json and <out_prefix>.<metric>.folded for seconds, vars and clauses")
+    exit()
+
+  from feal import FEAL_NX
+  N = int(sys.argv[1])
+  max_depth = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+  with Profiler(memory = True) as prof:
+    FEAL_NX(N).setup()
+  print(prof.report(max_depth))
+  if len(sys.argv) > 3:
+    prof.write_json(sys.argv[3] + ".json")
+    for metric in ["seconds", "vars", "clauses"]:
+      prof.write_folded("{0}.{1}.folded".format(sys.argv[3], metric), metric)
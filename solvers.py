@@ -0,0 +1,182 @@
+from array import array
+import shlex
+import subprocess
+import sys
+import threading
+
+from dimacs import dimacs_lines, parse_dimacs, xor_lines
+
+'''
+Solver backends
+
+Every backend has the part of the pycryptosat interface the rest of the code uses:
+  add_clause(lits), add_clauses(clauses), add_xor_clause(vars, rhs), nb_vars(), solve(assumptions) -> (sat, soln)
+add_clauses takes a list of clauses or a zero terminated flat buffer (ClauseView.buffer()).
+sat is True, False or None (no answer, e.g. the time limit ran out), and soln is None unless sat,
+otherwise a tuple indexed by variable (soln[0] = None) of True/False, so lit_value(soln, x) works on any backend.
+
+* Solver(...): pycryptosat.Solver with the same arguments. The extension is only imported when the first
+  solver is created, so code that just generates CNF never loads it.
+* ExternalSolver(cmd): any DIMACS solver binary (kissat, cadical, cryptominisat5, ...), started by solve().
+  The clauses are kept as one flat buffer and streamed into the solver's stdin through a pipe (no temporary file),
+  while its stdout is parsed for the SAT competition "s" and "v" lines.
+  Every solve() runs the binary again on all clauses, with the assumptions as unit clauses.
+* make_solver(backend): 'pycryptosat' (default) or a command for ExternalSolver
+
+python3 solvers.py < in.cnf is itself such a binary (pycryptosat behind a DIMACS front end).
+'''
+
+'''
+pycryptosat.Solver(*args, **kwargs), imported on first use
+'''
+def Solver(*args, **kwargs):
+  import pycryptosat
+  return pycryptosat.Solver(*args, **kwargs)
+
+'''
+Clauses for vars[0] ^ vars[1] ^ ... = rhs, as a flat zero terminated list
+XORs longer than cut are split into chunks chained through fresh variables from next_free_var on.
+Returns next_free_var, lits
+'''
+def xor_to_cnf(next_free_var, variables, rhs, cut = 4):
+  lits = []
+  variables = list(variables)
+  while len(variables) > cut:
+    t = next_free_var
+    next_free_var += 1
+    # t = vars[0] ^ ... ^ vars[cut-2], so that the rest of the XOR is over t and the remaining vars
+    next_free_var, chunk = xor_to_cnf(next_free_var, variables[:cut-1] + [t], False, cut)
+    lits += chunk
+    variables = [t] + variables[cut-1:]
+  k = len(variables)
+  for v in range(1 << k):
+    # Rule out every assignment with the wrong parity: clause literal i is false iff variable i takes bit i of v
+    if bin(v).count("1") % 2 != rhs:
+      lits += [-x if (v >> i) & 1 else x for i, x in enumerate(variables)] + [0]
+  return next_free_var, lits
+
+class ExternalSolver:
+  CHUNK_SIZE = 1 << 16
+
+  '''
+  cmd: the solver command line, a string or an argument list
+  time_limit: seconds per solve() (None = no limit); the solver is killed when it runs out, and solve() gives None
+  native_xor: write XOR constraints as "x" lines (only CryptoMiniSat reads them), otherwise as clauses
+  '''
+  def __init__(self, cmd, time_limit = None, native_xor = False):
+    self.cmd = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+    self.time_limit = time_limit
+    self.native_xor = native_xor
+    self.lits = array('i')
+    self.xors = []
+    self.num_vars = 0
+
+  def nb_vars(self):
+    return self.num_vars
+
+  def add_clause(self, lits):
+    self.lits.extend(lits)
+    self.lits.append(0)
+    self.num_vars = max(self.num_vars, max(map(abs, lits), default = 0))
+
+  def add_clauses(self, clauses):
+    if len(clauses) == 0:
+      return
+    if not isinstance(clauses[0], int):
+      for lits in clauses:
+        self.add_clause(lits)
+      return
+    assert(clauses[len(clauses)-1] == 0)
+    self.lits.extend(clauses)
+    self.num_vars = max(self.num_vars, max(clauses), -min(clauses))
+
+  def add_xor_clause(self, variables, rhs = True):
+    self.xors.append((list(variables), bool(rhs)))
+    self.num_vars = max([self.num_vars] + list(variables))
+
+  # The DIMACS instance: header, clauses, XORs, then the assumptions as units
+  def write(self, fout, assumptions):
+    try:
+      nfv = self.num_vars + 1
+      num_clauses = self.lits.count(0) + len(assumptions)
+      xors = []
+      for variables, rhs in self.xors:
+        if self.native_xor:
+          xors += [-variables[0] if not rhs else variables[0]] + variables[1:] + [0]
+          num_clauses += 1
+        else:
+          nfv, lits = xor_to_cnf(nfv, variables, rhs)
+          xors += lits
+          num_clauses += lits.count(0)
+      fout.write("p cnf {0} {1}\n".format(nfv-1, num_clauses))
+      start = 0
+      while start < len(self.lits):
+        # Chunks end on a clause terminator
+        end = self.lits.index(0, min(start + self.CHUNK_SIZE, len(self.lits)) - 1) + 1
+        fout.write(dimacs_lines(self.lits[start:end]))
+        start = end
+      fout.write(xor_lines(xors) if self.native_xor else dimacs_lines(xors))
+      fout.write(dimacs_lines([x for lit in assumptions for x in (lit, 0)]))
+      fout.close()
+    except BrokenPipeError:
+      # The solver quit (or was killed) before reading everything
+      pass
+
+  def solve(self, assumptions = []):
+    assumptions = list(assumptions)
+    num_vars = max([self.num_vars] + [abs(x) for x in assumptions])
+    proc = subprocess.Popen(self.cmd, stdin = subprocess.PIPE, stdout = subprocess.PIPE,
+                            stderr = subprocess.DEVNULL, universal_newlines = True)
+    writer = threading.Thread(target = self.write, args = (proc.stdin, assumptions))
+    writer.start()
+    timer = None
+    if self.time_limit is not None:
+      timer = threading.Timer(self.time_limit, proc.kill)
+      timer.start()
+    status = None
+    values = [None] + [False] * num_vars
+    for line in proc.stdout:
+      if line.startswith("s "):
+        status = line[2:].strip()
+      elif line.startswith("v "):
+        for tok in line[2:].split():
+          x = int(tok)
+          if x != 0 and abs(x) <= num_vars:
+            values[abs(x)] = x > 0
+    proc.wait()
+    writer.join()
+    if timer is not None:
+      timer.cancel()
+    if status == "SATISFIABLE":
+      return True, tuple(values)
+    if status == "UNSATISFIABLE":
+      return False, None
+    return None, None
+
+'''
+A solver for the backend name: 'pycryptosat' or an ExternalSolver command
+'''
+def make_solver(backend = 'pycryptosat', **kwargs):
+  if backend == 'pycryptosat':
+    return Solver(**kwargs)
+  return ExternalSolver(backend, **kwargs)
+
+if __name__ == "__main__":
+  if len(sys.argv) != 1:
+    print("Usage: python3 solvers.py < <in.cnf>")
+    print("Solves DIMACS CNF (with CryptoMiniSat \"x\" lines) from stdin with pycryptosat,")
+    print("printing the s and v lines of the SAT competition format (exit code 10 = SAT, 20 = UNSAT)")
+    exit()
+
+  num_vars, clauses, xors = parse_dimacs(sys.stdin)
+  s = Solver()
+  s.add_clauses(clauses)
+  for lits in xors:
+    s.add_xor_clause([abs(x) for x in lits], sum(x < 0 for x in lits) % 2 == 0)
+  sat, soln = s.solve()
+  if not sat:
+    print("s UNSATISFIABLE")
+    sys.exit(20)
+  print("s SATISFIABLE")
+  print("v " + " ".join(str(v if soln[v] else -v) for v in range(1, len(soln))) + " 0")
+  sys.exit(10)
@@ -0,0 +1,55 @@
+from attack import *
+import random
+import sys
+
+def test_guess_bits(num_tests):
+  print("Testing guess bit selection... ", end="")
+  for i in range(num_tests):
+    store = ClauseStore(xor = random.choice([False, True]))
+    nfv, res = FEAL_NX(2 * random.randint(1, 4)).setup(store)
+    key_vars = res.in_vars[:128]
+    counts = occurrence_counts(store.view(), key_vars)
+    for v in random.sample(key_vars, 8):
+      assert(counts[v] == sum(abs(x) == v for clause in list(store.view()) + list(store.view().xors) for x in clause))
+    k = random.randint(0, 8)
+    guess = choose_guess_bits(store.view(), key_vars, k)
+    assert(len(guess) == k and all(counts[v] >= counts[u] for v in guess for u in key_vars if u not in guess))
+    todo = cubes(guess)
+    assert(len(todo) == 1 << k and len(set(map(tuple, todo))) == 1 << k)
+    assert(all(list(map(abs, cube)) == guess for cube in todo))
+  print("OK")
+
+def test_attack(num_tests):
+  print("Testing attack... ", end="")
+  for i in range(num_tests):
+    N = 2
+    key = os.urandom(16)
+    pairs = feal_ref.random_pairs(N, key, 4)
+    k = random.randint(0, 3)
+    # Some cube holds the true key's guess bits, so a key is always found
+    guess_vars = random.choice([None, random.sample(range(1, 129), k)])
+    seen = []
+    stats = attack(N, pairs, k, guess_vars, num_workers = random.randint(1, 2),
+                   options = dict(xor = random.choice([False, True])), progress = lambda s: seen.append(s["cubes_done"]))
+    assert(stats["key"] is not None)
+    assert(feal_ref.encrypt(N, stats["key"], [pt for pt, ct in pairs]) == [ct for pt, ct in pairs])
+    assert(stats["cubes_done"] == len(seen) and seen == list(range(1, len(seen) + 1)))
+    assert(stats["cubes_done"] == stats["cubes_unsat"] + 1 and stats["cubes"] == 1 << k)
+    # The cube is the found key's bits on the guess variables
+    bits = unpack_bits(stats["key"])
+    assert(all((x > 0) == (bits[abs(x)-1] == 1) for x in stats["cube"]))
+
+  # Pairs from two different keys: every cube is unsatisfiable
+  pairs = feal_ref.random_pairs(2, os.urandom(16), 2) + feal_ref.random_pairs(2, os.urandom(16), 2)
+  stats = attack(2, pairs, 1)
+  assert(stats["key"] is None and stats["cubes_unsat"] == stats["cubes"] == 2)
+  print("OK")
+
+if __name__ == "__main__":
+  if len(sys.argv) != 2:
+    print("Usage: python3 test_attack.py <num_tests>")
+    exit()
+  num_tests = int(sys.argv[1])
+
+  test_guess_bits(num_tests)
+  test_attack(num_tests)
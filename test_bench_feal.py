@@ -0,0 +1,47 @@
+from bench_feal import *
+import os
+import sys
+import tempfile
+
+def test_bench(num_tests):
+  print("Testing bench_feal sweep and baseline comparison... ", end="")
+  fname = os.path.join(tempfile.mkdtemp(), "bench.json")
+  for i in range(num_tests):
+    encodings = random.sample(ENCODINGS, 2)
+    results = sweep([2, 4], 2, 1, encodings, verbose = False)
+    assert(len(results) == 4)
+    for name, options in encodings:
+      nfv, res, store = build(2, options)
+      row = results["N=2 " + name]
+      assert(row["vars"] == nfv-1 and row["clauses"] == len(store) and row["xors"] == store.num_xors())
+      assert(row["literals"] == store.num_literals() + store.xors.num_literals())
+      assert(row["peak_bytes"] > 0 and row["kpa_s"] is not None and results["N=4 " + name]["kpa_s"] is None)
+
+    # Against itself (written and read back) nothing regresses; one more clause does,
+    # a much slower build only when resources are checked too
+    write_results(fname, results)
+    baseline = load_results(fname)
+    all_thresholds = dict(SIZE_THRESHOLDS, **RESOURCE_THRESHOLDS)
+    assert(baseline == results and compare(results, baseline) == [] and compare(results, baseline, all_thresholds) == [])
+    key = "N=4 " + encodings[0][0]
+    worse = json.loads(json.dumps(results))
+    worse[key]["clauses"] += 1
+    worse[key]["build_s"] = 4 * results[key]["build_s"] + 1
+    regressions = compare(worse, baseline)
+    assert(len(regressions) == 1 and regressions[0].startswith(key + " clauses"))
+    regressions = compare(worse, baseline, all_thresholds)
+    assert(len(regressions) == 2 and all(line.startswith(key) for line in regressions))
+    # Improvements and entries missing from the baseline pass
+    better = json.loads(json.dumps(results))
+    better[key]["clauses"] -= 1
+    better["N=64 tseitin"] = results[key]
+    assert(compare(better, baseline) == [])
+  print("OK")
+
+if __name__ == "__main__":
+  if len(sys.argv) != 2:
+    print("Usage: python3 test_bench_feal.py <num_tests>")
+    exit()
+  num_tests = int(sys.argv[1])
+
+  test_bench(num_tests)
@@ -1,6 +1,10 @@
 from cnf_base import *
+from minimise import compiled_tables
+import minimise
+from verify import verify_gadget
 import random
 import sys
+import tempfile
 
 #
 # Helper functions (Quite self-explanatory)
@@ -58,12 +62,70 @@ def run_solver(cnf, in_vec, out_vec, condition, args = None):
     bits = extract_bits(soln, in_vec + out_vec)
     assert(condition(bits, in_vec, out_vec, args))
 
+'''
+Simulate all instantiations of in_vec on a store view (clauses and XORs)
+and compare the output literals against spec(input bits)
+'''
+def check_outputs(cnf, in_vec, out_vec, spec):
+  s = Solver()
+  add_to_solver(s, cnf)
+  # Inputs the outputs do not depend on may not occur in any clause
+  s.add_clauses([[v, -v] for v in in_vec])
+  for num in range(pow(2, len(in_vec))):
+    arr = num_to_bit_array(len(in_vec), num)
+    sat, soln = s.solve(dot_product(arr, in_vec))
+    assert(sat)
+    assert([lit_value(soln, z) for z in out_vec] == spec(arr))
+
+#
+# Reference builders for verify.py, made only of the bit level gates (which are tested exhaustively below)
+#
+def reference_word_xor(next_free_var, xy, store):
+  n = len(xy) // 2
+  out_vars = []
+  for i in range(n):
+    next_free_var, res = bit_xor(next_free_var, xy[i], xy[n+i], store)
+    out_vars += res.out_vars
+  return next_free_var, Result(xy, out_vars, None)
+
+# Rotation to the left by k is pure wiring
+def reference_rotation(k):
+  def build(next_free_var, x, store):
+    return next_free_var, Result(x, [x[(i+k) % len(x)] for i in range(len(x))], None)
+  return build
+
+# Schoolbook ripple carry, least significant (last) bit first
+def reference_addition(next_free_var, xy, store):
+  n = len(xy) // 2
+  x = xy[:n]
+  y = xy[n:]
+  c = False
+  out_vars = [None] * n
+  for i in range(n-1, -1, -1):
+    next_free_var, p = bit_xor(next_free_var, x[i], y[i], store)
+    next_free_var, s = bit_xor(next_free_var, p.out_vars[0], c, store)
+    next_free_var, g = bit_and(next_free_var, x[i], y[i], store)
+    next_free_var, t = bit_and(next_free_var, p.out_vars[0], c, store)
+    next_free_var, c_res = bit_or(next_free_var, g.out_vars[0], t.out_vars[0], store)
+    out_vars[i] = s.out_vars[0]
+    c = c_res.out_vars[0]
+  return next_free_var, Result(xy, out_vars, None)
+
+# Two of the ClauseStore encoding option combinations, at random
+def random_option_sets():
+  options = [dict(alias = alias, xor = xor, adder = adder, adder_slice = random.randint(1, 4),
+                  strash = random.choice([False, True]))
+             for alias in [False, True] for xor in [False, True] for adder in ADDER_ENCODINGS]
+  return random.sample(options, 2)
+
 #
 # Tests
 #
-# For variable length functions, length 5-8 randomly chosen
-# Choosing length > 8 will slow down testing as we try 2^(length) possible inputs
+# Word level functions are checked with verify.py at widths up to 64 bits:
+# an exhaustive bit-parallel truth table up to 16 inputs, a miter (one SAT call) above
 #
+WORD_SIZES = [1, 2, 3, 5, 8, 16, 32, 64]
+
 def test_bit_eq(num_tests):
   def condition(bits, in_vec, out_vec, args = None):
     x = bits[in_vec[0]]
@@ -142,24 +204,10 @@ def test_bit_or(num_tests):
   print("OK")
 
 def test_word_xor(num_tests):
-  def condition(bits, in_vec, out_vec, args = None):
-    assert(len(in_vec) % 2 == 0)
-    n = len(in_vec) // 2
-    x = in_vec[:n]
-    y = in_vec[n:]
-    z = out_vec
-    condition_ok = None
-    for i in range(n):
-      xi = bits[x[i]]
-      yi = bits[y[i]]
-      zi = bits[z[i]]
-      condition_ok = ((xi ^ yi) == zi)
-    return condition_ok
-
   print("Testing word_xor... ", end="")
   for i in range(num_tests):
-    num_bits = random.randint(5, 8)
-    xy = random.sample(range(1, pow(2,num_bits)), 2*num_bits)
+    num_bits = random.choice(WORD_SIZES)
+    xy = random.sample(range(1, 200), 2*num_bits)
     x = xy[:num_bits]
     y = xy[num_bits:]
     next_free_var = max(xy) + random.randint(1, 200)
@@ -167,57 +215,41 @@ def test_word_xor(num_tests):
     z = res.out_vars
     assert(len(z) == num_bits)
     assert(nfv == largest_seen(res.cnf) + 1)
-    run_solver(res.cnf, x+y, z, condition)
+    for options in random_option_sets():
+      assert(verify_gadget(lambda nfv, xy, store: word_xor(nfv, xy[:num_bits], xy[num_bits:], store),
+                           reference_word_xor, 2*num_bits, options) is None)
   print("OK")
 
 def test_rotate_left_by_k(num_tests):
-  def condition(bits, in_vec, out_vec, args):
-    assert(len(in_vec) == len(out_vec))
-    n = len(in_vec)
-    k = args[0]
-    condition_ok = None
-    for i in range(n):
-      xi = bits[in_vec[(i+k) % n]]
-      yi = bits[out_vec[i]]
-      condition_ok = (xi == yi)
-    return condition_ok
-
   print("Testing rotate_left_by_k... ", end="")
   for i in range(num_tests):
-    num_bits = random.randint(5, 8)
-    k = random.randint(1, 10)
-    x = random.sample(range(1, pow(2,num_bits)), num_bits)
+    num_bits = random.choice(WORD_SIZES)
+    k = random.randint(1, 2*num_bits)
+    x = random.sample(range(1, 200), num_bits)
     next_free_var = max(x) + random.randint(1, 200)
     nfv, res = rotate_left_by_k(next_free_var, num_bits, x, k)
     y = res.out_vars
     assert(len(y) == num_bits)
     assert(nfv == largest_seen(res.cnf) + 1)
-    run_solver(res.cnf, x, y,condition, [k])
+    for options in random_option_sets():
+      assert(verify_gadget(lambda nfv, x, store: rotate_left_by_k(nfv, num_bits, x, k, store),
+                           reference_rotation(k), num_bits, options) is None)
   print("OK")
 
 def test_rotate_right_by_k(num_tests):
-  def condition(bits, in_vec, out_vec, args):
-    assert(len(in_vec) == len(out_vec))
-    n = len(in_vec)
-    k = args[0]
-    condition_ok = None
-    for i in range(n):
-      xi = bits[in_vec[(i-k) % n]]
-      yi = bits[out_vec[i]]
-      condition_ok = (xi == yi)
-    return condition_ok
-
   print("Testing rotate_right_by_k... ", end="")
   for i in range(num_tests):
-    num_bits = random.randint(5, 8)
-    k = random.randint(1, 10)
-    x = random.sample(range(1, pow(2,num_bits)), num_bits)
+    num_bits = random.choice(WORD_SIZES)
+    k = random.randint(1, 2*num_bits)
+    x = random.sample(range(1, 200), num_bits)
     next_free_var = max(x) + random.randint(1, 200)
     nfv, res = rotate_right_by_k(next_free_var, num_bits, x, k)
     y = res.out_vars
     assert(len(y) == num_bits)
     assert(nfv == largest_seen(res.cnf) + 1)
-    run_solver(res.cnf, x, y,condition, [k])
+    for options in random_option_sets():
+      assert(verify_gadget(lambda nfv, x, store: rotate_right_by_k(nfv, num_bits, x, k, store),
+                           reference_rotation(-k), num_bits, options) is None)
   print("OK")
 
 def test_half_adder(num_tests):
@@ -279,18 +311,10 @@ def test_full_adder(num_tests):
   print("OK")
 
 def test_modular_addition(num_tests):
-  def condition(bits, in_vec, out_vec, args = None):
-    assert(len(in_vec) % 2 == 0)
-    n = len(in_vec) // 2
-    x = bit_array_to_num([bits[x] for x in in_vec[:n]])
-    y = bit_array_to_num([bits[y] for y in in_vec[n:]])
-    z = bit_array_to_num([bits[z] for z in out_vec])
-    return (((x + y) % pow(2,n)) == z)
-
   print("Testing modular_addition... ", end="")
   for i in range(num_tests):
-    num_bits = random.randint(5, 8)
-    xy = random.sample(range(1, pow(2,num_bits)), 2*num_bits)
+    num_bits = random.choice(WORD_SIZES)
+    xy = random.sample(range(1, 200), 2*num_bits)
     x = xy[:num_bits]
     y = xy[num_bits:]
     next_free_var = max(xy) + random.randint(1, 200)
@@ -298,7 +322,9 @@ def test_modular_addition(num_tests):
     z = res.out_vars
     assert(len(z) == num_bits)
     assert(nfv == largest_seen(res.cnf) + 1)
-    run_solver(res.cnf, x+y, z, condition)
+    for options in random_option_sets():
+      assert(verify_gadget(lambda nfv, xy, store: modular_addition(nfv, num_bits, xy[:num_bits], xy[num_bits:], store),
+                           reference_addition, 2*num_bits, options) is None)
   print("OK")
 
 def test_create_constant_vec(num_tests):
@@ -319,6 +345,300 @@ def test_create_constant_vec(num_tests):
       assert(bit_array_to_num([bits[v] for v in z]) == num)
   print("OK")
 
+def test_clause_store(num_tests):
+  print("Testing ClauseStore... ", end="")
+  for i in range(num_tests):
+    clauses = []
+    for j in range(random.randint(1, 50)):
+      clause = random.sample(range(1, 100), random.randint(1, 5))
+      clauses.append([-v if random.randint(0, 1) else v for v in clause])
+    store = ClauseStore()
+    store.add_clauses(clauses[:len(clauses)//2])
+    view = store.view()
+    split = len(store)
+    mark = store.mark()
+    store.add_clauses(clauses[len(clauses)//2:])
+    assert(len(store) == len(clauses))
+    assert(store.num_literals() == sum(len(c) for c in clauses))
+    assert(store.view().to_list() == clauses)
+    assert(view.to_list() == clauses[:split])
+    assert(store.view(mark).to_list() == clauses[split:])
+    assert(view + store.view(mark) == clauses)
+    assert(store.view()[-1] == clauses[-1])
+    flat = []
+    for clause in clauses[split:]:
+      flat += clause + [0]
+    assert(store.view(mark).buffer().tolist() == flat)
+
+    # Nested building blocks share the caller's store
+    store = ClauseStore()
+    nfv, res = modular_addition(200, 8, list(range(1, 9)), list(range(9, 17)), store)
+    assert(len(res.cnf) == len(store))
+    nfv, res2 = word_xor(nfv, res.out_vars, list(range(1, 9)), store)
+    assert(len(res.cnf) + len(res2.cnf) == len(store))
+  print("OK")
+
+def test_constant_folding(num_tests):
+  # Replace inputs by random constants, then check the gadget on every assignment of the remaining variables
+  def mix(n):
+    vec = []
+    for i in range(n):
+      r = random.randint(0, 3)
+      vec.append(True if r == 0 else (False if r == 1 else 100+i))
+    return vec
+
+  def check(build, inputs, spec):
+    nfv, res = build(1000, inputs)
+    free = sorted(set(abs(x) for x in inputs if not is_const(x)))
+    s = Solver()
+    add_to_solver(s, res.cnf)
+    s.add_clauses([[v, -v] for v in free])
+    for num in range(pow(2, len(free))):
+      bits = {free[j] : (num >> j) & 1 for j in range(len(free))}
+      sat, soln = s.solve(dot_product([bits[v] for v in free], free))
+      assert(sat)
+      vals = [x if is_const(x) else (bits[abs(x)] == 1) == (x > 0) for x in inputs]
+      assert([lit_value(soln, z) for z in res.out_vars] == spec(vals))
+    return res
+
+  print("Testing constant folding... ", end="")
+  for i in range(num_tests):
+    for op, spec in [(bit_xor, lambda v: [v[0] != v[1]]),
+                     (bit_and, lambda v: [v[0] and v[1]]),
+                     (bit_or, lambda v: [v[0] or v[1]])]:
+      for inputs in [[True, 7], [7, False], [False, True], [7, 7], [7, -7], [-7, -7]]:
+        res = check(lambda nfv, v: op(nfv, v[0], v[1]), inputs, spec)
+        assert(len(res.cnf) == 0)
+      check(lambda nfv, v: op(nfv, v[0], v[1]), mix(2), spec)
+    for ignore_cout in [True, False]:
+      check(lambda nfv, v: full_adder(nfv, v[0], v[1], v[2], ignore_cout),
+            mix(3),
+            lambda v: ([] if ignore_cout else [(v[0] and v[1]) or (v[2] and (v[0] != v[1]))]) + [(v[0] != v[1]) != v[2]])
+    # Three input gates: a constant or a repeated operand leaves at most one two input gate
+    options = dict(xor = random.choice([False, True]), strash = random.choice([False, True]),
+                   netlist = random.choice([False, True]))
+    for op, spec in [(bit_xor3, lambda v: [(v[0] != v[1]) != v[2]]),
+                     (bit_maj, lambda v: [(v[0] and v[1]) or (v[2] and (v[0] or v[1]))])]:
+      for inputs in [[True, 7, 8], [7, False, 8], [7, 8, True], [False, True, 7], [True, True, False],
+                     [7, 7, 8], [7, 8, -7], [-8, 7, 8], [7, -7, 7], mix(3)]:
+        res = check(lambda nfv, v: op(nfv, v[0], v[1], v[2], ClauseStore(**options)), inputs, spec)
+        assert(largest_seen(list(res.cnf) + list(res.cnf.xors or [])) <= 1000)
+        assert(all(not is_const(x) for c in list(res.cnf) + list(res.cnf.xors or []) for x in c))
+    num_bits = random.randint(5, 8)
+    x = list(range(1, num_bits+1))
+    y = constant_vec(num_to_bit_array(num_bits, random.randint(0, pow(2,num_bits)-1)))
+    res = check(lambda nfv, v: modular_addition(nfv, num_bits, v[:num_bits], v[num_bits:]),
+                x + y,
+                lambda v: [b == 1 for b in num_to_bit_array(num_bits, (bit_array_to_num(v[:num_bits]) + bit_array_to_num(v[num_bits:])) % pow(2, num_bits))])
+    nfv, full = modular_addition(1000, num_bits, x, list(range(num_bits+1, 2*num_bits+1)))
+    assert(len(res.cnf) < len(full.cnf))
+  print("OK")
+
+def test_alias(num_tests):
+  print("Testing alias mode... ", end="")
+  for i in range(num_tests):
+    num_bits = random.randint(5, 8)
+    k = random.randint(1, 10)
+    x = random.sample(range(1, 100), num_bits)
+    x = [-v if random.randint(0, 1) else v for v in x]
+    store = ClauseStore(alias = True)
+    nfv, res = bit_eq(200, x[0], store)
+    assert(nfv == 200 and res.out_vars == [x[0]])
+    nfv, res = rotate_left_by_k(200, num_bits, x, k, store)
+    assert(nfv == 200 and res.in_vars == x)
+    assert(res.out_vars == [x[(j+k) % num_bits] for j in range(num_bits)])
+    nfv, res = rotate_right_by_k(200, num_bits, x, k, store)
+    assert(nfv == 200 and res.in_vars == x)
+    assert(res.out_vars == [x[(j-k) % num_bits] for j in range(num_bits)])
+    assert(len(store) == 0)
+  print("OK")
+
+def test_xor_mode(num_tests):
+  print("Testing xor mode... ", end="")
+  for i in range(num_tests):
+    num_bits = random.choice(WORD_SIZES)
+    xy = random.sample(range(1, 200), 2*num_bits)
+    x = xy[:num_bits]
+    y = xy[num_bits:]
+    next_free_var = max(xy) + random.randint(1, 200)
+
+    store = ClauseStore(xor = True)
+    nfv, res = word_xor(next_free_var, x, y, store)
+    assert(len(res.cnf) == 0 and len(res.xors) == num_bits)
+    assert(verify_gadget(lambda nfv, xy, store: word_xor(nfv, xy[:num_bits], xy[num_bits:], store),
+                         reference_word_xor, 2*num_bits, dict(xor = True)) is None)
+
+    store = ClauseStore(xor = True)
+    nfv, res = modular_addition(next_free_var, num_bits, x, y, store)
+    assert(len(res.xors) > 0)
+    assert(verify_gadget(lambda nfv, xy, store: modular_addition(nfv, num_bits, xy[:num_bits], xy[num_bits:], store),
+                         reference_addition, 2*num_bits, dict(xor = True)) is None)
+
+    # Chained XORs of XORs keep the outputs
+    def chained(word_xor, chain):
+      def build(nfv, xy, store):
+        x = xy[:num_bits]
+        y = xy[num_bits:]
+        nfv, res1 = word_xor(nfv, x + y, store)
+        nfv, res2 = word_xor(nfv, res1.out_vars + y[::-1], store)
+        nfv, res3 = word_xor(nfv, res2.out_vars + x[1:] + x[:1], store)
+        if chain:
+          store.chain_xors(xy + res3.out_vars)
+          assert(store.num_xors() == num_bits)
+          assert(all(len(lits) <= 5 for lits in store.view().xors))
+        return nfv, Result(xy, res3.out_vars, None)
+      return build
+    pairwise = lambda nfv, xy, store: word_xor(nfv, xy[:len(xy)//2], xy[len(xy)//2:], store)
+    assert(verify_gadget(chained(pairwise, True), chained(reference_word_xor, False), 2*num_bits, dict(xor = True)) is None)
+  print("OK")
+
+def test_adder_encodings(num_tests):
+  print("Testing adder encodings... ", end="")
+  for i in range(num_tests):
+    for adder in ADDER_ENCODINGS:
+      for xor in [False, True]:
+        xyc = random.sample(range(1,100), 3)
+        next_free_var = max(xyc) + random.randint(1, 200)
+        store = ClauseStore(adder = adder, xor = xor)
+        nfv, res = half_adder(next_free_var, xyc[0], xyc[1], store)
+        check_outputs(store.view(), xyc[:2], res.out_vars, lambda v: [v[0] & v[1] == 1, v[0] ^ v[1] == 1])
+        # Inputs that fold the sum: y = x, y = -x, y constant
+        for y, spec in [(xyc[0], lambda v: [v[0] == 1, False]),
+                        (-xyc[0], lambda v: [False, True]),
+                        (True, lambda v: [v[0] == 1, v[0] == 0])]:
+          store = ClauseStore(adder = adder, xor = xor)
+          nfv, res = half_adder(next_free_var, xyc[0], y, store)
+          check_outputs(store.view(), xyc[:1], res.out_vars, spec)
+        for ignore_cout in [True, False]:
+          store = ClauseStore(adder = adder, xor = xor)
+          nfv, res = full_adder(next_free_var, xyc[0], xyc[1], xyc[2], ignore_cout, store)
+          check_outputs(store.view(), xyc, res.out_vars,
+                        lambda v: ([] if ignore_cout else [v[0] + v[1] + v[2] >= 2]) + [(v[0] + v[1] + v[2]) % 2 == 1])
+        # Inputs on a repeated variable need no gate
+        a, b = xyc[:2]
+        for inputs in [[a, a, b], [a, -a, b], [a, b, a], [b, a, -a], [-a, b, -a]]:
+          bit = lambda v, x: (v[0] if abs(x) == a else v[1]) if x > 0 else 1 - (v[0] if abs(x) == a else v[1])
+          for ignore_cout in [True, False]:
+            store = ClauseStore(adder = adder, xor = xor)
+            nfv, res = full_adder(next_free_var, inputs[0], inputs[1], inputs[2], ignore_cout, store)
+            assert(nfv == next_free_var and len(store) == 0 and store.num_xors() == 0)
+            check_outputs(store.view(), [a, b], res.out_vars,
+                          lambda v: ([] if ignore_cout else [sum(bit(v, x) for x in inputs) >= 2]) +
+                                    [sum(bit(v, x) for x in inputs) % 2 == 1])
+        num_bits = random.choice(WORD_SIZES)
+        xy = random.sample(range(1, 200), 2*num_bits)
+        next_free_var = max(xy) + random.randint(1, 200)
+        store = ClauseStore(adder = adder, xor = xor)
+        nfv, res = modular_addition(next_free_var, num_bits, xy[:num_bits], xy[num_bits:], store)
+        assert(nfv == largest_seen(res.cnf.to_list() + res.xors.to_list()) + 1)
+        assert(verify_gadget(lambda nfv, xy, store: modular_addition(nfv, num_bits, xy[:num_bits], xy[num_bits:], store),
+                             reference_addition, 2*num_bits, dict(adder = adder, xor = xor)) is None)
+        if adder in ['direct', 'ripple']:
+          assert(nfv - next_free_var == 2*num_bits - 1)
+  print("OK")
+
+def test_boolean_function(num_tests):
+  print("Testing boolean_function... ", end="")
+  cache_dir = tempfile.mkdtemp()
+  for i in range(num_tests):
+    n = random.randint(1, 7)
+    m = random.randint(1, 4)
+    table = [random.randint(0, pow(2,m)-1) for v in range(pow(2,n))]
+    x = random.sample(range(1, 100), n)
+    next_free_var = max(x) + random.randint(1, 200)
+    nfv, res = boolean_function(next_free_var, x, table, m, cache_dir = cache_dir)
+    assert(len(res.out_vars) == m)
+    spec = lambda arr: [b == 1 for b in num_to_bit_array(m, table[bit_array_to_num(arr)])]
+    check_outputs(res.cnf, x, res.out_vars, spec)
+
+    # Loaded back from the disk cache
+    compiled_tables.clear()
+    nfv2, res2 = boolean_function(next_free_var, x, lambda v: table[v], m, cache_dir = cache_dir)
+    assert(nfv2 == nfv and res2.out_vars == res.out_vars and res2.cnf.to_list() == res.cnf.to_list())
+    # ... but not by another version of the minimiser
+    key = minimise.table_hash(table, n, m)
+    source_hash = minimise.SOURCE_HASH
+    minimise.SOURCE_HASH = "0" * 64
+    assert(minimise.table_hash(table, n, m) != key)
+    minimise.SOURCE_HASH = source_hash
+
+    # Constant inputs are substituted
+    consts = [random.choice([True, False, x[j]]) for j in range(n)]
+    free = [v for v in consts if not is_const(v)]
+    nfv, res = boolean_function(next_free_var, consts, table, m, cache_dir = None)
+    def const_spec(arr):
+      bits = iter(arr)
+      value = bit_array_to_num([(1 if v else 0) if is_const(v) else next(bits) for v in consts])
+      return [(table[value] >> (m-1-j)) & 1 == 1 for j in range(m)]
+    if len(free) == 0:
+      assert(len(res.cnf) == 0 and res.out_vars == const_spec([]))
+    else:
+      check_outputs(res.cnf, free, res.out_vars, const_spec)
+  print("OK")
+
+def template_block(nfv, x, store):
+  start = store.mark()
+  nfv, add_res = modular_addition(nfv, 8, x[0:8], x[8:16], store)
+  nfv, rot_res = rotate_left_by_k(nfv, 8, add_res.out_vars, 3, store)
+  nfv, xor_res = word_xor(nfv, rot_res.out_vars, x[16:24], store)
+  nfv, fn_res = boolean_function(nfv, xor_res.out_vars[:4], [(7*v) % 16 for v in range(16)], 4, store, cache_dir = None)
+  return nfv, Result(x, xor_res.out_vars[4:] + fn_res.out_vars + x[:2], store.view(start))
+
+def test_template(num_tests):
+  print("Testing Template... ", end="")
+  for i in range(num_tests):
+    options = dict(alias = random.choice([False, True]),
+                   xor = random.choice([False, True]),
+                   adder = random.choice(ADDER_ENCODINGS),
+                   netlist = random.choice([False, True]))
+    store = ClauseStore(**options)
+    direct = ClauseStore(**options)
+    nfv = direct_nfv = 1000
+    for j in range(3):
+      x = [v if random.randint(0, 1) else -v for v in random.sample(range(1, 500), 24)]
+      if j == 2:
+        # Constants and repeated variables run the block itself
+        x[random.randrange(24)] = random.choice([True, False, -x[0]])
+      nfv, res = store.template("block", template_block, 24).instantiate(nfv, x, store)
+      direct_nfv, direct_res = template_block(direct_nfv, x, direct)
+      assert(nfv == direct_nfv and res.out_vars == direct_res.out_vars and res.in_vars == x)
+      assert(res.cnf.to_list() == direct_res.cnf.to_list() and res.xors.to_list() == direct_res.xors.to_list())
+    assert(store.lits == direct.lits and store.xors.lits == direct.xors.lits)
+    if options["netlist"]:
+      for name in ["ops", "outs", "starts", "operands", "params"]:
+        assert(getattr(store.netlist, name) == getattr(direct.netlist, name))
+      assert(store.netlist.tables == direct.netlist.tables)
+  print("OK")
+
+def test_strash(num_tests):
+  print("Testing structural hashing... ", end="")
+  for i in range(num_tests):
+    options = dict(xor = random.choice([False, True]), adder = random.choice(ADDER_ENCODINGS), strash = True)
+    store = ClauseStore(**options)
+    x = [v if random.randint(0, 1) else -v for v in range(1, 9)]
+    y = [v if random.randint(0, 1) else -v for v in range(9, 17)]
+    nfv, res = modular_addition(100, 8, x, y, store)
+    size = (len(store), store.num_xors())
+    # The same sum again is the same literals at no cost (tables are not commutative, the gates are)
+    if options["adder"] == 'table':
+      nfv2, res2 = modular_addition(nfv, 8, x, y, store)
+    else:
+      nfv2, res2 = modular_addition(nfv, 8, y, x, store)
+    assert(nfv2 == nfv and res2.out_vars == res.out_vars and (len(store), store.num_xors()) == size)
+    a, b, c = x[0], y[0], x[1]
+    nfv, r_and = bit_and(nfv, a, b, store)
+    nfv, r_or = bit_or(nfv, -a, -b, store)
+    nfv, r_xor = bit_xor(nfv, a, b, store)
+    nfv, r_xor2 = bit_xor(nfv, -b, a, store)
+    nfv, r_maj = bit_maj(nfv, a, b, c, store)
+    nfv, r_maj2 = bit_maj(nfv, -c, -a, -b, store)
+    nfv, r_const = create_constant_vec(nfv, [0, 1, 1, 0], store)
+    assert(r_or.out_vars == [-r_and.out_vars[0]] and r_xor2.out_vars == [-r_xor.out_vars[0]])
+    assert(r_maj2.out_vars == [-r_maj.out_vars[0]])
+    k = r_const.out_vars[0]
+    assert(r_const.out_vars == [k, -k, -k, k])
+  print("OK")
+
 if __name__ == "__main__":
   if len(sys.argv) != 2:
     print("Usage: python3 test_cnf_base.py <num_tests>")
@@ -336,4 +656,12 @@ if __name__ == "__main__":
   test_full_adder(num_tests)
   test_modular_addition(num_tests)
   test_create_constant_vec(num_tests)
+  test_clause_store(num_tests)
+  test_constant_folding(num_tests)
+  test_alias(num_tests)
+  test_xor_mode(num_tests)
+  test_adder_encodings(num_tests)
+  test_boolean_function(num_tests)
+  test_template(num_tests)
+  test_strash(num_tests)
 
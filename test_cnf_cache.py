@@ -0,0 +1,59 @@
+from feal import *
+from cnf_cache import *
+import os
+import random
+import sys
+import tempfile
+
+def random_options():
+  return dict(alias = random.choice([False, True]),
+              xor = random.choice([False, True]),
+              adder = random.choice(ADDER_ENCODINGS),
+              adder_slice = random.randint(1, 4),
+              strash = random.choice([False, True]))
+
+def test_cached_setup(num_tests):
+  print("Testing cached_setup... ", end="")
+  cache_dir = tempfile.mkdtemp()
+  for i in range(num_tests):
+    N = 2 * random.randint(1, 4)
+    options = random_options()
+    store = ClauseStore(**options)
+    nfv, res = FEAL_NX(N).setup(store)
+
+    # First call builds and writes the file, second call maps it
+    for j in range(2):
+      nfv2, res2 = cached_setup(FEAL_NX(N), cache_dir, **options)
+      assert(nfv == nfv2)
+      assert(res.in_vars == res2.in_vars and res.out_vars == res2.out_vars)
+      assert(res.cnf.buffer() == res2.cnf.buffer())
+      assert(res.xors.buffer() == res2.xors.buffer())
+      assert(len(res.cnf) == len(res2.cnf) and res.cnf[-1] == res2.cnf[-1])
+
+    # The mapped table is copied on the first write
+    table = res2.cnf.table
+    table.add([[1, -2]])
+    assert(len(table) == len(res.cnf) + 1 and table.clause(len(table) - 1) == [1, -2])
+
+  # Different options or parameters use different files
+  cache_dir = tempfile.mkdtemp()
+  cached_setup(FEAL_NX(2), cache_dir, adder = 'direct')
+  cached_setup(FEAL_NX(2), cache_dir, adder = 'direct')
+  cached_setup(FEAL_NX(2), cache_dir, adder = 'ripple')
+  cached_setup(FEAL_NX(10), cache_dir, adder = 'ripple')
+  assert(len(os.listdir(cache_dir)) == 3)
+  assert(len(set(cache_key(FEAL_NX(N), ClauseStore(adder = a).options())
+                 for N in [2, 4] for a in ['direct', 'ripple'])) == 4)
+
+  # The source hash covers what known key FEAL_NX builds its constants with, and the netlist gates
+  names = [m.__name__ for m in source_modules(FEAL_NX(2, bytes(16)))]
+  assert(all(name in names for name in ["cnf_base", "minimise", "feal", "feal_ref", "testvec", "netlist"]))
+  print("OK")
+
+if __name__ == "__main__":
+  if len(sys.argv) != 2:
+    print("Usage: python3 test_cnf_cache.py <num_tests>")
+    exit()
+  num_tests = int(sys.argv[1])
+
+  test_cached_setup(num_tests)
@@ -0,0 +1,101 @@
+from feal import *
+from dimacs import *
+import io
+import os
+import random
+import sys
+import tempfile
+
+class Unseekable:
+  def __init__(self):
+    self.buf = io.StringIO()
+
+  def write(self, text):
+    self.buf.write(text)
+
+  def flush(self):
+    pass
+
+  def seekable(self):
+    return False
+
+def random_clauses(n):
+  clauses = []
+  for i in range(n):
+    clause = random.sample(range(1, 1000), random.randint(1, 6))
+    clauses.append([-v if random.randint(0, 1) else v for v in clause])
+  return clauses
+
+def test_dimacs_sink(num_tests):
+  print("Testing DimacsSink... ", end="")
+  tmpdir = tempfile.mkdtemp()
+  for i in range(num_tests):
+    clauses = random_clauses(random.randint(1, 2000))
+    num_vars = max(abs(x) for clause in clauses for x in clause)
+    for ext in ["cnf", "cnf.gz", "cnf.xz"]:
+      fname = os.path.join(tmpdir, "test." + ext)
+      store = ClauseStore(DimacsSink(fname), flush_size = random.randint(1, 500))
+      store.add_clauses(clauses)
+      store.close()
+      assert(read_dimacs(fname) == (num_vars, clauses, []))
+    xors = random_clauses(random.randint(1, 200))
+    fname = os.path.join(tmpdir, "test_xor.cnf")
+    store = ClauseStore(DimacsSink(fname), flush_size = random.randint(1, 500))
+    store.add_clauses(clauses)
+    for lits in xors:
+      store.add_xor(lits)
+    store.close()
+    assert(read_dimacs(fname) == (max(num_vars, max(abs(x) for lits in xors for x in lits)), clauses, xors))
+    out = Unseekable()
+    store = ClauseStore(out, flush_size = 100)
+    store.add_clauses(clauses)
+    store.close(num_vars + 5)
+    header, body = out.buf.getvalue().split("\n", 1)
+    assert(header == "p cnf {0} {1}".format(num_vars + 5, len(clauses)))
+    assert(body == dimacs_lines(store_lits(clauses)))
+    # XOR constraints cannot go to a plain callable
+    chunks = []
+    try:
+      ClauseStore(chunks.append, xor = True)
+      assert(False)
+    except ValueError as e:
+      assert("xor_callback" in str(e))
+    store = ClauseStore(CallbackSink(chunks.append, chunks.append), flush_size = 100, xor = True)
+    store.add_clauses(clauses)
+    for lits in xors:
+      store.add_xor(lits)
+    store.close()
+    assert(sum(chunk.count(0) for chunk in chunks) == len(clauses) + len(xors))
+  print("OK")
+
+def store_lits(clauses):
+  store = ClauseStore()
+  store.add_clauses(clauses)
+  return store.lits
+
+def test_streamed_feal(num_tests):
+  print("Testing streamed FEAL_NX... ", end="")
+  for i in range(num_tests):
+    N = 2 * random.randint(1, 8)
+    nfv, res = FEAL_NX(N).setup()
+    chunks = []
+    store = ClauseStore(chunks.append, flush_size = random.randint(1, 5000))
+    nfv2, res2 = FEAL_NX(N).setup(store)
+    store.close()
+    assert(nfv == nfv2)
+    assert(len(res.cnf) == len(res2.cnf) == len(store))
+    assert(res.out_vars == res2.out_vars)
+    flat = array('i')
+    for chunk in chunks:
+      flat += chunk
+    assert(flat == res.cnf.buffer())
+  print("OK")
+
+if __name__ == "__main__":
+  if len(sys.argv) != 2:
+    print("Usage: python3 test_dimacs.py <num_tests>")
+    exit()
+  num_tests = int(sys.argv[1])
+
+  test_dimacs_sink(num_tests)
+  test_streamed_feal(num_tests)
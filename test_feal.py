@@ -1,118 +1,128 @@
 from feal import *
+from cnf_cache import CNF_CACHE_DIR, cached_setup
+from testvec import bits_to_bytes, dot, group_by_key, unpack_bits
+import multiprocessing
+import os
 import sys
 
-hex2bits = {'0' : (0,0,0,0),
-            '1' : (0,0,0,1),
-            '2' : (0,0,1,0),
-            '3' : (0,0,1,1),
-            '4' : (0,1,0,0),
-            '5' : (0,1,0,1),
-            '6' : (0,1,1,0),
-            '7' : (0,1,1,1),
-            '8' : (1,0,0,0),
-            '9' : (1,0,0,1),
-            'A' : (1,0,1,0),
-            'B' : (1,0,1,1),
-            'C' : (1,1,0,0),
-            'D' : (1,1,0,1),
-            'E' : (1,1,1,0),
-            'F' : (1,1,1,1)}
-bits2hex = {v : k for k,v in hex2bits.items()}
-
-def hex_block_to_bits(hex_block):
-  hex_block = hex_block.replace(" ", "").upper()
-  bits = []
-  for h in hex_block:
-    bits += hex2bits[h]
-  return bits
-
-def bits_to_hex_block(bits):
-  assert(len(bits) % 4 == 0)
-  h = ""
-  for i in range(len(bits) // 4):
-    h += bits2hex[tuple(bits[i*4 : i*4 + 4])]
-  return h
-
-def dot(bits, variables):
-  assert(len(bits) == len(variables))
-  n = len(bits)
-  lits = []
-  for i in range(n):
-    b = bits[i]
-    v = variables[i]
-    if b == 0:
-      lits.append(-v)
-    else:
-      lits.append(v)
-  return lits
-
+# variables may be literals or constants (e.g. with a known key)
 def extract_bits(assignment, variables):
   bits = []
   for v in variables:
-    if assignment[v] > 0:
+    if lit_value(assignment, v):
       bits.append(1)
     else:
       bits.append(0)
   return bits
 
-def parse_test_vecs(fname):
-  num_tests = 0
-  tests = []
-  test_key = None
-  with open(fname, 'r') as fin:
-    for line in fin:
-      if len(line) >= 3 and line[:3] == "KEY":
-        num_tests += 1
-        if test_key != None:
-          tests.append([test_key, test_vecs])
-        line = line.split()
-        assert(line[0] == "KEY")
-        test_key = line[2]
-        test_vecs = []
-      elif len(line) >= 2 and line[:2] == "PT":
-        line = [x.split(':') for x in line[:-1].split(',')]
-        pt_line = [x.replace(" ", "") for x in line[0]]
-        ct_line = [x.replace(" ", "") for x in line[1]]
-        assert(pt_line[0] == "PT")
-        assert(ct_line[0] == "CT")
-        test_vecs.append((pt_line[1], ct_line[1]))
-  tests.append([test_key, test_vecs])
-  assert(len(tests) == num_tests)
-  return tests
+#
+# Workers: each process loads the CNF once (through the cnf_cache.py cache) and keeps one warm solver
+# With known_key, the workers instead build FEAL_NX(N, key) (round keys as constants) for each key they get
+#
+worker = dict()
 
-def main(verbose):
-  tests = parse_test_vecs("feal.tv")
-  N = 32
-  feal = FEAL_NX(N)
-  nfv, res = feal.setup()
+def init_worker(N, cache_dir, known_key = False):
+  worker["N"] = N
+  worker["known_key"] = known_key
+  worker["key"] = None
+  if not known_key:
+    nfv, res = cached_setup(FEAL_NX(N), cache_dir)
+    load_solver(res)
+
+def load_solver(res):
   s = Solver()
-  s.add_clauses(res.cnf)
+  s.add_clauses(res.cnf.buffer())
+  worker["res"] = res
+  worker["solver"] = s
 
-  print("Number of keys tested in test vectors (tv) file:", len(tests))
+'''
+Solve one chunk (test_key, [(pt, ct)...]) on the worker's solver, all blocks as bytes
+Returns (test_key, [(pt, expected ct, computed ct)...])
+'''
+def run_chunk(chunk):
+  test_key, test_vecs = chunk
+  if worker["known_key"] and worker["key"] != test_key:
+    nfv, res = FEAL_NX(worker["N"], test_key).setup()
+    load_solver(res)
+    worker["key"] = test_key
+  res = worker["res"]
+  s = worker["solver"]
+  key_ass = [] if worker["known_key"] else dot(unpack_bits(test_key), res.in_vars[:128])
+  results = []
+  for pt, ct in test_vecs:
+    sat, soln = s.solve(key_ass + dot(unpack_bits(pt), res.in_vars[-64:]))
+    assert(sat)
+    results.append((pt, ct, bits_to_bytes(extract_bits(soln, res.out_vars))))
+  return test_key, results
+
+'''
+Split the test vectors by key, and each key's vectors into chunks of chunk_size (None = whole key)
+'''
+def make_chunks(tests, chunk_size = None):
+  chunks = []
   for test_key, test_vecs in tests:
-    print("Testing with key {0}".format(test_key))
-    init_keys = hex_block_to_bits(test_key)
-    for pt, ct in test_vecs:
-      if verbose:
-        print("Key {0}, PT {1} -> CT {2}".format(test_key, pt, ct), end="")
-      plaintext = hex_block_to_bits(pt)
-      ass = dot(init_keys, res.in_vars[:128]) + dot(plaintext, res.in_vars[128:])
-      sat, soln = s.solve(ass)
-      ciphertext = extract_bits(soln, res.out_vars)
-      if verbose:
-        print(" = {0} -> ".format(bits_to_hex_block(ciphertext)), end="")
-      assert(bits_to_hex_block(ciphertext) == ct)
+    size = len(test_vecs) if chunk_size is None else chunk_size
+    for i in range(0, len(test_vecs), size):
+      chunks.append((test_key, test_vecs[i:i+size]))
+  return chunks
+
+'''
+Run the chunks on num_workers processes (1 = in this process), yielding the results in chunk order
+'''
+def run_chunks(chunks, N, num_workers, cache_dir = CNF_CACHE_DIR, known_key = False):
+  # Build the cache file once, so the workers only map it
+  if not known_key:
+    cached_setup(FEAL_NX(N), cache_dir)
+  if num_workers == 1:
+    init_worker(N, cache_dir, known_key)
+    for chunk in chunks:
+      yield run_chunk(chunk)
+    return
+  with multiprocessing.Pool(num_workers, initializer = init_worker, initargs = (N, cache_dir, known_key)) as pool:
+    for result in pool.imap(run_chunk, chunks):
+      yield result
+
+def main(verbose, num_workers = 1, chunk_size = None, fail_fast = False, known_key = False):
+  tests = group_by_key("feal.tv")
+  N = 32
+
+  print("Number of keys tested in test vectors (tv) file:", len(tests))
+  failures = 0
+  last_key = None
+  for test_key, results in run_chunks(make_chunks(tests, chunk_size), N, num_workers, known_key = known_key):
+    key_hex = test_key.hex().upper()
+    if test_key != last_key:
+      print("Testing with key {0}".format(key_hex))
+      last_key = test_key
+    for pt, ct, computed in results:
+      pt_hex, ct_hex, computed_hex = pt.hex().upper(), ct.hex().upper(), computed.hex().upper()
       if verbose:
-        print("OK")
+        print("Key {0}, PT {1} -> CT {2} = {3} -> {4}".format(key_hex, pt_hex, ct_hex, computed_hex, "OK" if computed == ct else "FAIL"))
+      if computed != ct:
+        failures += 1
+        print("FAIL: key {0}, PT {1}: expected CT {2}, got {3}".format(key_hex, pt_hex, ct_hex, computed_hex))
+        if fail_fast:
+          break
+    if fail_fast and failures > 0:
+      break
+  assert(failures == 0)
   print("All OK")
 
 if __name__ == "__main__":
-  if len(sys.argv) != 2:
-    print("Usage: python3 test_feal.py <verbose>")
+  if len(sys.argv) < 2 or len(sys.argv) > 6:
+    print("Usage: python3 test_feal.py <verbose> [<num_workers> [<chunk_size> [<fail_fast> [<known_key>]]]]")
     print("verbose = 1 : Print every single test vector")
     print("verbose = 0 : Shh...")
+    print("num_workers : Number of worker processes, 0 = one per CPU (default 1)")
+    print("chunk_size  : Test vectors per work item, 0 = all vectors of a key (default 0)")
+    print("fail_fast   : 1 = stop at the first failing vector (default 0)")
+    print("known_key   : 1 = build the CNF per key with the round keys as constants (default 0)")
     exit()
 
   verbose = int(sys.argv[1]) == 1
-  main(verbose)  
-
+  num_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+  chunk_size = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+  fail_fast = int(sys.argv[4]) == 1 if len(sys.argv) > 4 else False
+  known_key = int(sys.argv[5]) == 1 if len(sys.argv) > 5 else False
+  main(verbose, num_workers if num_workers > 0 else os.cpu_count(), chunk_size if chunk_size > 0 else None, fail_fast,
+       known_key)
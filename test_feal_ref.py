@@ -0,0 +1,178 @@
+from feal import *
+from feal_ref import *
+from testvec import dot, iter_test_vectors, unpack_bits
+import os
+import random
+import sys
+import tempfile
+
+def test_feal_tv():
+  print("Testing reference FEAL_NX(32) on feal.tv... ", end="")
+  assert(check_test_vectors("feal.tv", 32) == [])
+  print("OK")
+
+def test_against_cnf(num_tests):
+  print("Testing reference FEAL_NX against the CNF... ", end="")
+  for i in range(num_tests):
+    N = 2 * random.randint(1, 16)
+    nfv, res = FEAL_NX(N).setup()
+    s = Solver()
+    s.add_clauses(res.cnf.buffer())
+    keys = [os.urandom(16) for j in range(8)]
+    plaintexts = [os.urandom(8) for j in range(8)]
+    ciphertexts = encrypt(N, keys, plaintexts)
+    for key, pt, ct in zip(keys, plaintexts, ciphertexts):
+      sat, soln = s.solve(dot(unpack_bits(key), res.in_vars[:128]) + dot(unpack_bits(pt), res.in_vars[128:]))
+      assert(sat)
+      assert([1 if lit_value(soln, x) else 0 for x in res.out_vars] == list(unpack_bits(ct)))
+    # One key for the whole batch gives the same as repeating it per block
+    assert(encrypt(N, keys[0], plaintexts) == encrypt(N, [keys[0]] * len(plaintexts), plaintexts))
+  print("OK")
+
+def test_setup_multi(num_tests):
+  print("Testing FEAL_NX.setup_multi against the reference... ", end="")
+  for i in range(num_tests):
+    N = 2 * random.randint(1, 16)
+    num_pairs = random.randint(1, 4)
+    store = ClauseStore()
+    nfv, res, pairs = FEAL_NX(N).setup_multi(num_pairs, store)
+    assert(len(res.in_vars) == 128 + 64*num_pairs and len(res.out_vars) == 64*num_pairs)
+    assert(all(pair.in_vars[:128] == res.in_vars[:128] for pair in pairs))
+    # One key schedule: every pair after the first costs less than a whole cipher
+    single = ClauseStore()
+    FEAL_NX(N).setup(single)
+    assert(len(store) == len(single) + (num_pairs-1) * len(pairs[0].cnf))
+    assert(len(pairs[0].cnf) < len(single))
+
+    s = Solver()
+    s.add_clauses(res.cnf.buffer())
+    key = os.urandom(16)
+    plaintexts = [os.urandom(8) for j in range(num_pairs)]
+    ass = dot(unpack_bits(key), res.in_vars[:128])
+    for pair, pt in zip(pairs, plaintexts):
+      ass += dot(unpack_bits(pt), pair.in_vars[128:])
+    sat, soln = s.solve(ass)
+    assert(sat)
+    for pair, ct in zip(pairs, encrypt(N, key, plaintexts)):
+      assert([1 if lit_value(soln, x) else 0 for x in pair.out_vars] == list(unpack_bits(ct)))
+  print("OK")
+
+def test_extend(num_tests):
+  print("Testing FEAL_NX.extend against the reference... ", end="")
+  for i in range(num_tests):
+    num_pairs = random.randint(1, 2)
+    N = 2 * random.randint(1, 4)
+    store = ClauseStore(xor = random.choice([False, True]))
+    cipher = FEAL_NX(N)
+    nfv, res, pairs = cipher.setup_multi(num_pairs, store)
+    s = Solver()
+    add_to_solver(s, res.cnf)
+    key = os.urandom(16)
+    plaintexts = [os.urandom(8) for j in range(num_pairs)]
+    ass = dot(unpack_bits(key), res.in_vars[:128])
+    for pair, pt in zip(pairs, plaintexts):
+      ass += dot(unpack_bits(pt), pair.in_vars[128:])
+    for step in range(3):
+      if step > 0:
+        rounds = 2 * random.randint(1, 3)
+        N += rounds
+        nfv, res, pairs = cipher.extend(nfv, rounds, store)
+        # Only the new clauses go to the solver
+        add_to_solver(s, res.cnf)
+      assert(cipher.N == N and len(cipher.keys) == N + 8)
+      sat, soln = s.solve(ass)
+      assert(sat)
+      for pair, ct in zip(pairs, encrypt(N, key, plaintexts)):
+        assert([1 if lit_value(soln, x) else 0 for x in pair.out_vars] == list(unpack_bits(ct)))
+  print("OK")
+
+def test_known_key(num_tests):
+  print("Testing FEAL_NX with a known key against the reference... ", end="")
+  for i in range(num_tests):
+    N = 2 * random.randint(1, 16)
+    key = os.urandom(16)
+    options = dict(xor = random.choice([False, True]), adder = random.choice(ADDER_ENCODINGS))
+    store = ClauseStore(**options)
+    cipher = FEAL_NX(N, key)
+    nfv, res, pairs = cipher.setup_multi(2, store)
+    assert(res.in_vars == list(range(1, 129)))
+    # No key schedule, and the round keys fold into the data path
+    symbolic = ClauseStore(**options)
+    FEAL_NX(N).setup_multi(2, symbolic)
+    assert(len(store) + store.num_xors() < len(symbolic) + symbolic.num_xors())
+    if random.randint(0, 1):
+      rounds = 2 * random.randint(1, 3)
+      N += rounds
+      nfv, new_res, pairs = cipher.extend(nfv, rounds, store)
+    s = Solver()
+    add_to_solver(s, store.view())
+    plaintexts = [os.urandom(8) for j in range(2)]
+    ass = []
+    for pair, pt in zip(pairs, plaintexts):
+      assert(len(pair.in_vars) == 64)
+      ass += dot(unpack_bits(pt), pair.in_vars)
+    sat, soln = s.solve(ass)
+    assert(sat)
+    for pair, ct in zip(pairs, encrypt(N, key, plaintexts)):
+      assert([1 if lit_value(soln, x) else 0 for x in pair.out_vars] == list(unpack_bits(ct)))
+  print("OK")
+
+def test_setup_cone(num_tests):
+  print("Testing FEAL_NX.setup_cone against the reference... ", end="")
+  for i in range(num_tests):
+    N = 2 * random.randint(1, 4)
+    byte = random.randrange(8)
+    store = ClauseStore(xor = random.choice([False, True]), adder = random.choice(ADDER_ENCODINGS))
+    nfv, res = FEAL_NX(N).setup_cone(lambda c: c.ciphertext[8*byte:8*byte+8], store)
+    full = ClauseStore(**store.options())
+    FEAL_NX(N).setup(full)
+    assert(len(store) + store.num_xors() < len(full) + full.num_xors())
+    s = Solver()
+    add_to_solver(s, store.view())
+    key = os.urandom(16)
+    pt = os.urandom(8)
+    sat, soln = s.solve(dot(unpack_bits(key), res.in_vars[:128]) + dot(unpack_bits(pt), res.in_vars[128:]))
+    assert(sat)
+    ct = encrypt(N, key, [pt])[0]
+    assert([1 if lit_value(soln, x) else 0 for x in res.out_vars] == list(unpack_bits(ct))[8*byte:8*byte+8])
+
+    # Polarity aware: the ciphertext literals are only required true
+    wrong = bytes([ct[0] ^ (1 << random.randrange(8))]) + ct[1:]
+    options = dict(adder = random.choice(ADDER_ENCODINGS))
+    for block, sat in [(ct, True), (wrong, False)]:
+      store = ClauseStore(**options)
+      nfv, res = FEAL_NX(N).setup_cone(lambda c: dot(unpack_bits(block), c.ciphertext), store, polarity = True)
+      s = Solver()
+      add_to_solver(s, store.view())
+      ass = dot(unpack_bits(key), res.in_vars[:128]) + dot(unpack_bits(pt), res.in_vars[128:])
+      assert(s.solve(ass + res.out_vars)[0] == sat)
+  print("OK")
+
+def test_write_test_vectors(num_tests):
+  print("Testing write_test_vectors... ", end="")
+  fname = os.path.join(tempfile.mkdtemp(), "test.tv")
+  for i in range(num_tests):
+    N = 2 * random.randint(1, 16)
+    keys = [os.urandom(16) for j in range(random.randint(1, 4))]
+    plaintexts = [os.urandom(8) for j in range(random.randint(1, 100))]
+    write_test_vectors(fname, N, keys, plaintexts, newline = random.choice(["\n", "\r\n"]))
+    vectors = list(iter_test_vectors(fname))
+    assert([(key, pt) for key, pt, ct in vectors] == [(key, pt) for key in keys for pt in plaintexts])
+    assert(check_test_vectors(fname, N) == [])
+    if N > 2:
+      assert(len(check_test_vectors(fname, N - 2)) > 0)
+  print("OK")
+
+if __name__ == "__main__":
+  if len(sys.argv) != 2:
+    print("Usage: python3 test_feal_ref.py <num_tests>")
+    exit()
+  num_tests = int(sys.argv[1])
+
+  test_feal_tv()
+  test_against_cnf(num_tests)
+  test_setup_multi(num_tests)
+  test_extend(num_tests)
+  test_known_key(num_tests)
+  test_setup_cone(num_tests)
+  test_write_test_vectors(num_tests)
@@ -0,0 +1,185 @@
+from feal import *
+from feal_ref import encrypt_buffer
+from netlist import *
+from testvec import unpack_bits
+import os
+import random
+import sys
+
+def random_options():
+  return dict(alias = random.choice([False, True]),
+              xor = random.choice([False, True]),
+              adder = random.choice(ADDER_ENCODINGS),
+              adder_slice = random.randint(1, 4),
+              strash = random.choice([False, True]),
+              netlist = True)
+
+'''
+A random mix of building blocks over 8 bit words, some bits constant
+'''
+def random_circuit(store, inputs):
+  nfv = max(inputs) + 1
+  pool = [list(inputs[i:i+8]) for i in range(0, len(inputs), 8)]
+  for w in pool:
+    for j in range(8):
+      if random.randint(0, 5) == 0:
+        w[j] = random.choice([True, False])
+  for step in range(6):
+    x = random.choice(pool)
+    y = random.choice(pool)
+    r = random.randint(0, 5)
+    if r == 0:
+      nfv, res = word_xor(nfv, x, y, store)
+    elif r == 1:
+      nfv, res = modular_addition(nfv, 8, x, y, store)
+    elif r == 2:
+      nfv, res = rotate_left_by_k(nfv, 8, x, random.randint(0, 7), store)
+    elif r == 3:
+      outs = []
+      for j in range(8):
+        gate = random.choice([bit_and, bit_or, bit_xor])
+        nfv, res = gate(nfv, x[j], neg(y[j]) if random.randint(0, 1) else y[j], store)
+        outs += res.out_vars
+      res = Result(x + y, outs, None)
+    elif r == 4:
+      nfv, res = boolean_function(nfv, x[:4], [random.randint(0, 3) for v in range(16)], 2, store, cache_dir = None)
+      res = Result(x, res.out_vars + x[2:], None)
+    else:
+      nfv, res = create_constant_vec(nfv, [random.randint(0, 1) for j in range(8)], store)
+    pool.append(res.out_vars)
+  return nfv
+
+def test_random_circuits(num_tests):
+  print("Testing netlist evaluation on random circuits... ", end="")
+  num_lanes = 64
+  mask = (1 << num_lanes) - 1
+  for i in range(num_tests):
+    store = ClauseStore(**random_options())
+    inputs = list(range(1, 33))
+    nfv = random_circuit(store, inputs)
+    words = {v : random.getrandbits(num_lanes) for v in inputs}
+    values = evaluate(store.netlist, words, num_lanes)
+    assert(satisfied_lanes(values, store.view(), num_lanes) == mask)
+    # Every variable is defined by a gate or is an input
+    assert(set(store.netlist.outs) | set(inputs) >= set(abs(x) for x in store.lits if x != 0))
+    assert(set(store.netlist.inputs()) <= set(inputs))
+    # A single wrong gate output is caught by the clauses in the lanes it changes
+    if len(store.netlist) > 0:
+      v = random.choice(store.netlist.outs)
+      if any(abs(x) == v for x in store.lits):
+        flip = random.getrandbits(num_lanes) | 1
+        values[v] ^= flip
+        assert(satisfied_lanes(values, store.view(), num_lanes) & flip != flip)
+  print("OK")
+
+def test_slice_cone(num_tests):
+  print("Testing slice_cone on random circuits... ", end="")
+  num_lanes = 64
+  mask = (1 << num_lanes) - 1
+  for i in range(num_tests):
+    options = random_options()
+    store = ClauseStore(**options)
+    inputs = list(range(1, 33))
+    nfv = random_circuit(store, inputs)
+    if len(store.netlist) == 0:
+      continue
+    lits = [random.choice([1, -1]) * random.choice(store.netlist.outs) for j in range(random.randint(1, 4))]
+    sliced = ClauseStore(**options)
+    res = slice_cone(store, lits, sliced)
+    keep = cone(store.netlist, lits)
+    assert(set(res.in_vars) <= set(inputs) and set(res.in_vars) <= keep)
+    assert(all(abs(x) in keep for clause in res.cnf for x in clause))
+    assert(set(map(tuple, res.cnf)) <= set(map(tuple, store.view())))
+    assert(len(sliced.netlist) == len([v for v in store.netlist.outs if v in keep]))
+    # The gate values satisfy the slice, and the slice pins the targets given the cone's inputs
+    words = {v : random.getrandbits(num_lanes) for v in inputs}
+    values = evaluate(store.netlist, words, num_lanes)
+    assert(satisfied_lanes(values, sliced.view(), num_lanes) == mask)
+    s = Solver()
+    add_to_solver(s, sliced.view())
+    s.add_clauses([[v, -v] for v in res.in_vars])
+    lane = random.randrange(num_lanes)
+    sat, soln = s.solve([v if (words[v] >> lane) & 1 else -v for v in res.in_vars])
+    assert(sat)
+    for x in lits:
+      assert(lit_value(soln, x) == ((lit_word(values, x, mask) >> lane) & 1 == 1))
+      sat, other = s.solve([v if (words[v] >> lane) & 1 else -v for v in res.in_vars] + [-x if lit_value(soln, x) else x])
+      assert(not sat)
+  print("OK")
+
+def test_polarity(num_tests):
+  print("Testing slice_cone with polarity on random circuits... ", end="")
+  num_lanes = 16
+  mask = (1 << num_lanes) - 1
+  # AND/OR only: every gate is needed with one polarity, so part of its clauses go
+  store = ClauseStore(netlist = True)
+  nfv, a = bit_and(4, 1, 2, store)
+  nfv, b = bit_or(nfv, a.out_vars[0], -3, store)
+  res = slice_cone(store, [-b.out_vars[0]], ClauseStore(), polarity = True)
+  assert(len(res.cnf) < len(store))
+  for i in range(num_tests):
+    options = random_options()
+    store = ClauseStore(**options)
+    inputs = list(range(1, 33))
+    nfv = random_circuit(store, inputs)
+    if len(store.netlist) == 0:
+      continue
+    lits = [random.choice([1, -1]) * random.choice(store.netlist.outs) for j in range(random.randint(1, 4))]
+    res = slice_cone(store, lits, ClauseStore(), polarity = True)
+    assert(len(res.cnf) <= len(slice_cone(store, lits).cnf))
+    # Satisfiable for fixed inputs exactly in the lanes where the circuit makes every literal true
+    words = {v : random.getrandbits(num_lanes) for v in inputs}
+    values = evaluate(store.netlist, words, num_lanes)
+    assert(satisfied_lanes(values, res.cnf, num_lanes) == mask)
+    ok = mask
+    for x in lits:
+      ok &= lit_word(values, x, mask)
+    s = Solver()
+    add_to_solver(s, res.cnf)
+    s.add_clauses([[v, -v] for v in res.in_vars + [abs(x) for x in lits]])
+    for lane in range(num_lanes):
+      sat, soln = s.solve([v if (words[v] >> lane) & 1 else -v for v in res.in_vars] + lits)
+      assert(sat == ((ok >> lane) & 1 == 1))
+  print("OK")
+
+def test_feal_netlist(num_tests):
+  print("Testing FEAL_NX netlist against the reference... ", end="")
+  for i in range(num_tests):
+    N = 2 * random.randint(1, 16)
+    store = ClauseStore(**random_options())
+    nfv, res = FEAL_NX(N).setup(store)
+    num_lanes = random.randint(1, 300)
+    keys = os.urandom(16 * num_lanes)
+    plaintexts = os.urandom(8 * num_lanes)
+    rows = [list(unpack_bits(keys[16*j:16*j+16]) + unpack_bits(plaintexts[8*j:8*j+8])) for j in range(num_lanes)]
+    values = evaluate(store.netlist, dict(zip(res.in_vars, rows_to_words(rows))), num_lanes)
+    mask = (1 << num_lanes) - 1
+    out_words = [lit_word(values, x, mask) for x in res.out_vars]
+    ciphertexts = encrypt_buffer(N, keys, plaintexts)
+    assert(words_to_rows(out_words, num_lanes) == [list(unpack_bits(ciphertexts[8*j:8*j+8])) for j in range(num_lanes)])
+    assert(satisfied_lanes(values, store.view(), num_lanes) == mask)
+
+    # Witness from key and plaintext: every variable, and the solver accepts it as is
+    assignment = {v : rows[0][j] == 1 for j, v in enumerate(res.in_vars)}
+    lits = witness(store.netlist, assignment)
+    assert(len(lits) == len(set(map(abs, lits))))
+    s = Solver()
+    add_to_solver(s, store.view())
+    sat, soln = s.solve(lits)
+    assert(sat)
+    # Partial: key only gives the key schedule but no round output
+    partial = witness(store.netlist, {v : assignment[v] for v in res.in_vars[:128]})
+    assert(set(partial) < set(lits))
+    assert(all(abs(x) not in set(map(abs, partial)) for x in res.out_vars if not is_const(x)))
+  print("OK")
+
+if __name__ == "__main__":
+  if len(sys.argv) != 2:
+    print("Usage: python3 test_netlist.py <num_tests>")
+    exit()
+  num_tests = int(sys.argv[1])
+
+  test_random_circuits(num_tests)
+  test_slice_cone(num_tests)
+  test_polarity(num_tests)
+  test_feal_netlist(num_tests)
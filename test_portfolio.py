@@ -0,0 +1,50 @@
+from portfolio import *
+import random
+import sys
+import tempfile
+
+def test_portfolio(num_tests):
+  print("Testing portfolio... ", end="")
+  log = os.path.join(tempfile.mkdtemp(), "portfolio.jsonl")
+  wins = Counter()
+  for i in range(num_tests):
+    N = 2
+    pairs = feal_ref.random_pairs(N, os.urandom(16), 4)
+    configs = random.sample(DEFAULT_CONFIGS, random.randint(1, 3))
+    race = portfolio(N, pairs, configs, num_workers = random.choice([None, 1]), log = log)
+    assert(race["status"] == "sat" and race["winner"] in [config["name"] for config in configs])
+    assert(feal_ref.encrypt(N, race["key"], [pt for pt, ct in pairs]) == [ct for pt, ct in pairs])
+    assert(race["results"][-1]["name"] == race["winner"])
+    wins[race["winner"]] += 1
+  assert(win_counts(log) == wins and win_counts(log, 4) == Counter())
+
+  # Out of time: no winner, and the log still gets the race
+  pairs = feal_ref.random_pairs(8, os.urandom(16), 2)
+  race = portfolio(8, pairs, DEFAULT_CONFIGS[:2], time_limit = 0.5, log = log)
+  assert(race["winner"] is None and race["status"] == "timeout" and race["key"] is None)
+  assert(all(r["status"] == "timeout" for r in race["results"]))
+  with open(log) as f:
+    records = [json.loads(line) for line in f]
+  assert(len(records) == num_tests + 1 and records[-1]["winner"] is None)
+
+  # A configuration that raises is logged as an error, and the others still race
+  broken = dict(name = "broken", options = dict(adder = "no such adder"))
+  pairs = feal_ref.random_pairs(2, os.urandom(16), 4)
+  race = portfolio(2, pairs, [broken, DEFAULT_CONFIGS[0]], num_workers = 1, log = log)
+  assert(race["status"] == "sat" and race["winner"] == DEFAULT_CONFIGS[0]["name"])
+  assert(race["results"][0]["name"] == "broken" and race["results"][0]["status"] == "error")
+  race = portfolio(2, pairs, [broken], log = log)
+  assert(race["winner"] is None and race["status"] == "error" and race["key"] is None)
+  with open(log) as f:
+    records = [json.loads(line) for line in f]
+  assert(len(records) == num_tests + 3 and records[-1]["status"] == "error")
+  assert(records[-1]["results"][0]["error"].startswith("AssertionError"))
+  print("OK")
+
+if __name__ == "__main__":
+  if len(sys.argv) != 2:
+    print("Usage: python3 test_portfolio.py <num_tests>")
+    exit()
+  num_tests = int(sys.argv[1])
+
+  test_portfolio(num_tests)
@@ -0,0 +1,59 @@
+from feal import *
+import cnf_base
+import feal
+from profiler import *
+import random
+import sys
+
+def test_profiler(num_tests):
+  print("Testing Profiler... ", end="")
+  originals = {name : getattr(cnf_base, name) for name in ["word_xor", "modular_addition", "bit_xor", "bit_and"]}
+  original_f = FEAL_NX.f
+  for i in range(num_tests):
+    N = random.choice([2, 4, 8, 16])
+    options = dict(xor = random.choice([False, True]), adder = random.choice(ADDER_ENCODINGS),
+                   alias = random.choice([False, True]))
+    targets = WORD_TARGETS + (BIT_TARGETS if random.choice([False, True]) else [])
+    store = ClauseStore(**options)
+    with Profiler(targets, memory = random.choice([False, True])) as prof:
+      nfv, res = FEAL_NX(N).setup(store)
+
+    # Same CNF as without the profiler, and the totals add up to it
+    plain = ClauseStore(**options)
+    plain_nfv, plain_res = FEAL_NX(N).setup(plain)
+    assert(nfv == plain_nfv and store.lits == plain.lits and store.xors.lits == plain.xors.lits)
+    root = prof.totals()
+    assert(root.vars == nfv-1 and root.clauses == len(store) and root.xors == store.num_xors())
+    assert(root.literals == store.num_literals() + store.xors.num_literals())
+    setup = root.children["FEAL_NX.setup"]
+    assert(setup.calls == 1 and setup.children["FEAL_NX.setup_multi"].clauses == len(store))
+    rounds = setup.children["FEAL_NX.setup_multi"].children["FEAL_NX.encrypt_pairs"].children["FEAL_NX.one_round"]
+    assert(rounds.calls == N)
+
+    # Nothing stays wrapped
+    for name, fn in originals.items():
+      assert(getattr(cnf_base, name) is fn and getattr(feal, name) is fn)
+    assert(FEAL_NX.f is original_f)
+
+    # Exports
+    tree = json.loads(json.dumps(prof.to_json()))
+    assert(tree["name"] == "root" and tree["clauses"] == len(store))
+    for metric in ["seconds", "vars", "clauses"]:
+      lines = prof.folded(metric)
+      assert(len(lines) > 0)
+      for line in lines:
+        stack, value = line.rsplit(" ", 1)
+        assert((stack == "root" or stack.startswith("root;FEAL_NX.setup")) and int(value) > 0)
+    if not options["xor"]:
+      # Pre- and post-processing: 96 xor gates of 4 clauses each (the other 32 bits are xors with 0)
+      assert(sum(int(line.rsplit(" ", 1)[1]) for line in prof.folded("clauses")
+                 if "FEAL_NX.preprocess" in line or "FEAL_NX.postprocess" in line) == 2*96*4)
+  print("OK")
+
+if __name__ == "__main__":
+  if len(sys.argv) != 2:
+    print("Usage: python3 test_profiler.py <num_tests>")
+    exit()
+  num_tests = int(sys.argv[1])
+
+  test_profiler(num_tests)
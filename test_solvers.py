@@ -0,0 +1,102 @@
+from array import array
+from feal import *
+import feal_ref
+from solvers import ExternalSolver, make_solver, xor_to_cnf
+from testvec import bits_to_bytes, dot, unpack_bits
+import os
+import random
+import shutil
+import subprocess
+import sys
+
+# solvers.py is a DIMACS solver binary itself; binaries found on the PATH are tested as well
+FRONT_END = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "solvers.py")]
+BINARIES = [[b] for b in ["cryptominisat5", "kissat", "cadical"] if shutil.which(b) is not None]
+
+def satisfies(soln, clauses, xors):
+  return (all(any(lit_value(soln, x) for x in c) for c in clauses) and
+          all(sum(soln[v] for v in vs) % 2 == rhs for vs, rhs in xors))
+
+def test_lazy_import():
+  print("Testing lazy solver import... ", end="")
+  code = "import feal, verify, sys; feal.FEAL_NX(2).setup(); assert('pycryptosat' not in sys.modules)"
+  assert(subprocess.call([sys.executable, "-c", code], cwd = os.path.dirname(FRONT_END[1])) == 0)
+  print("OK")
+
+def test_xor_to_cnf(num_tests):
+  print("Testing xor_to_cnf... ", end="")
+  for i in range(num_tests):
+    k = random.randint(1, 9)
+    rhs = random.choice([False, True])
+    cut = random.randint(3, 5)
+    nfv, lits = xor_to_cnf(k+1, list(range(1, k+1)), rhs, cut)
+    clauses = [[]]
+    for x in lits:
+      if x == 0:
+        clauses.append([])
+      else:
+        clauses[-1].append(x)
+    s = make_solver()
+    s.add_clauses(clauses[:-1])
+    for v in range(1 << k):
+      # Exactly the inputs with the right parity extend to a solution
+      sat, soln = s.solve(dot([(v >> j) & 1 for j in range(k)], range(1, k+1)))
+      assert(sat == (bin(v).count("1") % 2 == rhs))
+  print("OK")
+
+def test_external(num_tests):
+  print("Testing ExternalSolver... ", end="")
+  for cmd in [FRONT_END] + BINARIES:
+    for i in range(num_tests):
+      # Random instances around the threshold, with XORs either way
+      n = random.randint(5, 40)
+      clauses = [[random.choice([-1, 1]) * v for v in random.sample(range(1, n+1), 3)] for j in range(4*n)]
+      xors = [(random.sample(range(1, n+1), random.randint(1, 7)), random.choice([False, True]))
+              for j in range(random.randint(0, 3))]
+      assumptions = [random.choice([-1, 1]) * v for v in random.sample(range(1, n+1), random.randint(0, 3))]
+      native_xor = cmd[0] in ["cryptominisat5", sys.executable] and random.choice([False, True])
+      ext = ExternalSolver(cmd, native_xor = native_xor)
+      ref = make_solver()
+      flat = [x for c in clauses for x in c + [0]]
+      if random.choice([False, True]):
+        ext.add_clauses(array('i', flat))
+      else:
+        ext.add_clauses(clauses)
+      ref.add_clauses(clauses)
+      for vs, rhs in xors:
+        ext.add_xor_clause(vs, rhs)
+        ref.add_xor_clause(vs, rhs)
+      sat, soln = ext.solve(assumptions)
+      assert(sat == ref.solve(assumptions)[0])
+      if sat:
+        assert(len(soln) == n+1 and soln[0] is None)
+        assert(satisfies(soln, clauses + [[x] for x in assumptions], xors))
+
+    # FEAL_NX encryption: the model gives the ciphertext
+    N = 4
+    key = os.urandom(16)
+    pt = os.urandom(8)
+    nfv, res = FEAL_NX(N).setup(ClauseStore(xor = True))
+    ext = ExternalSolver(cmd)
+    add_to_solver(ext, res.cnf)
+    sat, soln = ext.solve(dot(unpack_bits(key) + unpack_bits(pt), res.in_vars))
+    assert(sat)
+    assert(bits_to_bytes([1 if lit_value(soln, x) else 0 for x in res.out_vars]) == feal_ref.encrypt(N, key, [pt])[0])
+
+  # Out of time: no answer
+  nfv, res = FEAL_NX(32).setup()
+  ext = ExternalSolver(FRONT_END, time_limit = 0.5)
+  ext.add_clauses(res.cnf.buffer())
+  ct = os.urandom(8)
+  assert(ext.solve(dot(unpack_bits(os.urandom(8)), res.in_vars[128:]) + dot(unpack_bits(ct), res.out_vars)) == (None, None))
+  print("OK")
+
+if __name__ == "__main__":
+  if len(sys.argv) != 2:
+    print("Usage: python3 test_solvers.py <num_tests>")
+    exit()
+  num_tests = int(sys.argv[1])
+
+  test_lazy_import()
+  test_xor_to_cnf(num_tests)
+  test_external(num_tests)
@@ -0,0 +1,51 @@
+from testvec import *
+import os
+import random
+import sys
+import tempfile
+
+def random_hex(data):
+  h = data.hex()
+  h = "".join(c.upper() if random.randint(0, 1) else c for c in h)
+  if random.randint(0, 1):
+    h = " ".join(h[i:i+2] for i in range(0, len(h), 2))
+  return h
+
+def test_read_test_vectors(num_tests):
+  print("Testing testvec... ", end="")
+  tmpdir = tempfile.mkdtemp()
+  fname = os.path.join(tmpdir, "test.tv")
+  for i in range(num_tests):
+    vectors = []
+    lines = []
+    for k in range(random.randint(1, 5)):
+      key = os.urandom(16)
+      lines.append("KEY = " + random_hex(key))
+      for j in range(random.randint(1, 50)):
+        pt = os.urandom(8)
+        ct = os.urandom(8)
+        vectors.append((key, pt, ct))
+        lines.append("PT: {0},  CT: {1}".format(random_hex(pt), random_hex(ct)))
+    newline = random.choice(["\n", "\r\n"])
+    with open(fname, 'w', newline = "") as fout:
+      fout.write(newline.join(lines) + newline * random.randint(0, 2))
+
+    assert(list(iter_test_vectors(fname)) == vectors)
+    groups = group_by_key(fname)
+    assert([(key, pt, ct) for key, vecs in groups for pt, ct in vecs] == vectors)
+    keys, pts, cts = load_test_vectors(fname)
+    assert(keys.width == 128 and pts.width == 64 and cts.width == 64)
+    assert(len(keys) == len(pts) == len(cts) == len(vectors))
+    for row, (key, pt, ct) in enumerate(vectors):
+      assert(bits_to_bytes(keys[row]) == key and bits_to_bytes(pts[row]) == pt and bits_to_bytes(cts[row]) == ct)
+      assert(hex_to_bits(pt.hex()) == list(pts[row]))
+      assert(bits_to_hex(cts[row]) == ct.hex().upper())
+  print("OK")
+
+if __name__ == "__main__":
+  if len(sys.argv) != 2:
+    print("Usage: python3 test_testvec.py <num_tests>")
+    exit()
+  num_tests = int(sys.argv[1])
+
+  test_read_test_vectors(num_tests)
@@ -0,0 +1,87 @@
+from test_cnf_base import reference_addition, reference_word_xor
+from verify import *
+import random
+import sys
+
+def adder(num_bits):
+  return lambda nfv, xy, store: modular_addition(nfv, num_bits, xy[:num_bits], xy[num_bits:], store)
+
+# Addition with one output bit negated
+def wrong_output(num_bits, j):
+  def build(nfv, xy, store):
+    nfv, res = adder(num_bits)(nfv, xy, store)
+    out = list(res.out_vars)
+    out[j] = neg(out[j])
+    return nfv, Result(xy, out, None)
+  return build
+
+# Addition with the clauses of one variable dropped: that output is free for some inputs
+def under_constrained(num_bits):
+  def build(nfv, xy, store):
+    scratch = ClauseStore(netlist = store.netlist is not None)
+    nfv, res = adder(num_bits)(nfv, xy, scratch)
+    v = abs(res.out_vars[0])
+    store.add_clauses([c for c in scratch.view() if v not in map(abs, c)])
+    for lits in scratch.view().xors:
+      if v not in map(abs, lits):
+        store.add_xor(lits)
+    if store.netlist is not None:
+      store.netlist = scratch.netlist
+    return nfv, Result(xy, res.out_vars, None)
+  return build
+
+# Addition that also rules out the inputs with x[0] = y[0] = 1
+def over_constrained(num_bits):
+  def build(nfv, xy, store):
+    nfv, res = adder(num_bits)(nfv, xy, store)
+    store.add_clause([-xy[0], -xy[num_bits]])
+    return nfv, res
+  return build
+
+def test_verify(num_tests):
+  print("Testing verify... ", end="")
+  for i in range(num_tests):
+    num_bits = random.choice([2, 3, 5, 8, 20, 32, 64])
+    n = 2*num_bits
+    options = dict(adder = random.choice(ADDER_ENCODINGS), xor = random.choice([False, True]))
+    assert(verify_gadget(adder(num_bits), reference_addition, n, options) is None)
+    assert(miter(adder(num_bits), reference_addition, n, options) is None)
+    assert(deterministic(adder(num_bits), n, options) is None)
+
+    # Wrong output: every check finds it, and the counterexample is real
+    j = random.randrange(num_bits)
+    cex = verify_gadget(wrong_output(num_bits, j), reference_addition, n, options)
+    assert(cex is not None and cex["outputs"] != cex["expected"])
+    x = int("".join(map(str, cex["inputs"][:num_bits])), 2)
+    y = int("".join(map(str, cex["inputs"][num_bits:])), 2)
+    assert(int("".join(map(str, cex["expected"])), 2) == (x + y) % pow(2, num_bits))
+    assert(miter(wrong_output(num_bits, j), reference_addition, n, options) is not None)
+    if num_bits <= 8:
+      assert(truth_table_check(wrong_output(num_bits, j), reference_addition, n, options) is not None)
+
+    # Free output: the miter and the self-miter see it, and so does verify_gadget at every size
+    # (the truth table check alone would not: the CNF still accepts the right outputs)
+    assert(miter(under_constrained(num_bits), reference_addition, n, options) is not None)
+    assert(verify_gadget(under_constrained(num_bits), reference_addition, n, options) is not None)
+    if num_bits <= 8:
+      assert(truth_table_check(under_constrained(num_bits), reference_addition, n, options) is None)
+    assert(deterministic(under_constrained(num_bits), n, options) is not None)
+
+    # Ruled out inputs: invisible to the miter, found by the netlist check
+    assert(miter(over_constrained(num_bits), reference_addition, n, options) is None)
+    cex = verify_gadget(over_constrained(num_bits), reference_addition, n, options)
+    assert(cex is not None and cex["inputs"][0] == cex["inputs"][num_bits] == 1)
+
+    # Word xor against the wrong reference
+    xor = lambda nfv, xy, store: word_xor(nfv, xy[:num_bits], xy[num_bits:], store)
+    assert(verify_gadget(xor, reference_word_xor, n, options) is None)
+    assert(verify_gadget(adder(num_bits), reference_word_xor, n, options) is not None)
+  print("OK")
+
+if __name__ == "__main__":
+  if len(sys.argv) != 2:
+    print("Usage: python3 test_verify.py <num_tests>")
+    exit()
+  num_tests = int(sys.argv[1])
+
+  test_verify(num_tests)
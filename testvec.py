@@ -0,0 +1,135 @@
+import mmap
+import re
+
+'''
+Reading <cipher>.tv test vector files
+
+A file is a sequence of blocks
+  KEY = <hex>
+  PT: <hex>,  CT: <hex>
+  PT: <hex>,  CT: <hex>
+  ...
+Hex blocks may contain spaces and either case, lines may end in \n or \r\n.
+The file is memory mapped and scanned with one regular expression (LINE_RE), so nothing is read line by line.
+
+Bits are most significant first (the first bit of a block is the top bit of its first byte),
+matching the variable order of res.in_vars and res.out_vars.
+'''
+
+HEX = rb"([0-9A-Fa-f ]*[0-9A-Fa-f])"
+LINE_RE = re.compile(rb"KEY\s*=\s*" + HEX + rb"|PT\s*:\s*" + HEX + rb"\s*,\s*CT\s*:\s*" + HEX)
+
+BINARY_DIGITS = bytes.maketrans(b"01", b"\x00\x01")
+
+'''
+bytes -> bytes of 0/1 bits, 8 per input byte
+Goes through one big int and its binary string, so the whole buffer is unpacked in C
+'''
+def unpack_bits(data):
+  if len(data) == 0:
+    return b""
+  return format(int.from_bytes(data, "big"), "0{0}b".format(8 * len(data))).encode().translate(BINARY_DIGITS)
+
+def hex_to_bits(hex_block):
+  return list(unpack_bits(bytes.fromhex(hex_block)))
+
+def bits_to_bytes(bits):
+  assert(len(bits) % 8 == 0)
+  return int("".join("1" if b else "0" for b in bits), 2).to_bytes(len(bits) // 8, "big") if len(bits) > 0 else b""
+
+def bits_to_hex(bits):
+  return bits_to_bytes(bits).hex().upper()
+
+'''
+Literals setting variables to bits (0/1 or False/True), e.g. as solver assumptions
+'''
+def dot(bits, variables):
+  assert(len(bits) == len(variables))
+  return [v if b else -v for b, v in zip(bits, variables)]
+
+def hex_bytes(text):
+  return bytes.fromhex(text.decode())
+
+'''
+Generator over the LINE_RE matches of the file as (key hex, plaintext hex, ciphertext hex),
+with b"" for the groups not on that line
+'''
+def scan(fname):
+  with open(fname, 'rb') as fin:
+    with mmap.mmap(fin.fileno(), 0, access = mmap.ACCESS_READ) as buf:
+      for m in LINE_RE.finditer(buf):
+        yield m.groups(b"")
+
+'''
+Generator over (key, plaintext, ciphertext) in file order, each as raw bytes
+'''
+def iter_test_vectors(fname):
+  key = None
+  for k, pt, ct in scan(fname):
+    if len(k) > 0:
+      key = hex_bytes(k)
+    else:
+      assert(key is not None)
+      yield key, hex_bytes(pt), hex_bytes(ct)
+
+'''
+Test vectors grouped by key: [(key, [(plaintext, ciphertext)...])...], as raw bytes
+'''
+def group_by_key(fname):
+  groups = []
+  for key, pt, ct in iter_test_vectors(fname):
+    if len(groups) == 0 or groups[-1][0] != key:
+      groups.append((key, []))
+    groups[-1][1].append((pt, ct))
+  return groups
+
+'''
+Row-major matrix of bits, one byte (0 or 1) per bit
+row i is data[i*width : (i+1)*width]
+'''
+class BitMatrix:
+  def __init__(self, data, width):
+    assert(len(data) % width == 0)
+    self.data = data
+    self.width = width
+
+  def __len__(self):
+    return len(self.data) // self.width
+
+  def __getitem__(self, i):
+    if i < 0:
+      i += len(self)
+    if i < 0 or i >= len(self):
+      raise IndexError("row index out of range")
+    return memoryview(self.data)[i*self.width : (i+1)*self.width]
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self[i]
+
+'''
+Load every vector of the file at once
+Returns (keys, plaintexts, ciphertexts) as BitMatrix, one row per vector
+(all keys must have the same length, and likewise all plaintexts and all ciphertexts)
+The hex of each column is joined and decoded in one go, there is no per vector decoding in Python.
+'''
+def load_test_vectors(fname):
+  keys = []
+  pts = []
+  cts = []
+  key = None
+  for k, pt, ct in scan(fname):
+    if len(k) > 0:
+      key = k
+    else:
+      assert(key is not None)
+      keys.append(key)
+      pts.append(pt)
+      cts.append(ct)
+  matrices = []
+  for column in [keys, pts, cts]:
+    data = bytes.fromhex(b"".join(column).decode())
+    assert(len(column) == 0 or len(data) % len(column) == 0)
+    width = 8 * len(data) // len(column) if len(column) > 0 else 8
+    matrices.append(BitMatrix(unpack_bits(data), width))
+  return tuple(matrices)
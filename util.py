@@ -1,2 +1 @@
-from pycryptosat import Solver
-
+from solvers import Solver
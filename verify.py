@@ -0,0 +1,145 @@
+import random
+
+from cnf_base import *
+from netlist import evaluate, lit_word, satisfied_lanes
+
+'''
+Equivalence checking of building blocks
+
+A builder is a function build(next_free_var, inputs, store) -> (next_free_var, Result) over a list of input
+variables, e.g. lambda nfv, xy, store: modular_addition(nfv, 32, xy[:32], xy[32:], store).
+Builders are checked against a reference builder (any trusted encoding of the same function, e.g. one made of
+the bit level gates) with the inputs 1..num_inputs shared and every other variable private to each side.
+
+* miter: one SAT call on (build CNF) and (reference CNF) and (some output differs).
+  UNSAT proves that no input lets the builder's CNF produce an output the reference does not.
+* deterministic: the same with two copies of the builder, so it needs no reference.
+* truth_table_check: evaluates the netlists of both sides on every input at once (netlist.py),
+  checking the outputs and that the builder's CNF accepts its own values, i.e. no input is ruled out.
+  Exhaustive, so only for small num_inputs.
+
+The two complement each other: the netlist check only sees that the builder's CNF accepts the right outputs,
+not that it forces them, while a miter cannot see inputs for which the builder's CNF is unsatisfiable.
+So verify_gadget runs both: the miter, then the netlist check on every input when num_inputs is small,
+otherwise on sample_lanes random inputs.
+Each check returns None if it passes, otherwise a counterexample dict(inputs, outputs, expected) of bit lists.
+'''
+
+TRUTH_TABLE_MAX_INPUTS = 16
+MAX_LANES = 1 << 16
+
+'''
+Build both sides into separate stores; the reference numbers its variables after the builder's
+'''
+def build_pair(build, reference, num_inputs, options, ref_options):
+  inputs = list(range(1, num_inputs+1))
+  store = ClauseStore(**options)
+  nfv, res = build(num_inputs+1, inputs, store)
+  ref_store = ClauseStore(**ref_options)
+  nfv, ref = reference(nfv, inputs, ref_store)
+  assert(len(res.out_vars) == len(ref.out_vars))
+  return nfv, inputs, store, res, ref_store, ref
+
+def solve_miter(nfv, inputs, stores, outs, ref_outs):
+  diff_store = ClauseStore()
+  # Inputs neither side uses still get a value in the solution
+  diff_store.add_clauses([[v, -v] for v in inputs])
+  nfv, diff_res = word_xor(nfv, outs, ref_outs, diff_store)
+  diff = diff_res.out_vars
+  if not any(x is True for x in diff):
+    lits = [x for x in diff if not is_const(x)]
+    if len(lits) == 0:
+      # Every output is the same literal or constant on both sides
+      return None
+    diff_store.add_clause(lits)
+  s = Solver()
+  for store in stores + [diff_store]:
+    add_to_solver(s, store.view())
+  sat, soln = s.solve()
+  if not sat:
+    return None
+  return dict(inputs = [1 if lit_value(soln, v) else 0 for v in inputs],
+              outputs = [1 if lit_value(soln, x) else 0 for x in outs],
+              expected = [1 if lit_value(soln, x) else 0 for x in ref_outs])
+
+'''
+Prove build equivalent to reference with a single SAT call (see above)
+'''
+def miter(build, reference, num_inputs, options = {}, ref_options = {}):
+  nfv, inputs, store, res, ref_store, ref = build_pair(build, reference, num_inputs, options, ref_options)
+  return solve_miter(nfv, inputs, [store, ref_store], res.out_vars, ref.out_vars)
+
+'''
+Prove that the builder's outputs are a function of its inputs: two copies, same inputs, some output differs
+'''
+def deterministic(build, num_inputs, options = {}):
+  return miter(build, build, num_inputs, options, options)
+
+'''
+Input words for lanes base .. base+num_lanes-1, lane L holding input value L (inputs[0] = most significant bit)
+num_lanes must be a power of 2 and base a multiple of it
+'''
+def exhaustive_words(inputs, base, num_lanes):
+  n = len(inputs)
+  mask = (1 << num_lanes) - 1
+  words = dict()
+  for i, v in enumerate(inputs):
+    b = n-1-i
+    period = 1 << (b+1)
+    if period <= num_lanes:
+      # 2^b zeros then 2^b ones, repeated
+      block = ((1 << (1 << b)) - 1) << (1 << b)
+      words[v] = block * (mask // ((1 << period) - 1))
+    else:
+      words[v] = mask if (base >> b) & 1 else 0
+  return words
+
+'''
+Evaluate both netlists on the given input words and compare
+Returns a counterexample for the first failing lane, or None
+'''
+def check_lanes(store, res, ref_store, ref, words, num_lanes, inputs):
+  mask = (1 << num_lanes) - 1
+  values = evaluate(store.netlist, words, num_lanes)
+  ref_values = evaluate(ref_store.netlist, words, num_lanes)
+  outs = [lit_word(values, x, mask) for x in res.out_vars]
+  expected = [lit_word(ref_values, x, mask) for x in ref.out_vars]
+  bad = mask ^ satisfied_lanes(values, store.view(), num_lanes)
+  for a, b in zip(outs, expected):
+    bad |= a ^ b
+  if bad == 0:
+    return None
+  lane = (bad & -bad).bit_length() - 1
+  bit = lambda w: (w >> lane) & 1
+  return dict(inputs = [bit(words[v]) for v in inputs],
+              outputs = [bit(w) for w in outs],
+              expected = [bit(w) for w in expected])
+
+'''
+Bit-parallel truth table check on every input (see above)
+'''
+def truth_table_check(build, reference, num_inputs, options = {}, ref_options = {}):
+  assert(num_inputs <= TRUTH_TABLE_MAX_INPUTS)
+  nfv, inputs, store, res, ref_store, ref = build_pair(build, reference, num_inputs,
+                                                       dict(options, netlist = True), dict(ref_options, netlist = True))
+  num_lanes = min(1 << num_inputs, MAX_LANES)
+  for base in range(0, 1 << num_inputs, num_lanes):
+    cex = check_lanes(store, res, ref_store, ref, exhaustive_words(inputs, base, num_lanes), num_lanes, inputs)
+    if cex is not None:
+      return cex
+  return None
+
+'''
+A miter, then the netlist check: exhaustive for small num_inputs, otherwise on sample_lanes random inputs
+(rng = random or a random.Random)
+'''
+def verify_gadget(build, reference, num_inputs, options = {}, ref_options = {}, sample_lanes = 256, rng = random):
+  cex = miter(build, reference, num_inputs, options, ref_options)
+  if cex is not None:
+    return cex
+  if num_inputs <= TRUTH_TABLE_MAX_INPUTS:
+    return truth_table_check(build, reference, num_inputs, options, ref_options)
+  nfv, inputs, store, res, ref_store, ref = build_pair(build, reference, num_inputs,
+                                                       dict(options, netlist = True), dict(ref_options, netlist = True))
+  words = {v : rng.getrandbits(sample_lanes) for v in inputs}
+  return check_lanes(store, res, ref_store, ref, words, sample_lanes, inputs)